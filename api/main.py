@@ -2,139 +2,304 @@
 """
 api/main.py – FastAPI backend v0.7
 Adds wizard route and cost endpoint.
+
+Handlers are async and never block the event loop: file, SQLite and
+broker calls run via asyncio.to_thread, and dashboard reads come from
+api.readmodel's mtime‑checked in‑memory models.
 """
 from __future__ import annotations
-import asyncio, json, csv, datetime as dt
-from pathlib import Path
+import asyncio
+import json
 from fastapi import FastAPI, HTTPException, WebSocket
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from celery.result import AsyncResult
 import core.env
 from core.celery_app import celery_app
+from core import events as ev
+from core import export as ex
+from core import jobs
+from core import ledger
+from core import llm_cache
+from core import metrics
 from core import projects as pj
+from core import revise as rv
+from core import scheduler as sc
+from api import readmodel as rm
 
-app = FastAPI(title="Novelist 2.0 API", version="0.7.0")
+app = FastAPI(title="Novelist 2.0 API", version="0.7.0")
 
 # ---------- helper ---------------------------------------------------------
-def _chapter_report(pid: str, n: int):
-    root = pj.NOVELIST_ROOT / pid
-    exists = (root / "chapters" / f"ch{n:02d}.md").exists()
-    beat_file = root / "reports" / f"ch{n:02d}.beats.json"
-    report = json.loads(beat_file.read_text()) if beat_file.exists() else None
-    return {"num": n, "exists": exists, "report": report}
+async def _send(name: str, *args):
+    task = await asyncio.to_thread(celery_app.send_task, f"worker.tasks.{name}", args=list(args))
+    return {"task_id": task.id}
 
 # ---------- root -----------------------------------------------------------
 @app.get("/", response_class=HTMLResponse, include_in_schema=False)
-def idx():
-    return "<h1>Novelist 2.0 backend v0.7 is running ✔</h1>"
+async def idx():
+    return "<h1>Novelist 2.0 backend v0.7 is running ✔</h1>"
 
 # ---------- projects -------------------------------------------------------
 @app.get("/projects")
-def list_projects():
-    return pj.list_projects()
+async def list_projects(
+    outline_status: str | None = None,
+    draft_status: str | None = None,
+    sort: str = "created_at",
+    order: str = "desc",
+    limit: int | None = None,
+    offset: int = 0,
+):
+    try:
+        return await asyncio.to_thread(
+            pj.list_projects, outline_status, draft_status, sort, order != "asc", limit, offset
+        )
+    except ValueError as e: raise HTTPException(422, str(e))
 
 @app.post("/projects")
-def create_project(payload: dict):
+async def create_project(payload: dict):
     t = payload.get("title"); a = payload.get("author", "Unknown")
     if not t: raise HTTPException(422, "title required")
-    return pj.create_project(t, a)
+    return await asyncio.to_thread(pj.create_project, t, a)
 
 @app.get("/projects/{pid}")
-def get_project(pid: str):
-    try: return pj.load_manifest(pid)
+async def get_project(pid: str):
+    try: return await rm.manifest(pid)
     except pj.ProjectError as e: raise HTTPException(404, str(e))
 
 # ---------- wizard ---------------------------------------------------------
+def _create_from_wizard(payload: dict) -> str:
+    man = pj.create_project(payload["title"], payload.get("author", "Unknown"))
+    pj.atomic_write_json(pj.NOVELIST_ROOT / man["id"] / "wizard.json", payload)
+    return man["id"]
+
 @app.post("/wizard")
-def launch_wizard(payload: dict):
+async def launch_wizard(payload: dict):
     """
     Body requires: title, author, premise, themes[], words
+    Optional: speculate – draft the first N chapters as soon as the
+    outline is ready (default SPECULATIVE_CHAPTERS).
     Stores wizard.json then launches outline task.
     """
     required = ["title", "premise", "words"]
     missing = [k for k in required if k not in payload]
     if missing: raise HTTPException(422, f"missing: {', '.join(missing)}")
 
-    man = pj.create_project(payload["title"], payload.get("author", "Unknown"))
-    pid = man["id"]
-    (pj.NOVELIST_ROOT / pid / "wizard.json").write_text(
-        json.dumps(payload, indent=2), encoding="utf-8"
-    )
-    task = celery_app.send_task(
-        "worker.tasks.generate_outline_task",
-        args=[pid, payload["premise"], payload.get("genre"), int(payload["words"])],
+    pid = await asyncio.to_thread(_create_from_wizard, payload)
+    task = await _send(
+        "generate_outline_task", pid, payload["premise"], payload.get("genre"), int(payload["words"])
     )
-    return {"project_id": pid, "task_id": task.id}
+    return {"project_id": pid, **task}
 
 # ---------- outline --------------------------------------------------------
 @app.get("/projects/{pid}/outline")
-def get_outline(pid: str):
-    p = pj.NOVELIST_ROOT / pid / "outline.json"
-    if not p.exists(): raise HTTPException(404, "outline not found")
-    return json.loads(p.read_text())
+async def get_outline(pid: str):
+    outline = await rm.outline(pid)
+    if outline is None: raise HTTPException(404, "outline not found")
+    return outline
+
+@app.put("/projects/{pid}/outline")
+async def put_outline(pid: str, outline: dict):
+    """
+    Replace the outline and redraft only what the edit touched; 409 while
+    a (non‑speculative) bulk draft is running – pause or cancel it first.
+    """
+    from core import outline as ol  # jsonschema / openai: keep them off the start‑up path
+    if await rm.outline(pid) is None: raise HTTPException(404, "outline not found")
+    try:
+        ol.validate(outline)
+    except Exception as e:  # jsonschema.ValidationError
+        raise HTTPException(422, getattr(e, "message", str(e)))
+    changes = await asyncio.to_thread(_replace_outline, pid, ol.OUTLINE_FILE, outline)
+    task = await _send("revise_outline_task", pid, changes["changed"] + changes["added"])
+    return {**changes, **task}
+
+def _replace_outline(pid: str, rel: str, outline: dict) -> dict:
+    # check, diff and write under one lock: no job starts or edit lands in between
+    with pj.project_lock(pid):
+        rec = jobs.load(pid)
+        if rec is not None and rec["status"] == "running" and rec.get("kind") != "speculative":
+            raise HTTPException(409, f"bulk draft {rec['id']} is running")
+        old = json.loads((pj.NOVELIST_ROOT / pid / rel).read_text(encoding="utf-8"))
+        spec = jobs.speculative(pid)
+        if spec is not None:  # drafts from the old outline
+            spec = jobs.set_status(pid, spec["id"], "cancelled")
+        pj.update_json(pid, rel, lambda _: outline)
+    if spec is not None:
+        _revoke(pid, spec["id"], spec)
+    return rv.diff(old, outline)
 
 # ---------- chapters -------------------------------------------------------
 @app.get("/projects/{pid}/chapters")
-def list_ch(pid: str):
-    outline = get_outline(pid)
-    return [_chapter_report(pid, c["num"]) for c in outline["chapters"]]
+async def list_ch(pid: str):
+    chapters = await rm.chapters(pid)
+    if chapters is None: raise HTTPException(404, "outline not found")
+    return chapters
 
 @app.post("/projects/{pid}/chapters/{n}")
-def gen_ch(pid: str, n: int):
-    task = celery_app.send_task("worker.tasks.generate_chapter_task", args=[pid, n])
-    return {"task_id": task.id}
+async def gen_ch(pid: str, n: int, force: bool = False):
+    return await _send("generate_chapter_task", pid, n, force)
 
 @app.post("/projects/{pid}/chapters/{n}/regenerate")
-def regen_ch(pid: str, n: int):
-    return gen_ch(pid, n)
+async def regen_ch(pid: str, n: int):
+    return await gen_ch(pid, n, force=True)
 
 # ---------- costs ----------------------------------------------------------
+def _costs(pid: str, chapters: bool):
+    out = ledger.project_totals(pid)
+    if chapters: out["chapters"] = ledger.chapter_totals(pid)
+    return out
+
 @app.get("/projects/{pid}/costs")
-def cost_totals(pid: str):
-    log = Path("logs/cost.csv")
-    if not log.exists(): return {"usd": 0, "tokens": 0}
-    total_tokens = total_usd = 0.0
-    with log.open() as fh:
-        rdr = csv.DictReader(fh)
-        for row in rdr:
-            total_tokens += int(row["total_tokens"])
-            total_usd += float(row["usd"])
-    return {"usd": round(total_usd, 4), "tokens": int(total_tokens)}
+async def cost_totals(pid: str, chapters: bool = False):
+    return await asyncio.to_thread(_costs, pid, chapters)
+
+@app.get("/projects/{pid}/timings")
+async def timings(pid: str):
+    """Per‑stage latency (count, mean, p95, total) and per‑chapter stage totals."""
+    return await asyncio.to_thread(metrics.project_timings, pid)
+
+# ---------- metrics --------------------------------------------------------
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    out = await asyncio.to_thread(metrics.exposition)
+    if out is None: raise HTTPException(501, "prometheus_client not installed")
+    return Response(out[0], media_type=out[1])
+
+# ---------- llm cache ------------------------------------------------------
+@app.get("/llm-cache")
+async def llm_cache_stats():
+    return await asyncio.to_thread(llm_cache.stats)
 
 # ---------- bulk draft -----------------------------------------------------
 @app.post("/projects/{pid}/draft")
-def bulk(pid: str, payload: dict | None = None):
+async def bulk(pid: str, payload: dict | None = None):
     chapters = payload.get("chapters") if payload else None
-    task = celery_app.send_task("worker.tasks.bulk_draft_task", args=[pid, chapters])
-    return {"task_id": task.id}
+    return await _send("bulk_draft_task", pid, chapters)
+
+@app.get("/projects/{pid}/draft")
+async def bulk_progress(pid: str):
+    rec = await asyncio.to_thread(jobs.load, pid)
+    if rec is None: raise HTTPException(404, "no bulk draft job")
+    return jobs.progress(rec)
+
+def _control(pid: str, action: str) -> dict | None:
+    rec = jobs.load(pid)
+    if rec is None:
+        return None
+    job = rec["id"]
+    if action == "resume":
+        if rec["status"] == "paused":
+            rec = jobs.set_status(pid, job, "running")
+            celery_app.send_task("worker.tasks.resume_draft_task", args=[pid, job])
+        return jobs.progress(rec)
+    if action == "cancel":
+        return jobs.progress(_cancel(pid, job))
+    rec = jobs.set_status(pid, job, "paused")
+    sc.drop(pid, job)  # chapters already drafting finish; queued ones never start
+    return jobs.progress(rec)
+
+def _cancel(pid: str, job: str) -> dict:
+    rec = jobs.set_status(pid, job, "cancelled")
+    _revoke(pid, job, rec)
+    return rec
+
+def _revoke(pid: str, job: str, rec: dict) -> None:
+    """Drop a cancelled job's queued chapters and publish its final state."""
+    sc.drop(pid, job)
+    if rec["status"] == "cancelled":
+        celery_app.backend.store_result(job, None, "REVOKED")
+        ev.publish(job, {"type": "state", "state": "REVOKED", "result": None, "final": True})
+
+@app.post("/projects/{pid}/draft/{action}")
+async def bulk_control(pid: str, action: str):
+    """pause | resume | cancel the project's latest bulk draft."""
+    if action not in ("pause", "resume", "cancel"): raise HTTPException(404, "unknown action")
+    out = await asyncio.to_thread(_control, pid, action)
+    if out is None: raise HTTPException(404, "no bulk draft job")
+    return out
+
+# ---------- summaries ------------------------------------------------------
+@app.post("/projects/{pid}/summaries")
+async def resummarize(pid: str, payload: dict | None = None):
+    chapters = payload.get("chapters") if payload else None
+    return await _send("summarize_chapters_task", pid, chapters)
 
 # ---------- themes ---------------------------------------------------------
 @app.get("/projects/{pid}/themes")
-def theme_tot(pid: str):
-    p = pj.NOVELIST_ROOT / pid / "reports" / "theme_totals.json"
-    if not p.exists(): raise HTTPException(404, "theme totals not found")
-    return json.loads(p.read_text())
+async def theme_tot(pid: str):
+    totals = await rm.theme_totals(pid)
+    if totals is None: raise HTTPException(404, "theme totals not found")
+    return totals
+
+@app.post("/projects/{pid}/themes/recompute")
+async def theme_recompute(pid: str):
+    return await _send("recompute_themes_task", pid)
+
+# ---------- export ---------------------------------------------------------
+@app.post("/projects/{pid}/export")
+async def export_book(pid: str, payload: dict | None = None):
+    """Body {format: md|epub|docx}; saves exports/<pid>.<format> in a worker."""
+    fmt = (payload or {}).get("format", "md")
+    if fmt not in ex.FORMATS: raise HTTPException(422, f"format must be one of {', '.join(ex.FORMATS)}")
+    return await _send("export_book_task", pid, fmt)
+
+@app.get("/projects/{pid}/export/{fmt}")
+async def download_book(pid: str, fmt: str):
+    """Streams the book chapter by chapter as it is assembled."""
+    if fmt not in ex.FORMATS: raise HTTPException(422, f"format must be one of {', '.join(ex.FORMATS)}")
+    if await rm.outline(pid) is None: raise HTTPException(404, "outline not found")
+    return StreamingResponse(
+        ex.stream(pid, fmt), media_type=ex.FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{ex.filename(pid, fmt)}"'},
+    )
 
 # ---------- tasks ----------------------------------------------------------
-@app.get("/tasks/{task_id}")
-def task_status(task_id: str):
+def _task_status(task_id: str) -> dict:
     r = AsyncResult(task_id, app=celery_app)
     return {"state": r.state, "info": r.info, "ready": r.ready()}
 
+@app.get("/tasks/{task_id}")
+async def task_status(task_id: str):
+    return await asyncio.to_thread(_task_status, task_id)
+
+def _task_state(task_id: str) -> dict:
+    r = AsyncResult(task_id, app=celery_app)
+    if r.ready():
+        return {"type": "state", "state": r.state, "result": r.info, "final": True}
+    return {"type": "state", "state": r.state, "info": r.info}
+
+async def _relay(task_id: str, ws: WebSocket):
+    async with ev.hub.watch(task_id) as (history, live):
+        if not history:  # never published (yet) or expired: ask the backend once
+            history = [await asyncio.to_thread(_task_state, task_id)]
+        for event in history:
+            await ws.send_json(event)
+            if event.get("final"): return
+        async for event in live:
+            await ws.send_json(event)
+            if event.get("final"): return
+
+async def _until_closed(ws: WebSocket):
+    while (await ws.receive())["type"] != "websocket.disconnect":
+        pass
+
 @app.websocket("/ws/{task_id}")
 async def ws_task(task_id: str, ws: WebSocket):
+    """Replays the task's event history, then relays live events until it ends."""
     await ws.accept()
+    # a quiet task sends nothing, so watch for the client leaving as well
+    relay = asyncio.create_task(_relay(task_id, ws))
+    closed = asyncio.create_task(_until_closed(ws))
     try:
-        while True:
-            r = AsyncResult(task_id, app=celery_app)
-            if r.ready():
-                await ws.send_json({"state": r.state, "result": r.result})
-                break
-            await ws.send_json({"state": r.state, "info": r.info})
-            await asyncio.sleep(1)
+        await asyncio.wait((relay, closed), return_when=asyncio.FIRST_COMPLETED)
     finally:
+        relay.cancel(); closed.cancel()
+    if relay.done() and not relay.cancelled() and relay.exception() is None:
         await ws.close()
 
+@app.on_event("shutdown")
+async def _close_hub():
+    await ev.hub.close()
+
 # ---------- entry ----------------------------------------------------------
 def run(): import uvicorn; uvicorn.run("api.main:app", host="0.0.0.0", port=8000, reload=True)
 if __name__ == "__main__": run()
@@ -0,0 +1,111 @@
+# v2025‑07‑09‑AI-generated
+"""
+api/readmodel.py
+In‑memory per‑project read models for the dashboard endpoints.
+
+A model is built (in a worker thread) from a few files and cached with
+their mtimes. A cached read only stats those paths on the event loop –
+microseconds – and rebuilds when one moved. All project writes go
+through os.replace, which also bumps the parent directory's mtime, so
+watching chapters/ and reports/ catches new or rewritten files there.
+Concurrent misses for the same model share one build.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable
+
+from core import projects as pj
+from plugins import theme as th
+
+MAX_MODELS = 1024
+
+_cache: OrderedDict[tuple[str, str], tuple[tuple, Any]] = OrderedDict()
+_building: dict[tuple[str, str], tuple[tuple, asyncio.Future]] = {}
+
+
+def _mtime(path: Path) -> int | None:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+async def _get(key: tuple[str, str], paths: list[Path], build: Callable[[], Any]) -> Any:
+    sig = tuple(_mtime(p) for p in paths)
+    hit = _cache.get(key)
+    if hit and hit[0] == sig:
+        _cache.move_to_end(key)
+        return hit[1]
+    pending = _building.get(key)
+    if pending and pending[0] == sig:
+        return await asyncio.shield(pending[1])
+
+    fut = asyncio.ensure_future(asyncio.to_thread(build))
+    _building[key] = (sig, fut)
+    try:
+        value = await asyncio.shield(fut)
+    finally:
+        if _building.get(key, (None, None))[1] is fut:
+            del _building[key]
+    _cache[key] = (sig, value)
+    if len(_cache) > MAX_MODELS:
+        _cache.popitem(last=False)
+    return value
+
+# ---------------------------------------------------------------- models
+
+def _root(pid: str) -> Path:
+    return pj.NOVELIST_ROOT / pid
+
+
+async def manifest(pid: str) -> dict[str, Any]:
+    """Raises pj.ProjectError if the project does not exist."""
+    return await _get((pid, "manifest"), [_root(pid) / pj.MANIFEST], lambda: pj.load_manifest(pid))
+
+
+def _read_json(path: Path) -> Any:
+    return json.loads(path.read_text(encoding="utf-8")) if path.exists() else None
+
+
+async def outline(pid: str) -> dict[str, Any] | None:
+    p = _root(pid) / "outline.json"
+    return await _get((pid, "outline"), [p], lambda: _read_json(p))
+
+
+def _chapters(pid: str) -> list[dict[str, Any]] | None:
+    root = _root(pid)
+    outline = _read_json(root / "outline.json")
+    if outline is None:
+        return None
+    from core import draft as dr  # pulls in openai; first chapter listing pays, not start‑up
+    status = dr.chapter_status(pid)
+    drafted = set(os.listdir(root / "chapters")) if (root / "chapters").exists() else set()
+    out = []
+    for c in outline["chapters"]:
+        n = c["num"]
+        out.append({
+            "num": n,
+            "exists": f"ch{n:02d}.md" in drafted,
+            "report": _read_json(root / "reports" / f"ch{n:02d}.beats.json"),
+            "length": _read_json(root / "reports" / f"ch{n:02d}.length.json"),
+            "status": status.get(str(n)),
+        })
+    return out
+
+
+async def chapters(pid: str) -> list[dict[str, Any]] | None:
+    root = _root(pid)
+    paths = [root / "outline.json", root / "chapters", root / "reports"]
+    return await _get((pid, "chapters"), paths, lambda: _chapters(pid))
+
+
+async def theme_totals(pid: str) -> dict[str, int] | None:
+    root = _root(pid)
+    paths = [root / th.INDEX_FILE, root / th.TOTALS_FILE]
+    return await _get((pid, "themes"), paths, lambda: th.theme_totals(pid))
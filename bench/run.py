@@ -0,0 +1,356 @@
+# v2025‑07‑10‑AI-generated
+"""
+bench/run.py
+Throughput / latency benchmarks against the local OpenAI mock.
+
+    python -m bench.run                                  # all suites
+    python -m bench.run --suite bulk,scan --chapters 100 --latency 0.2 --tps 400
+    python -m bench.run --rate-429 0.1 --out bench.json --baseline last.json
+
+Suites
+    outline   generate_outline, N concurrent projects
+    chapter   generate_chapter one by one (streamed), incl. summary + checks
+    bulk      run_bulk over a synthetic N‑chapter outline
+    scan      verify_beats + theme scoring on a synthetic N‑chapter book
+    api       concurrent dashboard reads through the ASGI app
+    startup   cold `import worker.tasks` / `import api.main` in fresh
+              interpreters (what an autoscaled pod pays before serving);
+              tools.startup_profile breaks it down per module
+
+Everything runs in a throw‑away NOVELIST_ROOT with the LLM cache off, a
+per‑process rate limiter and events disabled, so only our own code and
+the mock's configured latency are measured. Results are one JSON
+document (per suite: ops, wall time, throughput, p50/p95/max latency,
+peak RSS, mock request/429 counts). --baseline compares against an
+earlier run and exits 1 when throughput drops or p95 grows by more than
+--tolerance.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime as dt
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+SUITES = ("outline", "chapter", "bulk", "scan", "api", "startup")
+
+
+def _isolate(base_url: str) -> None:
+    """Point every core module at scratch storage and the mock (before import)."""
+    scratch = Path(tempfile.mkdtemp(prefix="novelist-bench-"))
+    os.environ.update(
+        NOVELIST_ROOT=str(scratch / "projects"),
+        PROJECT_INDEX=str(scratch / "index.db"),
+        COST_DB=str(scratch / "cost.db"),
+        OPENAI_BASE_URL=base_url,
+        OPENAI_API_KEY="bench",
+        LLM_CACHE="off",
+        RATE_LIMIT_URL="local",
+        EVENTS_URL="memory://",  # publish() fails fast and silently
+        SUMMARY_MODE=os.getenv("SUMMARY_MODE", "openai"),
+    )
+
+
+def _rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+
+def _pct(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def _result(latencies: list[float], wall: float, unit: str, mock: dict[str, int] | None = None) -> dict:
+    n = len(latencies)
+    out = {
+        "ops": n,
+        "wall_s": round(wall, 3),
+        f"{unit}_per_min": round(n / wall * 60, 1) if wall else 0.0,
+        "p50_ms": round(_pct(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(_pct(latencies, 0.95) * 1000, 2),
+        "max_ms": round(max(latencies, default=0) * 1000, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        "rss_peak_mb": _rss_mb(),
+    }
+    if mock is not None:
+        out["mock"] = mock
+    return out
+
+# ---------------------------------------------------------------- fixtures
+
+THEMES = ["Hope", "Memory", "Betrayal", "The Sea"]
+
+
+def synthetic_outline(chapters: int, words: int) -> dict[str, Any]:
+    return {
+        "title": "Benchmark Novel",
+        "themes": THEMES,
+        "chapters": [
+            {
+                "num": n,
+                "title": f"Chapter {n}",
+                "summary": f"The crew faces trial number {n}.",
+                "target_words": words,
+                "beats": [f"Beat {n}.{b} happens at the harbour" for b in range(1, 5)],
+            }
+            for n in range(1, chapters + 1)
+        ],
+    }
+
+
+def synthetic_prose(spec: dict[str, Any], words: int) -> str:
+    from tools.mock_openai import FILLER
+    body = [FILLER[i % len(FILLER)] for i in range(words)]
+    for k, beat in enumerate(spec["beats"][:-1]):  # one beat left out on purpose
+        body.insert((k + 1) * words // len(spec["beats"]), beat + ".")
+    for k, theme in enumerate(THEMES):
+        body.insert((k * 997) % len(body), theme.lower())
+    paras = [" ".join(body[i : i + 120]) for i in range(0, len(body), 120)]
+    return "\n\n".join(paras)
+
+
+def _project(outline: dict[str, Any]) -> str:
+    from core import projects as pj
+    pid = pj.create_project("Bench")["id"]
+    pj.atomic_write_json(pj.NOVELIST_ROOT / pid / "outline.json", outline)
+    pj.update_manifest(pid, outline_status="ready")
+    return pid
+
+# ---------------------------------------------------------------- suites
+
+def bench_outline(args, mock) -> dict:
+    from core import outline as ol
+    from core import projects as pj
+
+    pids = [pj.create_project(f"Outline {i}")["id"] for i in range(args.outlines)]
+
+    async def _one(pid: str) -> float:
+        t = time.perf_counter()
+        await ol.agenerate_outline(pid, "A lighthouse keeper finds a map", "mystery", 60000)
+        return time.perf_counter() - t
+
+    async def _all():
+        return await asyncio.gather(*(_one(p) for p in pids))
+
+    t0 = time.perf_counter()
+    lat = asyncio.run(_all())
+    return _result(list(lat), time.perf_counter() - t0, "outlines", mock())
+
+
+def bench_chapter(args, mock) -> dict:
+    from core import draft as dr
+
+    pid = _project(synthetic_outline(args.single, args.words))
+    lat = []
+    t0 = time.perf_counter()
+    for n in range(1, args.single + 1):
+        t = time.perf_counter()
+        dr.generate_chapter(pid, n, stream=True)
+        lat.append(time.perf_counter() - t)
+    return _result(lat, time.perf_counter() - t0, "chapters", mock())
+
+
+def bench_bulk(args, mock) -> dict:
+    from core import bulk_draft as bd
+
+    pid = _project(synthetic_outline(args.chapters, args.words))
+    began: dict[str, float] = {}
+    lat: dict[str, float] = {}
+
+    def _update(state=None, meta=None, **_):
+        now = time.perf_counter()
+        for num, st in (meta or {}).get("chapters", {}).items():
+            if st == "drafting":
+                began.setdefault(num, now)
+            elif st == "done" and num in began and num not in lat:
+                lat[num] = now - began[num]
+
+    started = time.perf_counter()
+    bd.run_bulk(pid, None, _update, concurrency=args.concurrency)
+    wall = time.perf_counter() - started
+    out = _result(list(lat.values()), wall, "chapters", mock())
+    out["concurrency"] = args.concurrency
+    return out
+
+
+def bench_scan(args, mock) -> dict:
+    from core import beats as bt
+    from core import textscan as ts
+    from plugins import theme as th
+
+    outline = synthetic_outline(args.chapters, args.scan_words)
+    book = [(c, synthetic_prose(c, args.scan_words)) for c in outline["chapters"]]
+    lat = []
+    t0 = time.perf_counter()
+    for spec, prose in book:
+        t = time.perf_counter()
+        ts.scan(prose, spec["beats"] + THEMES)
+        bt.verify_beats(prose, spec["beats"])
+        th._score(prose, THEMES)
+        lat.append(time.perf_counter() - t)
+    out = _result(lat, time.perf_counter() - t0, "chapters")
+    out["words_per_chapter"] = args.scan_words
+    return out
+
+
+def bench_api(args, mock) -> dict:
+    import httpx
+    from api.main import app
+    from core import projects as pj
+
+    pid = _project(synthetic_outline(args.chapters, args.words))
+    for n in range(1, args.chapters + 1, 2):
+        pj.commit_chapter(pid, n, prose="x", beats={"present": [], "missing": []})
+    paths = ["/projects", f"/projects/{pid}", f"/projects/{pid}/chapters", f"/projects/{pid}/outline"]
+
+    async def _run():
+        lat: list[float] = []
+        sem = asyncio.Semaphore(args.clients)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async def _one(i: int):
+                async with sem:
+                    t = time.perf_counter()
+                    r = await client.get(paths[i % len(paths)])
+                    r.raise_for_status()
+                    lat.append(time.perf_counter() - t)
+            await asyncio.gather(*(_one(i) for i in range(args.requests)))
+        return lat
+
+    t0 = time.perf_counter()
+    lat = asyncio.run(_run())
+    out = _result(lat, time.perf_counter() - t0, "requests")
+    out["clients"] = args.clients
+    return out
+
+
+def _cold_import(module: str) -> float:
+    t = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], check=True, cwd=Path(__file__).resolve().parent.parent)
+    return time.perf_counter() - t
+
+
+def bench_startup(args, mock) -> dict:
+    """Worker import times (p50 / p95 are regression‑checked); API and bare interpreter alongside."""
+    times = {
+        name: [_cold_import(module) for _ in range(args.imports)]
+        for name, module in (("python", "sys"), ("worker", "worker.tasks"), ("api", "api.main"))
+    }
+    out = _result(times["worker"], sum(times["worker"]), "imports")
+    out["python_p50_ms"] = round(statistics.median(times["python"]) * 1000, 2)
+    out["api_p50_ms"] = round(statistics.median(times["api"]) * 1000, 2)
+    out["api_p95_ms"] = round(_pct(times["api"], 0.95) * 1000, 2)
+    return out
+
+
+BENCHES: dict[str, Callable] = {
+    "outline": bench_outline, "chapter": bench_chapter, "bulk": bench_bulk,
+    "scan": bench_scan, "api": bench_api, "startup": bench_startup,
+}
+
+# ---------------------------------------------------------------- baseline
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Human‑readable regressions of throughput (down) or p95 (up)."""
+    problems = []
+    for suite, now in current["results"].items():
+        old = baseline.get("results", {}).get(suite)
+        if not old:
+            continue
+        for key, val in now.items():
+            if key.endswith("_per_min") and old.get(key) and val < old[key] * (1 - tolerance):
+                problems.append(f"{suite}.{key}: {old[key]} → {val}")
+        if old.get("p95_ms") and now["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            problems.append(f"{suite}.p95_ms: {old['p95_ms']} → {now['p95_ms']}")
+    return problems
+
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Novelist benchmarks against the OpenAI mock")
+    ap.add_argument("--suite", default=",".join(SUITES), help="comma list of " + ", ".join(SUITES))
+    ap.add_argument("--chapters", type=int, default=100, help="chapters in synthetic books")
+    ap.add_argument("--words", type=int, default=600, help="target words per drafted chapter")
+    ap.add_argument("--scan-words", type=int, default=3000, help="words per chapter for scan")
+    ap.add_argument("--single", type=int, default=5, help="chapters for the chapter suite")
+    ap.add_argument("--outlines", type=int, default=10, help="projects for the outline suite")
+    ap.add_argument("--concurrency", type=int, default=8, help="run_bulk parallel drafts")
+    ap.add_argument("--clients", type=int, default=200, help="concurrent API clients")
+    ap.add_argument("--requests", type=int, default=5000, help="API requests in total")
+    ap.add_argument("--imports", type=int, default=5, help="cold imports per target for startup")
+    ap.add_argument("--latency", type=float, default=0.05, help="mock time to first byte (s)")
+    ap.add_argument("--tps", type=float, default=0.0, help="mock streamed tokens/s (0 = unthrottled)")
+    ap.add_argument("--rate-429", type=float, default=0.0, help="share of requests refused with 429")
+    ap.add_argument("--out", help="write JSON here instead of stdout")
+    ap.add_argument("--baseline", help="earlier JSON result to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = ap.parse_args(argv)
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from tools import mock_openai as mo
+
+    mo.Config.latency, mo.Config.tps = args.latency, args.tps
+    mo.Config.rate_429, mo.Config.retry_after = args.rate_429, 0.2
+    server = mo.serve(port=0)
+    _isolate(f"http://127.0.0.1:{server.server_address[1]}/v1")
+
+    def mock_delta() -> Callable[[], dict[str, int]]:
+        before = dict(mo.stats)
+        return lambda: {k: mo.stats[k] - before[k] for k in mo.stats}
+
+    report: dict[str, Any] = {
+        "meta": {
+            "timestamp": dt.datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "git": _git_rev(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": {},
+    }
+    for name in [s.strip() for s in args.suite.split(",") if s.strip()]:
+        if name not in BENCHES:
+            ap.error(f"unknown suite {name!r}")
+        print(f"[bench] {name} …", file=sys.stderr)
+        report["results"][name] = BENCHES[name](args, mock_delta())
+    server.shutdown()
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+    if args.baseline:
+        problems = compare(report, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for p in problems:
+            print(f"[bench] regression {p}", file=sys.stderr)
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,23 +2,49 @@
 """
 core/beats.py
 Checks that expected beats are present in the generated chapter.
+
+Exact matching uses the shared core.textscan automaton (one pass for all
+beats, cached per chapter). With BEAT_MATCH=fuzzy, beats the exact pass
+misses are retried by token overlap so paraphrased beats still count.
+
+Environment variables:
+    BEAT_MATCH             exact | fuzzy   default exact
+    BEAT_FUZZY_THRESHOLD   default 0.6     share of beat words required
 """
 
 from __future__ import annotations
-import re
-from typing import Iterable, Dict, List
+import os
+from typing import Any, Iterable, Dict
+
+from core import textscan as ts
 
+MATCH_MODE = os.getenv("BEAT_MATCH", "exact").lower()
+FUZZY_THRESHOLD = float(os.getenv("BEAT_FUZZY_THRESHOLD", "0.6"))
 
-def normalise(text: str) -> str:
-    return re.sub(r"\W+", "", text.lower())
+normalise = ts.normalise
 
 
-def verify_beats(chapter_text: str, beats: Iterable[str]) -> Dict[str, List[str]]:
-    present, missing = [], []
-    norm_chapter = normalise(chapter_text)
+def verify_beats(
+    chapter_text: str, beats: Iterable[str], fuzzy: bool | None = None
+) -> Dict[str, Any]:
+    """
+    {"present": [...], "missing": [...], "matches": {beat: {...}}}
+    matches records how each present beat was found and where.
+    """
+    beats = list(beats)
+    fuzzy = MATCH_MODE == "fuzzy" if fuzzy is None else fuzzy
+    hits = ts.scan(chapter_text, beats)
+    present, missing, matches = [], [], {}
     for beat in beats:
-        if normalise(beat) in norm_chapter:
+        if hits[beat]["count"]:
             present.append(beat)
-        else:
-            missing.append(beat)
-    return {"present": present, "missing": missing}
+            matches[beat] = {"mode": "exact", "offset": hits[beat]["offsets"][0]}
+            continue
+        if fuzzy:
+            score, span = ts.fuzzy_match(chapter_text, beat)
+            if score >= FUZZY_THRESHOLD:
+                present.append(beat)
+                matches[beat] = {"mode": "fuzzy", "score": round(score, 2), "offset": span}
+                continue
+        missing.append(beat)
+    return {"present": present, "missing": missing, "matches": matches}
@@ -1,18 +1,62 @@
 # v2025‑06‑28‑AI-generated
 """
 core/bulk_draft.py
-Sequentially (re)generates chapters that are missing or flagged
-for regeneration. Progress is reported via Celery task.update_state.
+(Re)generates chapters that are missing or flagged for regeneration.
+
+Chapters are drafted concurrently on a bounded thread pool. A chapter's
+continuity prompt only needs summaries of earlier chapters, so chapters
+that are being (re)drafted in the same run are represented by their
+outline summary (stand‑in); chapters outside the run use their real
+summary. An optional continuity re‑pass redrafts the batch once all real
+summaries exist.
+
+Summary and checks run inline by default; pass `postprocess` to hand
+them to another stage (the Celery worker chains them on their own
+queues) so the pool moves straight on to the next draft.
+
+With SUMMARY_MODE=batch the pass drafts only; summaries for every
+drafted chapter then go out as one batch (see core.summarizer) and the
+checks run inline, replacing the per‑chapter `postprocess`.
+
+Progress is reported via Celery task.update_state; with a job id the
+per‑chapter states are also checkpointed in a core.jobs record. A
+failed chapter is logged with its traceback and its repr(exc) lands in
+the progress meta and the job record ("errors"); the run's final
+RuntimeError is chained from the first failure.
+
+The Celery worker normally hands bulk drafts to core.scheduler instead
+(one task per chapter, round‑robin across projects) and calls
+draft_one() per chapter; run_bulk stays the path for continuity passes,
+batch summaries and revisions.
+
+Environment variables:
+    BULK_CONCURRENCY       default 4   parallel chapter drafts
+    BULK_CONTINUITY_PASS   default 0   1 → redraft with real summaries
 """
 
 from __future__ import annotations
 
 import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable
 
+from core import context as cx
 from core import draft as dr
+from core import jobs
 from core import projects as pj
+from core import length as ln
+from core import summarizer as sz
+from core.openai_wrap import PRICE
+
+log = logging.getLogger(__name__)
+
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "4"))
+CONTINUITY_PASS = os.getenv("BULK_CONTINUITY_PASS", "0") == "1"
 
 
 def _load_outline(pid: str) -> list[dict[str, Any]]:
@@ -26,29 +70,203 @@ def _chapter_done(root: Path, num: int) -> bool:
     return (root / "chapters" / f"ch{num:02d}.md").exists()
 
 
-def run_bulk(pid: str, chapters: list[int] | None, update_state) -> None:
+def _stand_in(spec: dict[str, Any]) -> str:
+    return spec.get("summary") or spec["title"]
+
+
+def _priors_for(
+    pid: str, num: int, outline: list[dict[str, Any]], pending: set[int]
+) -> dict[int, str]:
+    """Real summaries for settled chapters, outline stand‑ins for pending ones."""
+    real = cx.load_summaries(pid, num)
+    return {
+        s["num"]: real[s["num"]] if s["num"] in real and s["num"] not in pending
+        else _stand_in(s)
+        for s in outline
+        if s["num"] < num
+    }
+
+
+def wanted(pid: str, chapters: list[int] | None) -> list[int]:
+    """*chapters* as given, or every outline chapter not drafted yet (nor being
+    drafted by the speculative job)."""
+    if chapters is not None:
+        return list(chapters)
+    root = pj.NOVELIST_ROOT / pid
+    spec = jobs.speculative(pid)
+    busy = jobs.in_flight(spec) if spec else set()
+    return [
+        c["num"] for c in _load_outline(pid)
+        if not _chapter_done(root, c["num"]) and c["num"] not in busy
+    ]
+
+
+def chapter_usd(pid: str, nums: list[int]) -> float:
+    """Upper estimate of one chapter's draft cost: full context + max_tokens at list price."""
+    targets = [c.get("target_words", 0) for c in _load_outline(pid) if c["num"] in nums]
+    # prompt: continuity block + instructions / beats; completion: the length cap; + summary call
+    tokens = cx.CONTEXT_TOKENS + 1000 + ln.max_tokens(max(targets, default=0))
+    return round(tokens / 1000 * PRICE.get(dr.OPENAI_MODEL, 0.002), 6)
+
+
+def draft_one(
+    pid: str,
+    num: int,
+    pending: set[int],
+    task_id: str | None = None,
+    postprocess: bool = True,
+) -> str:
+    """Draft one chapter of a bulk run; *pending* chapters count as stand‑ins."""
+    priors = _priors_for(pid, num, _load_outline(pid), pending)
+    return dr.generate_chapter(pid, num, priors=priors, task_id=task_id, postprocess=postprocess)
+
+
+class _Progress:
+    """Thread‑safe wrapper that publishes per‑chapter states."""
+
+    def __init__(self, update_state, wanted: list[int], task_id: str | None = None):
+        # set() runs on pool threads, where Celery's thread‑local request
+        # has no id: bind it, or the states are stored under task_id=None
+        self._update = partial(update_state, task_id=task_id) if task_id else update_state
+        self._lock = threading.Lock()
+        self.states = {str(n): "pending" for n in wanted}
+        self.errors: dict[str, str] = {}
+        self.done = 0
+        self.phase = "draft"
+
+    def set(self, num: int, state: str, error: str | None = None) -> None:
+        with self._lock:
+            self.states[str(num)] = state
+            if error is not None:
+                self.errors[str(num)] = error
+            if state in ("done", "failed"):
+                self.done += 1
+            self._update(
+                state="PROGRESS",
+                meta={
+                    "current": self.done,
+                    "total": len(self.states),
+                    "chapter": num,
+                    "phase": self.phase,
+                    "chapters": dict(self.states),
+                    **({"errors": dict(self.errors)} if self.errors else {}),
+                },
+            )
+
+    def reset(self, phase: str) -> None:
+        with self._lock:
+            self.phase = phase
+            self.done = 0
+            self.states = {k: "pending" for k in self.states}
+
+
+def _draft_pass(
+    pid: str,
+    wanted: list[int],
+    priors: Callable[[int], dict[int, str]],
+    progress: _Progress,
+    workers: int,
+    task_id: str | None,
+    postprocess: Callable[[int], None] | None,
+    job: str | None = None,
+) -> dict[int, BaseException]:
+    """Draft *wanted* concurrently; return {chapter: exception} for failures, in failure order."""
+
+    def _one(num: int) -> None:
+        # this run owns the job, so a "drafting" chapter was interrupted
+        if job is not None and not jobs.claim(pid, job, num, retake=True):
+            raise jobs.Stopped(num)
+        progress.set(num, "drafting")
+        dr.generate_chapter(
+            pid, num, priors=priors(num), task_id=task_id,
+            postprocess=postprocess is None,
+        )
+        if postprocess is not None:
+            postprocess(num)
+
+    failed: dict[int, BaseException] = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(_one, n): n for n in wanted}
+        for fut in as_completed(futures):
+            num, exc = futures[fut], fut.exception()
+            if isinstance(exc, jobs.Stopped):
+                continue
+            error = None
+            if exc is not None:
+                log.error("bulk draft %s: chapter %s failed", pid, num, exc_info=exc)
+                failed[num] = exc
+                error = repr(exc)
+            if job is not None:
+                jobs.mark(pid, job, num, "failed" if exc else "done", error)
+            progress.set(num, "failed" if exc else "done", error)
+    return failed
+
+
+def _batch_postprocess(pid: str, nums: list[int], progress: _Progress) -> None:
+    progress.reset("summary")
+    dr.summarize_chapters(pid, nums)
+    for n in nums:
+        dr.check_chapter(pid, n)
+        progress.set(n, "done")
+
+
+def run_bulk(
+    pid: str,
+    chapters: list[int] | None,
+    update_state,
+    concurrency: int | None = None,
+    continuity_pass: bool | None = None,
+    task_id: str | None = None,
+    postprocess: Callable[[int], None] | None = None,
+    job: str | None = None,
+) -> None:
     """
     * chapters == None  → generate all that are missing
     * chapters == [2,4] → generate exactly 2 & 4 (overwrite)
+    job          – core.jobs record id: a rerun with the same id resumes,
+                   drafting only chapters the record has not finished;
+                   pausing / cancelling it stops before the next chapter
     update_state – Celery task's self.update_state
+    concurrency  – parallel drafts (default BULK_CONCURRENCY)
+    continuity_pass – redraft the batch with real summaries afterwards
+    task_id      – event channel for streamed chapter tokens; also the
+                   task id progress is stored under
+    postprocess  – schedules summary + checks for a drafted chapter;
+                   None runs them inline (unused with SUMMARY_MODE=batch)
     """
-    root = pj.NOVELIST_ROOT / pid
     outline = _load_outline(pid)
+    workers = concurrency or BULK_CONCURRENCY
+    repass = CONTINUITY_PASS if continuity_pass is None else continuity_pass
 
-    wanted = (
-        chapters if chapters is not None
-        else [c["num"] for c in outline if not _chapter_done(root, c["num"])]
+    todo = wanted(pid, chapters)
+    pending = set(todo)
+    if job is not None:
+        rec = jobs.create(pid, job, todo)
+        todo, pending = jobs.todo(rec), jobs.unfinished(rec)
+    progress = _Progress(update_state, todo, task_id)
+
+    def _pass(priors, post, gate=None) -> dict[int, BaseException]:
+        if sz.MODE != "batch":
+            return _draft_pass(pid, todo, priors, progress, workers, task_id, post, gate)
+        failed = _draft_pass(pid, todo, priors, progress, workers, task_id, lambda n: None, gate)
+        _batch_postprocess(pid, [n for n in todo if progress.states[str(n)] == "done"], progress)
+        return failed
+
+    # a continuity re‑pass needs pass‑1 summaries on disk, so keep them inline
+    failed = _pass(
+        lambda n: _priors_for(pid, n, outline, pending),
+        None if repass else postprocess,
+        job,
     )
-    total = len(wanted)
+    if job is not None and jobs.load(pid, job)["status"] in ("paused", "cancelled"):
+        return
 
-    for idx, ch_num in enumerate(wanted, start=1):
-        update_state(
-            state="PROGRESS",
-            meta={"current": idx, "total": total, "chapter": ch_num},
-        )
-        dr.generate_chapter(pid, ch_num)
+    if repass and not failed and len(todo) > 1:
+        progress.reset("continuity")
+        failed = _pass(lambda n: _priors_for(pid, n, outline, set()), postprocess)
+
+    if failed:
+        raise RuntimeError(f"Chapters failed to draft: {sorted(failed)}") from next(iter(failed.values()))
 
-    # mark manifest
-    manifest = pj.load_manifest(pid)
-    manifest["draft_status"] = "ready"
-    (root / pj.MANIFEST).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    # mark manifest ("ready" once the post stages finish, see core.draft)
+    dr.mark_drafted(pid)
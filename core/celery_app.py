@@ -6,18 +6,115 @@ Initialises the shared Celery application object.
 Environment variables:
     BROKER_URL            default redis://localhost:6379/0
     CELERY_RESULT_BACKEND default = BROKER_URL
+    INTERACTIVE_QUEUE     default interactive  outline + single‑chapter requests
+    BULK_QUEUE            default bulk    bulk / revision drafting (one task per chapter)
+    POST_QUEUE            default post    LLM post‑processing (summaries)
+    CHECKS_QUEUE          default checks  CPU‑only beat/theme checks
+    SCHED_PUMP_EVERY      default 60      seconds between Celery beat runs of
+                                          the bulk scheduler pump (0 = off)
+
+Run at least one worker on INTERACTIVE_QUEUE that does not consume
+BULK_QUEUE, so user requests never wait behind a book; bulk workers may
+also take interactive work to use spare capacity. Set all four to
+"celery" to run everything on one worker. Prefetch is 1 so a worker
+never holds queued chapters it cannot start. Run one Celery beat
+(`celery beat` or a worker with -B) so expired bulk leases are
+re‑queued even when no chapter finishes.
+
+Tasks push their state to core.events instead of being polled: every
+update_state() publishes {"type": "state", "state", "info"} and the
+success / failure / revoke signals publish the final
+{"type": "state", "state", "result", "final": true}.
+
+Messages are stamped with an "enqueued_at" header so workers can report
+broker queue wait; run time and outcome go to core.metrics too, and
+WORKER_METRICS_PORT exposes them to Prometheus.
 """
 
 from __future__ import annotations
 import core.env
 import os
-from celery import Celery
+import time
+from celery import Celery, Task
+from celery.signals import (
+    before_task_publish, task_failure, task_postrun, task_prerun, task_revoked,
+    task_success, worker_init,
+)
+
+from core import events as ev
+from core import metrics
 
 BROKER_URL = os.getenv("BROKER_URL", "redis://localhost:6379/0")
 BACKEND_URL = os.getenv("CELERY_RESULT_BACKEND", BROKER_URL)
+POST_QUEUE = os.getenv("POST_QUEUE", "post")
+CHECKS_QUEUE = os.getenv("CHECKS_QUEUE", "checks")
+INTERACTIVE_QUEUE = os.getenv("INTERACTIVE_QUEUE", "interactive")
+BULK_QUEUE = os.getenv("BULK_QUEUE", "bulk")
+PUMP_EVERY = float(os.getenv("SCHED_PUMP_EVERY", "60"))
+
+class EventTask(Task):
+    def update_state(self, task_id=None, state=None, meta=None, **kwargs):
+        super().update_state(task_id, state, meta, **kwargs)
+        ev.publish(task_id or self.request.id, {"type": "state", "state": state, "info": meta})
+
+
+def _final(task_id: str | None, state: str, result) -> None:
+    ev.publish(task_id, {"type": "state", "state": state, "result": result, "final": True})
+
+
+@task_success.connect
+def _on_success(sender=None, result=None, **_):
+    _final(sender.request.id, "SUCCESS", result)
+
+
+@task_failure.connect
+def _on_failure(task_id=None, exception=None, **_):
+    _final(task_id, "FAILURE", repr(exception))
+
+
+@task_revoked.connect
+def _on_revoked(request=None, **_):
+    _final(getattr(request, "id", None), "REVOKED", None)
+
+
+@before_task_publish.connect
+def _stamp(headers=None, **_):
+    if headers is not None:
+        headers.setdefault("enqueued_at", time.time())
+
+
+_started: dict[str, float] = {}
+
+
+def _short(task) -> str:
+    return task.name.rsplit(".", 1)[-1]
+
+
+@task_prerun.connect
+def _on_prerun(task_id=None, task=None, **_):
+    req = task.request
+    enqueued = getattr(req, "enqueued_at", None) or (getattr(req, "headers", None) or {}).get("enqueued_at")
+    metrics.task_started(_short(task), enqueued)
+    _started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def _on_postrun(task_id=None, task=None, args=None, state=None, **_):
+    began = _started.pop(task_id, None)
+    if began is not None:
+        pid = args[0] if args and isinstance(args[0], str) else None
+        metrics.record(f"task.{_short(task)}", time.perf_counter() - began, {"pid": pid})
+    metrics.task_finished(_short(task), state or "UNKNOWN")
+
+
+@worker_init.connect
+def _on_worker_init(**_):
+    metrics.serve_worker_metrics()
+
 
 celery_app = Celery(
     "novelist",
+    task_cls=EventTask,
     broker=BROKER_URL,
     backend=BACKEND_URL,
     include=["worker.tasks"],  # auto‑import tasks package
@@ -30,4 +127,22 @@ celery_app.conf.update(
     timezone="UTC",
     task_track_started=True,
     broker_connection_retry_on_startup=True,
+    worker_prefetch_multiplier=1,
+    task_routes={
+        "worker.tasks.generate_outline_task": {"queue": INTERACTIVE_QUEUE},
+        "worker.tasks.generate_chapter_task": {"queue": INTERACTIVE_QUEUE},
+        "worker.tasks.bulk_draft_task": {"queue": BULK_QUEUE},
+        "worker.tasks.bulk_chapter_task": {"queue": BULK_QUEUE},
+        "worker.tasks.pump_task": {"queue": BULK_QUEUE},
+        "worker.tasks.resume_draft_task": {"queue": BULK_QUEUE},
+        "worker.tasks.revise_outline_task": {"queue": BULK_QUEUE},
+        "worker.tasks.summarize_chapter_task": {"queue": POST_QUEUE},
+        "worker.tasks.summarize_chapters_task": {"queue": POST_QUEUE},
+        "worker.tasks.check_chapter_task": {"queue": CHECKS_QUEUE},
+        "worker.tasks.recompute_themes_task": {"queue": CHECKS_QUEUE},
+        "worker.tasks.export_book_task": {"queue": CHECKS_QUEUE},
+    },
+    beat_schedule={
+        "sched-pump": {"task": "worker.tasks.pump_task", "schedule": PUMP_EVERY, "options": {"expires": PUMP_EVERY}},
+    } if PUMP_EVERY > 0 else {},
 )
@@ -0,0 +1,210 @@
+# v2025‑07‑04‑AI-generated
+"""
+core/context.py
+Token‑budgeted continuity context for chapter drafting.
+
+The most recent chapters are included verbatim (their ≤150‑char
+summaries, using at most half the budget); everything older is folded
+into rolled‑up arc summaries covering ARC_SIZE chapters each. Arcs are
+widened until the whole context fits the budget, so prompt size stays
+flat for long novels.
+
+Tokens are counted with tiktoken when it is installed, otherwise with a
+≈4‑chars‑per‑token estimate. Summary files are cached by mtime (LRU);
+a project's whole summary set is cached by the summaries directory's
+mtime, which every (atomic, rename‑based) write bumps, so a hit costs
+one stat instead of one per earlier chapter. A directory changed within
+the last second is re‑checked file by file (its mtime may not have
+ticked yet). The assembled context is cached per (project, chapter).
+
+Environment variables:
+    CONTEXT_TOKENS    default 1500  budget for the continuity block
+    CONTEXT_RECENT    default 8     max chapters included verbatim
+    CONTEXT_ARC_SIZE  default 5     chapters per rolled‑up arc
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+
+from core import projects as pj
+
+CONTEXT_TOKENS = int(os.getenv("CONTEXT_TOKENS", "1500"))
+RECENT = int(os.getenv("CONTEXT_RECENT", "8"))
+ARC_SIZE = int(os.getenv("CONTEXT_ARC_SIZE", "5"))
+ARC_CHARS = 400
+_CACHE_SIZE = 512
+_SUMMARY_CACHE_SIZE = 4096
+_DIR_CACHE_SIZE = 256
+_RACY_NS = 1_000_000_000  # mtime granularity margin
+
+# ---------------------------------------------------------------- tokens
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:  # not installed, or BPE file unavailable offline
+        return None
+
+
+def count_tokens(text: str) -> int:
+    enc = _encoding()
+    if enc is not None:
+        return len(enc.encode(text))
+    return (len(text) + 3) // 4
+
+# ---------------------------------------------------------------- summaries
+
+# the caches are shared by bulk_draft's pool threads
+_summary_cache: OrderedDict[Path, tuple[int, str]] = OrderedDict()
+_dir_cache: OrderedDict[Path, tuple[int, dict[int, str]]] = OrderedDict()
+_lock = threading.Lock()
+
+
+def _read_summary(path: Path) -> str | None:
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _lock:
+        hit = _summary_cache.get(path)
+        if hit and hit[0] == mtime:
+            _summary_cache.move_to_end(path)
+            return hit[1]
+    text = json.loads(path.read_text(encoding="utf-8"))["summary"]
+    with _lock:
+        _summary_cache[path] = (mtime, text)
+        _summary_cache.move_to_end(path)
+        if len(_summary_cache) > _SUMMARY_CACHE_SIZE:
+            _summary_cache.popitem(last=False)
+    return text
+
+
+def _all_summaries(root: Path) -> dict[int, str]:
+    try:
+        mtime = root.stat().st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    with _lock:
+        hit = _dir_cache.get(root)
+        if hit and hit[0] == mtime:
+            _dir_cache.move_to_end(root)
+            return hit[1]
+    out: dict[int, str] = {}
+    for entry in os.scandir(root):
+        name = entry.name
+        if name.startswith("ch") and name.endswith(".json") and name[2:-5].isdigit():
+            text = _read_summary(Path(entry.path))
+            if text is not None:
+                out[int(name[2:-5])] = text
+    if time.time_ns() - mtime > _RACY_NS:
+        with _lock:
+            _dir_cache[root] = (mtime, out)
+            _dir_cache.move_to_end(root)
+            if len(_dir_cache) > _DIR_CACHE_SIZE:
+                _dir_cache.popitem(last=False)
+    return out
+
+
+def load_summaries(pid: str, up_to: int) -> dict[int, str]:
+    """On‑disk summaries for chapters 1..up_to‑1 (missing ones skipped)."""
+    summaries = _all_summaries(pj.NOVELIST_ROOT / pid / "summaries")
+    return {i: summaries[i] for i in sorted(summaries) if i < up_to}
+
+# ---------------------------------------------------------------- assembly
+
+def _line(num: int, text: str) -> str:
+    return f"Ch {num}: {text}"
+
+
+def _arc(block: list[tuple[int, str]]) -> str:
+    """Roll a run of chapter summaries into one line of ≤ARC_CHARS."""
+    share = max(20, ARC_CHARS // len(block))
+    parts = []
+    for _, text in block:
+        text = re.sub(r"\s+", " ", text).strip()
+        parts.append(text if len(text) <= share else text[: share - 1].rstrip() + "…")
+    first, last = block[0][0], block[-1][0]
+    label = f"Ch {first}" if first == last else f"Ch {first}–{last}"
+    return f"{label} (arc): " + " ".join(parts)
+
+
+def _arcs(items: list[tuple[int, str]], size: int) -> list[str]:
+    return [_arc(items[i : i + size]) for i in range(0, len(items), size)]
+
+
+def _fit(lines: list[str], budget: int) -> bool:
+    return sum(count_tokens(l) + 1 for l in lines) <= budget
+
+
+def assemble(summaries: dict[int, str], budget: int) -> list[str]:
+    """Pure budgeted assembly: verbatim tail + widening arcs for the rest."""
+    items = sorted(summaries.items())
+    recent: list[str] = []
+    used = 0
+    cut = len(items)
+    while cut > 0 and len(recent) < RECENT:
+        line = _line(*items[cut - 1])
+        cost = count_tokens(line) + 1
+        if used + cost > budget // 2 and recent:
+            break
+        recent.insert(0, line)
+        used += cost
+        cut -= 1
+
+    older = items[:cut]
+    size = ARC_SIZE
+    arcs = _arcs(older, size) if older else []
+    while arcs and not _fit(arcs, budget - used) and size < len(older):
+        size *= 2
+        arcs = _arcs(older, size)
+    while arcs and not _fit(arcs, budget - used):
+        arcs.pop(0)  # even a single arc overflows; drop the oldest first
+    return arcs + recent
+
+
+_context_cache: OrderedDict[tuple[str, int], tuple[str, list[str]]] = OrderedDict()
+
+
+def build_context(
+    pid: str,
+    num: int,
+    summaries: dict[int, str] | None = None,
+    budget: int | None = None,
+) -> list[str]:
+    """
+    Continuity lines for drafting chapter *num*.
+    summaries – {chapter: summary} override (e.g. outline stand‑ins);
+                defaults to the on‑disk summaries.
+    """
+    if summaries is None:
+        summaries = load_summaries(pid, num)
+    budget = budget or CONTEXT_TOKENS
+    fp = hashlib.sha1(
+        json.dumps([budget, sorted(summaries.items())]).encode("utf-8")
+    ).hexdigest()
+
+    key = (pid, num)
+    with _lock:
+        hit = _context_cache.get(key)
+        if hit and hit[0] == fp:
+            _context_cache.move_to_end(key)
+            return list(hit[1])
+
+    lines = assemble(summaries, budget)
+    with _lock:
+        _context_cache[key] = (fp, lines)
+        _context_cache.move_to_end(key)
+        if len(_context_cache) > _CACHE_SIZE:
+            _context_cache.popitem(last=False)
+    return list(lines)
@@ -0,0 +1,32 @@
+# v2025‑07‑05‑AI-generated
+"""
+core/db.py
+Shared SQLite connection helper.
+
+One connection per (process, thread, file), WAL journal and a generous
+busy timeout so API and several Celery processes can share a database
+file without "database is locked" errors.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+_local = threading.local()
+
+
+def connect(path: Path | str) -> sqlite3.Connection:
+    conns: dict[tuple[int, str], sqlite3.Connection] = getattr(_local, "conns", None) or {}
+    _local.conns = conns
+    key = (os.getpid(), str(path))
+    conn = conns.get(key)
+    if conn is None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conns[key] = conn
+    return conn
@@ -1,55 +1,259 @@
 # v2025‑07‑01‑AI-generated
 """
 core/draft.py – chapter generator (uses cost logger & theme advisor)
+agenerate_chapter is the coroutine core; generate_chapter blocks on it.
+
+Streaming mode (STREAM_CHAPTERS=1, default) appends tokens to
+chapters/chNN.md.part as they arrive and publishes them on the task's
+event channel; the finished prose is then written to chNN.md.
+
+Length is budgeted by core.length: max_tokens from target_words, an
+early stop at a sentence end once the streamed word count passes the
+target, and a continuation request (not a redraft) for short chapters;
+over / undershoot lands in reports/chNN.length.json.
+
+Post‑processing is split into stages so a drafting worker can move on
+as soon as the prose is committed:
+    draft → summary (LLM) → checks (beats + themes, CPU only)
+Stage progress lives in reports/status.json; a chapter is "complete"
+only once every stage is done. The manifest's draft_status follows it:
+a finished draft job sets "drafted" (mark_drafted), and the stage mark
+that completes the last outline chapter sets "ready" – so "ready" never
+shows while summaries or checks are still queued.
+generate_chapter(postprocess=True) runs the stages inline; Celery
+chains them on separate queues instead.
+summarize_chapters runs stage 2 for a whole set (SUMMARY_MODE=batch).
+Each draft records its provenance (core.revise) for outline revisions.
 """
 from __future__ import annotations
-import json, os
+import json, os, time
+from contextlib import aclosing
 from pathlib import Path
 from typing import Any
-from core.openai_wrap import chat_completion
+from core.openai_wrap import achat_completion, astream_completion, run_sync
 import core.env  # .env loader
+from core import context as cx
+from core import events as ev
+from core import ledger, metrics, revise
 from core import projects as pj
 from core.prompt_builders import draft_prompt
-from core import summarizer as sz, beats as bt
+from core import summarizer as sz, beats as bt, textscan as ts
+from core import length as ln
 
 OPENAI_MODEL = os.getenv("CHAPTER_MODEL", "gpt-4o-mini")
+STREAM_CHAPTERS = os.getenv("STREAM_CHAPTERS", "1") == "1"
+FLUSH_SECS = 0.05  # token batching window for disk + pub/sub
+STAGES = ("draft", "summary", "checks")
+STATUS_FILE = "reports/status.json"
 
 def _outline(pid: str) -> dict[str, Any]:
     return json.loads((pj.NOVELIST_ROOT / pid / "outline.json").read_text())
 
-def _priors(pid: str, up_to: int) -> list[str]:
-    root = pj.NOVELIST_ROOT / pid / "summaries"
-    out = []
-    for i in range(1, up_to):
-        p = root / f"ch{i:02d}.json"
-        if p.exists():
-            out.append(json.loads(p.read_text())["summary"])
-    return out
+def _spec(pid: str, num: int) -> dict[str, Any]:
+    return next(c for c in _outline(pid)["chapters"] if c["num"] == num)
 
-def generate_chapter(pid: str, num: int) -> str:
-    outline = _outline(pid)
-    spec = next(c for c in outline["chapters"] if c["num"] == num)
-    messages = draft_prompt(spec, _priors(pid, num))
-    resp = chat_completion(model=OPENAI_MODEL, messages=messages)
-    prose = resp.choices[0].message.content.strip()
+def _prose(pid: str, num: int) -> str:
+    return (pj.NOVELIST_ROOT / pid / "chapters" / f"ch{num:02d}.md").read_text(encoding="utf-8")
+
+def _mark(pid: str, num: int, **stages: str) -> None:
+    def _apply(status: dict[str, Any]) -> dict[str, Any]:
+        ch = {**status.get(str(num), {}), **stages}
+        ch["complete"] = all(ch.get(s) == "done" for s in STAGES)
+        status[str(num)] = ch
+        return status
+    with pj.project_lock(pid):
+        _draft_status(pid, pj.update_json(pid, STATUS_FILE, _apply, {}))
+
+def _draft_status(pid: str, status: dict[str, Any], drafted: bool = False) -> None:
+    """"ready" once every outline chapter is complete; else "drafted" (if *drafted* or it was ready)."""
+    done = all(status.get(str(c["num"]), {}).get("complete") for c in _outline(pid)["chapters"])
+    current = pj.load_manifest(pid).get("draft_status")
+    want = "ready" if done else "drafted" if drafted or current == "ready" else current
+    if want != current:
+        pj.update_manifest(pid, draft_status=want)
+
+def mark_drafted(pid: str) -> None:
+    """A draft job finished: "drafted" until the last summary / check lands, then "ready"."""
+    with pj.project_lock(pid):
+        _draft_status(pid, chapter_status(pid), drafted=True)
+
+def chapter_status(pid: str) -> dict[str, Any]:
+    p = pj.NOVELIST_ROOT / pid / STATUS_FILE
+    return json.loads(p.read_text(encoding="utf-8")) if p.exists() else {}
+
+
+async def _stream_prose(
+    messages: list[dict], part: Path, num: int, task_id: str | None, cache: bool,
+    max_tokens: int, target: int, mode: str = "w",
+) -> tuple[str, bool]:
+    """
+    Append tokens to *part* and publish them in ~FLUSH_SECS batches.
+    Returns (text, stopped) – stopped when the word budget ended the stream.
+    """
+    chunks: list[str] = []
+    pending: list[str] = []
+    counter = ln.Counter(target)
+    stopped = False
+    last = time.monotonic()
+    with part.open(mode, encoding="utf-8") as fh:
+        def _flush() -> None:
+            text = "".join(pending)
+            pending.clear()
+            fh.write(text)
+            fh.flush()
+            ev.publish(task_id, {"type": "token", "chapter": num, "text": text})
+
+        stream = astream_completion(model=OPENAI_MODEL, messages=messages, max_tokens=max_tokens, cache=cache)
+        async with aclosing(stream):
+            async for delta in stream:
+                cut = counter.feed(delta)
+                if cut is not None:
+                    delta, stopped = cut, True
+                chunks.append(delta)
+                pending.append(delta)
+                if stopped:
+                    break
+                if time.monotonic() - last >= FLUSH_SECS:
+                    _flush()
+                    last = time.monotonic()
+        if pending:
+            _flush()
+    return "".join(chunks).strip(), stopped
+
+async def _complete(
+    messages: list[dict], part: Path, num: int, task_id: str | None, cache: bool,
+    stream: bool, max_tokens: int, target: int, mode: str = "w",
+) -> tuple[str, bool]:
+    if stream:
+        text, stopped = await _stream_prose(messages, part, num, task_id, cache, max_tokens, target, mode)
+    else:
+        resp = await achat_completion(model=OPENAI_MODEL, messages=messages, max_tokens=max_tokens, cache=cache)
+        text, stopped = resp.choices[0].message.content.strip(), False
+        if resp.choices[0].finish_reason == "length":
+            text, stopped = ln.trim_partial(text), True
+    return text, stopped
+
+def generate_chapter(
+    pid: str,
+    num: int,
+    priors: dict[int, str] | None = None,
+    stream: bool | None = None,
+    task_id: str | None = None,
+    force: bool = False,
+    postprocess: bool = True,
+) -> str:
+    """
+    priors – {chapter: summary} for chapters 1..num‑1; defaults to the
+    on‑disk summaries (bulk drafting passes outline stand‑ins instead).
+    Either way they are fitted to a token budget by core.context.
+    stream – default STREAM_CHAPTERS; task_id – event channel for tokens
+    force – bypass the LLM response cache (explicit regeneration)
+    postprocess – run summary + checks inline (False: caller schedules them)
+    """
+    return run_sync(agenerate_chapter(pid, num, priors, stream, task_id, force, postprocess))
+
+async def agenerate_chapter(
+    pid: str,
+    num: int,
+    priors: dict[int, str] | None = None,
+    stream: bool | None = None,
+    task_id: str | None = None,
+    force: bool = False,
+    postprocess: bool = True,
+) -> str:
+    with ledger.tagged(pid=pid, chapter=num, kind="draft"):
+        path = await _agenerate_chapter(pid, num, priors, stream, task_id, force)
+    if postprocess:
+        await asummarize_chapter(pid, num)
+        check_chapter(pid, num)
+    return path
+
+async def _agenerate_chapter(
+    pid: str,
+    num: int,
+    priors: dict[int, str] | None,
+    stream: bool | None,
+    task_id: str | None,
+    force: bool,
+) -> str:
+    with metrics.span("draft.prompt"):
+        spec = _spec(pid, num)
+        messages = draft_prompt(spec, cx.build_context(pid, num, priors))
 
     root = pj.NOVELIST_ROOT / pid
     (root / "chapters").mkdir(exist_ok=True)
     ch_path = root / "chapters" / f"ch{num:02d}.md"
-    ch_path.write_text(prose, encoding="utf-8")
+    part = ch_path.with_suffix(".md.part")
+
+    streaming = STREAM_CHAPTERS if stream is None else stream
+    target = int(spec["target_words"])
+    limit = ln.max_tokens(target)
+    with metrics.span("draft.llm"):
+        prose, stopped = await _complete(messages, part, num, task_id, not force, streaming, limit, target)
+        extra = 0
+        while extra < ln.CONTINUATIONS and ln.short(prose, target):
+            extra += 1
+            missing = bt.verify_beats(prose, spec.get("beats", []))["missing"]
+            more_msgs, more_limit = ln.continuation(messages, prose, target, missing)
+            if streaming:
+                with part.open("a", encoding="utf-8") as fh:
+                    fh.write("\n\n")
+            with metrics.span("draft.continue"):
+                more, _ = await _complete(more_msgs, part, num, task_id, not force, streaming, more_limit,
+                                          target - ln.words(prose), mode="a")
+            if not more:
+                break
+            prose = f"{prose}\n\n{more}"
+
+    with metrics.span("draft.write"):
+        length = ln.stats(prose, target, limit, extra, stopped)
+        pj.commit_chapter(pid, num, prose=prose)
+        pj.atomic_write_json(root / "reports" / f"ch{num:02d}.length.json", length)
+        metrics.chapter_length(length["ratio"])
+        part.unlink(missing_ok=True)
+        _mark(pid, num, draft="done", summary="pending", checks="pending")
+        revise.record(pid, num, spec, priors if priors is not None else cx.load_summaries(pid, num))
+    ev.publish(task_id, {"type": "chapter_done", "chapter": num})
+    return str(ch_path)
+
+# ---------------------------------------------------------------- stages
+
+def summarize_chapter(pid: str, num: int) -> str:
+    return run_sync(asummarize_chapter(pid, num))
 
-    # summary
-    (root / "summaries").mkdir(exist_ok=True)
-    (root / "summaries" / f"ch{num:02d}.json").write_text(
-        json.dumps({"summary": sz.summarize(prose)}, indent=2), encoding="utf-8"
-    )
+async def asummarize_chapter(pid: str, num: int) -> str:
+    """Stage 2 – continuity summary (one LLM call)."""
+    with ledger.tagged(pid=pid, chapter=num), metrics.span("summary"):
+        summary = await sz.asummarize(_prose(pid, num))
+        pj.commit_chapter(pid, num, summary=summary)
+        _mark(pid, num, summary="done")
+    return summary
 
-    # beat report
-    (root / "reports").mkdir(exist_ok=True)
-    beats = spec.get("beats", [])
-    (root / "reports" / f"ch{num:02d}.beats.json").write_text(
-        json.dumps(bt.verify_beats(prose, beats), indent=2), encoding="utf-8"
-    )
+def summarize_chapters(pid: str, nums: list[int]) -> dict[int, str]:
+    return run_sync(asummarize_chapters(pid, nums))
+
+async def asummarize_chapters(pid: str, nums: list[int]) -> dict[int, str]:
+    """Stage 2 for many chapters at once (batched when SUMMARY_MODE=batch)."""
+    with ledger.tagged(pid=pid), metrics.span("summary.batch", chapters=len(nums)):
+        summaries = await sz.asummarize_many({n: _prose(pid, n) for n in nums})
+    for n, summary in summaries.items():
+        pj.commit_chapter(pid, n, summary=summary)
+        _mark(pid, n, summary="done")
+    return summaries
+
+def check_chapter(pid: str, num: int) -> dict[str, Any]:
+    """Stage 3 – beat verification and theme scoring (CPU only)."""
+    with metrics.span("checks", pid=pid, chapter=num):
+        return _check_chapter(pid, num)
+
+def _check_chapter(pid: str, num: int) -> dict[str, Any]:
+    prose = _prose(pid, num)
+    outline = _outline(pid)
+    spec = next(c for c in outline["chapters"] if c["num"] == num)
+    # one automaton pass for beats + themes; the checks below hit the scan cache
+    ts.scan(prose, spec.get("beats", []) + outline.get("themes", []))
+    beats = bt.verify_beats(prose, spec.get("beats", []))
+    pj.commit_chapter(pid, num, beats=beats)
 
     # theme advisor
     try:
@@ -58,4 +262,5 @@ def generate_chapter(pid: str, num: int) -> str:
     except Exception:
         pass
 
-    return str(ch_path)
+    _mark(pid, num, checks="done")
+    return beats
@@ -0,0 +1,186 @@
+# v2025‑07‑04‑AI-generated
+"""
+core/events.py
+Best‑effort task event bus over Redis pub/sub.
+
+Workers publish small JSON events on
+    novelist:task:<task_id>
+– streamed chapter tokens, every update_state() and the final state (see
+core.celery_app). Events other than tokens are also appended to a short
+replay list novelist:replay:<task_id>, so a client that connects late
+still sees the history. A watcher that falls behind loses tokens, never
+state events: those evict a queued token when its queue is full. Publishing never raises: a missing Redis only
+means nobody sees the live feed.
+
+In the API, `hub` holds ONE pattern subscription for all tasks and fans
+messages out to the local watchers, so N WebSocket clients cost one
+Redis connection instead of N subscriptions plus N result‑backend polls.
+
+Environment variables:
+    EVENTS_URL          default = BROKER_URL
+    EVENTS_REPLAY       default 100    events kept per task for late joiners
+    EVENTS_REPLAY_TTL   default 86400  seconds the replay list lives
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+import redis
+import redis.asyncio as aioredis
+
+import core.env  # loads .env
+
+EVENTS_URL = os.getenv("EVENTS_URL", os.getenv("BROKER_URL", "redis://localhost:6379/0"))
+REPLAY = int(os.getenv("EVENTS_REPLAY", "100"))
+REPLAY_TTL = int(os.getenv("EVENTS_REPLAY_TTL", "86400"))
+PREFIX = "novelist:task:"
+REPLAY_PREFIX = "novelist:replay:"
+QUEUE_MAX = 1000  # per watcher; tokens are dropped for clients that fall behind
+
+_client: redis.Redis | None = None
+
+
+def channel(task_id: str) -> str:
+    return f"{PREFIX}{task_id}"
+
+
+def _redis() -> redis.Redis:
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(EVENTS_URL)
+    return _client
+
+
+def publish(task_id: str | None, event: dict[str, Any], replay: bool | None = None) -> None:
+    """Send *event*; it is kept for replay unless it is a token (or replay=False)."""
+    if not task_id:
+        return
+    data = json.dumps(event, default=str)
+    if replay is None:
+        replay = event.get("type") != "token"
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        if replay:
+            key = REPLAY_PREFIX + task_id
+            pipe.rpush(key, data)
+            pipe.ltrim(key, -REPLAY, -1)
+            pipe.expire(key, REPLAY_TTL)
+        pipe.publish(channel(task_id), data)
+        pipe.execute()
+    except (redis.RedisError, ValueError):  # unreachable or non‑Redis URL
+        pass
+
+# ---------------------------------------------------------------- fan‑out
+
+def _is_token(data: bytes) -> bool:
+    try:
+        return json.loads(data).get("type") == "token"
+    except ValueError:
+        return False
+
+
+def _make_room(q: asyncio.Queue) -> None:
+    """Free one slot in a full watcher queue: the oldest token, else the oldest event."""
+    items = [q.get_nowait() for _ in range(q.qsize())]
+    drop = next((i for i, d in enumerate(items) if _is_token(d)), 0)
+    del items[drop]
+    for d in items:
+        q.put_nowait(d)
+
+
+class Hub:
+    """One psubscribe on novelist:task:* shared by every local watcher."""
+
+    def __init__(self, url: str = EVENTS_URL):
+        self.url = url
+        self._watchers: dict[str, set[asyncio.Queue]] = {}
+        self._finished: OrderedDict[str, list[bytes]] = OrderedDict()
+        self._redis: aioredis.Redis | None = None
+        self._reader: asyncio.Task | None = None
+
+    def _start(self) -> None:
+        if self._reader is None or self._reader.done():
+            self._redis = self._redis or aioredis.Redis.from_url(self.url)
+            self._reader = asyncio.create_task(self._read())
+
+    async def _read(self) -> None:
+        resync = False
+        while True:
+            try:
+                async with self._redis.pubsub() as ps:
+                    await ps.psubscribe(PREFIX + "*")
+                    if resync:  # re‑deliver what was published while we were away
+                        for task_id in list(self._watchers):
+                            for raw in await self._redis.lrange(REPLAY_PREFIX + task_id, 0, -1):
+                                self._dispatch(task_id, raw)
+                    resync = True
+                    async for msg in ps.listen():
+                        if msg["type"] == "pmessage":
+                            self._dispatch(msg["channel"].decode()[len(PREFIX):], msg["data"])
+            except (redis.RedisError, OSError):
+                await asyncio.sleep(1)  # reconnect; watchers keep waiting
+
+    def _dispatch(self, task_id: str, data: bytes) -> None:
+        for q in self._watchers.get(task_id, ()):
+            try:
+                q.put_nowait(data)
+            except asyncio.QueueFull:
+                if not _is_token(data):
+                    _make_room(q)
+                    q.put_nowait(data)
+
+    async def replay(self, task_id: str) -> list[bytes]:
+        if task_id in self._finished:
+            self._finished.move_to_end(task_id)
+            return self._finished[task_id]
+        try:
+            past = await self._redis.lrange(REPLAY_PREFIX + task_id, 0, -1)
+        except (redis.RedisError, OSError):
+            return []
+        if past and json.loads(past[-1]).get("final"):
+            self._finished[task_id] = past  # immutable from now on
+            if len(self._finished) > 256:
+                self._finished.popitem(last=False)
+        return past
+
+    @asynccontextmanager
+    async def watch(self, task_id: str) -> AsyncIterator[tuple[list[dict], AsyncIterator[dict]]]:
+        """(history, live events) for *task_id*; live skips what history had."""
+        self._start()
+        q: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_MAX)
+        self._watchers.setdefault(task_id, set()).add(q)  # before replay: no gap
+        try:
+            past = await self.replay(task_id)
+            yield [json.loads(raw) for raw in past], self._live(q, set(past))
+        finally:
+            subs = self._watchers.get(task_id)
+            subs.discard(q)
+            if not subs:
+                del self._watchers[task_id]
+
+    @staticmethod
+    async def _live(q: asyncio.Queue, seen: set[bytes]) -> AsyncIterator[dict]:
+        while True:
+            raw = await q.get()
+            if raw in seen:
+                continue
+            event = json.loads(raw)
+            if event.get("type") != "token":
+                seen.add(raw)
+            yield event
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._redis is not None:
+            await self._redis.aclose()
+        self._reader = self._redis = None
+
+
+hub = Hub()
@@ -0,0 +1,362 @@
+# v2025‑07‑09‑AI-generated
+"""
+core/export.py
+Whole‑book export to Markdown, EPUB 3 or DOCX.
+
+stream(pid, fmt) yields the file as byte chunks, one chapter at a time
+in outline order, so memory stays at roughly one chapter whatever the
+book length; write(pid, fmt) saves the same stream to
+exports/<pid>.<ext> atomically. EPUB and DOCX are zip containers
+written with zipfile in streaming mode – no pandoc or extra packages.
+
+Each chapter's rendered fragment is cached under exports/.fragments/
+keyed by a hash of (format, title, prose), so re‑exporting after one
+chapter changed re‑renders only that chapter. Undrafted chapters are
+skipped.
+
+Markdown support is what drafts use: # headings, paragraphs,
+*em* / _em_, **strong** and scene breaks (***, ---).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import html
+import io
+import json
+import os
+import re
+import tempfile
+import uuid
+import zipfile
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+from core import projects as pj
+
+FORMATS = {"md": "text/markdown", "epub": "application/epub+zip",
+           "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document"}
+EXPORT_DIR = "exports"
+RENDER_VERSION = "1"  # bump to invalidate cached fragments
+
+_BREAK = re.compile(r"^\s*(?:\*\s*){3,}$|^\s*-{3,}\s*$")
+_INLINE = re.compile(r"(\*\*.+?\*\*|\*[^*\s][^*]*?\*|_[^_\s][^_]*?_)")
+
+# ---------------------------------------------------------------- book
+
+def _book(pid: str) -> tuple[dict[str, Any], list[tuple[int, str, Path]]]:
+    root = pj.NOVELIST_ROOT / pid
+    manifest = pj.load_manifest(pid)
+    outline = json.loads((root / "outline.json").read_text(encoding="utf-8"))
+    chapters = []
+    for c in sorted(outline["chapters"], key=lambda c: c["num"]):
+        path = root / "chapters" / f"ch{c['num']:02d}.md"
+        if path.exists():
+            chapters.append((c["num"], c["title"], path))
+    return manifest, chapters
+
+
+def _blocks(prose: str) -> Iterator[tuple[str, Any]]:
+    """("h", (level, text)) | ("p", text) | ("break", None)"""
+    for block in re.split(r"\n\s*\n", prose.strip()):
+        if _BREAK.match(block):
+            yield "break", None
+        elif m := re.match(r"^(#{1,6})\s+(.*)", block):
+            yield "h", (len(m.group(1)), m.group(2).strip())
+        elif block.strip():
+            yield "p", " ".join(line.strip() for line in block.splitlines())
+
+
+def _runs(text: str) -> Iterator[tuple[str, bool, bool]]:
+    """(text, bold, italic) runs of one paragraph."""
+    for part in _INLINE.split(text):
+        if not part:
+            continue
+        if part.startswith("**") and part.endswith("**") and len(part) > 4:
+            yield part[2:-2], True, False
+        elif part[0] in "*_" and part[-1] == part[0] and len(part) > 2:
+            yield part[1:-1], False, True
+        else:
+            yield part, False, False
+
+
+def _has_heading(prose: str) -> bool:
+    return prose.lstrip().startswith("#")
+
+# ---------------------------------------------------------------- fragments
+
+def _md(num: int, title: str, prose: str) -> str:
+    head = "" if _has_heading(prose) else f"# Chapter {num}: {title}\n\n"
+    return f"{head}{prose.strip()}\n\n"
+
+
+def _xhtml(num: int, title: str, prose: str) -> str:
+    body = [] if _has_heading(prose) else [f"<h1>Chapter {num}: {html.escape(title)}</h1>"]
+    for kind, val in _blocks(prose):
+        if kind == "break":
+            body.append('<hr class="scene"/>')
+        elif kind == "h":
+            body.append(f"<h{val[0]}>{html.escape(val[1])}</h{val[0]}>")
+        else:
+            runs = "".join(
+                f"<strong>{html.escape(t)}</strong>" if b else f"<em>{html.escape(t)}</em>" if i
+                else html.escape(t)
+                for t, b, i in _runs(val)
+            )
+            body.append(f"<p>{runs}</p>")
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">'
+        f"<head><title>{html.escape(title)}</title></head><body>"
+        + "\n".join(body) + "</body></html>"
+    )
+
+
+def _w_para(runs: list[tuple[str, bool, bool]], style: str | None = None, page_break=False) -> str:
+    ppr = f'<w:pStyle w:val="{style}"/>' if style else ""
+    if page_break:
+        ppr += "<w:pageBreakBefore/>"
+    out = [f"<w:p><w:pPr>{ppr}</w:pPr>" if ppr else "<w:p>"]
+    for text, bold, italic in runs:
+        rpr = ("<w:b/>" if bold else "") + ("<w:i/>" if italic else "")
+        out.append(
+            (f"<w:r><w:rPr>{rpr}</w:rPr>" if rpr else "<w:r>")
+            + f'<w:t xml:space="preserve">{html.escape(text, quote=False)}</w:t></w:r>'
+        )
+    return "".join(out) + "</w:p>"
+
+
+def _docx(num: int, title: str, prose: str) -> str:
+    out = [] if _has_heading(prose) else [
+        _w_para([(f"Chapter {num}: {title}", False, False)], "Heading1", page_break=True)
+    ]
+    for kind, val in _blocks(prose):
+        if kind == "break":
+            out.append(_w_para([("* * *", False, False)], "SceneBreak"))
+        elif kind == "h":
+            out.append(_w_para([(val[1], False, False)], f"Heading{min(val[0], 3)}",
+                               page_break=not out and val[0] == 1))
+        else:
+            out.append(_w_para(list(_runs(val))))
+    return "".join(out)
+
+
+_RENDER: dict[str, Callable[[int, str, str], str]] = {"md": _md, "epub": _xhtml, "docx": _docx}
+
+
+def _fragment(pid: str, fmt: str, num: int, title: str, path: Path, used: set[str]) -> str:
+    prose = path.read_text(encoding="utf-8")
+    key = hashlib.sha1(f"{RENDER_VERSION}\0{fmt}\0{num}\0{title}\0{prose}".encode()).hexdigest()
+    used.add(key)
+    cached = pj.NOVELIST_ROOT / pid / EXPORT_DIR / ".fragments" / fmt / f"{key}.frag"
+    if cached.exists():
+        return cached.read_text(encoding="utf-8")
+    frag = _RENDER[fmt](num, title, prose)
+    pj.atomic_write_text(cached, frag)
+    return frag
+
+
+def _prune(pid: str, fmt: str, used: set[str]) -> None:
+    for p in (pj.NOVELIST_ROOT / pid / EXPORT_DIR / ".fragments" / fmt).glob("*.frag"):
+        if p.stem not in used:
+            p.unlink(missing_ok=True)
+
+# ---------------------------------------------------------------- containers
+
+class _Sink(io.RawIOBase):
+    """
+    Byte sink emptied by drain(). Unseekable by default, so zipfile
+    streams entries with data descriptors. seekable=True allows seeks
+    back into what has not been drained yet: zipfile then patches each
+    local header in place and writes no descriptors – drain only between
+    entries.
+    """
+
+    def __init__(self, seekable: bool = False):
+        self._buf = io.BytesIO()
+        self._base = 0  # bytes drained so far
+        self._seekable = seekable
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return self._seekable
+
+    def tell(self) -> int:
+        return self._base + self._buf.tell()
+
+    def seek(self, pos: int, whence: int = io.SEEK_SET) -> int:
+        if not self._seekable or whence == io.SEEK_SET and pos < self._base:
+            raise io.UnsupportedOperation("seek")
+        self._buf.seek(pos - self._base if whence == io.SEEK_SET else pos, whence)
+        return self.tell()
+
+    def write(self, b) -> int:
+        return self._buf.write(b)
+
+    def drain(self) -> bytes:
+        out = self._buf.getvalue()
+        self._base += len(out)
+        self._buf = io.BytesIO()
+        return out
+
+
+def _epub(manifest: dict[str, Any], frags: Iterator[tuple[int, str, str]]) -> Iterator[bytes]:
+    # every entry is written whole, so headers can be patched before the
+    # drain: OCF forbids a data descriptor on the leading STORED mimetype
+    sink = _Sink(seekable=True)
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        zf.writestr("META-INF/container.xml", (
+            '<?xml version="1.0"?><container version="1.0" '
+            'xmlns="urn:oasis:names:tc:opendocument:xmlns:container"><rootfiles>'
+            '<rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+            "</rootfiles></container>"
+        ))
+        yield sink.drain()
+        toc = []
+        for num, title, frag in frags:
+            zf.writestr(f"OEBPS/ch{num:02d}.xhtml", frag)
+            toc.append((num, title))
+            yield sink.drain()
+
+        items = "".join(
+            f'<item id="ch{n:02d}" href="ch{n:02d}.xhtml" media-type="application/xhtml+xml"/>'
+            for n, _ in toc
+        )
+        spine = "".join(f'<itemref idref="ch{n:02d}"/>' for n, _ in toc)
+        zf.writestr("OEBPS/content.opf", (
+            '<?xml version="1.0" encoding="utf-8"?>'
+            '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="id">'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+            f'<dc:identifier id="id">urn:uuid:{uuid.uuid5(uuid.NAMESPACE_URL, manifest["id"])}</dc:identifier>'
+            f"<dc:title>{html.escape(manifest.get('title', ''))}</dc:title>"
+            f"<dc:creator>{html.escape(manifest.get('author', ''))}</dc:creator>"
+            "<dc:language>en</dc:language>"
+            f'<meta property="dcterms:modified">{manifest.get("created_at", "")[:19]}Z</meta>'
+            "</metadata><manifest>"
+            '<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>'
+            f"{items}</manifest><spine>{spine}</spine></package>"
+        ))
+        links = "".join(
+            f'<li><a href="ch{n:02d}.xhtml">Chapter {n}: {html.escape(t)}</a></li>' for n, t in toc
+        )
+        zf.writestr("OEBPS/nav.xhtml", (
+            '<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html>\n'
+            '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">'
+            "<head><title>Contents</title></head><body>"
+            f'<nav epub:type="toc"><h1>Contents</h1><ol>{links}</ol></nav></body></html>'
+        ))
+    yield sink.drain()
+
+
+_DOCX_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    "</Types>"
+)
+_DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="word/document.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    "</Relationships>"
+)
+_DOC_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="styles.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"/>'
+    "</Relationships>"
+)
+_W = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+
+def _style(sid: str, name: str, size: int, bold: bool = True, center: bool = False) -> str:
+    ppr = '<w:pPr><w:jc w:val="center"/><w:spacing w:before="240" w:after="240"/></w:pPr>' if center \
+        else '<w:pPr><w:spacing w:before="240" w:after="120"/></w:pPr>'
+    return (
+        f'<w:style w:type="paragraph" w:styleId="{sid}"><w:name w:val="{name}"/>'
+        f'<w:basedOn w:val="Normal"/>{ppr}<w:rPr>{"<w:b/>" if bold else ""}'
+        f'<w:sz w:val="{size}"/></w:rPr></w:style>'
+    )
+
+
+_DOCX_STYLES = (
+    f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:styles {_W}>'
+    '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/>'
+    '<w:pPr><w:spacing w:after="120" w:line="360" w:lineRule="auto"/></w:pPr>'
+    '<w:rPr><w:sz w:val="24"/></w:rPr></w:style>'
+    + _style("Title", "Title", 56, center=True)
+    + _style("Subtitle", "Subtitle", 32, bold=False, center=True)
+    + _style("Heading1", "heading 1", 36)
+    + _style("Heading2", "heading 2", 30)
+    + _style("Heading3", "heading 3", 26)
+    + _style("SceneBreak", "Scene Break", 24, bold=False, center=True)
+    + "</w:styles>"
+)
+
+
+def _docx_pkg(manifest: dict[str, Any], frags: Iterator[tuple[int, str, str]]) -> Iterator[bytes]:
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", _DOCX_TYPES)
+        zf.writestr("_rels/.rels", _DOCX_RELS)
+        zf.writestr("word/_rels/document.xml.rels", _DOC_RELS)
+        zf.writestr("word/styles.xml", _DOCX_STYLES)
+        with zf.open("word/document.xml", "w", force_zip64=True) as doc:
+            doc.write(
+                f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:document {_W}><w:body>'.encode()
+                + _w_para([(manifest.get("title", ""), False, False)], "Title").encode()
+                + _w_para([(manifest.get("author", ""), False, False)], "Subtitle").encode()
+            )
+            yield sink.drain()
+            for _, _, frag in frags:
+                doc.write(frag.encode())
+                yield sink.drain()
+            doc.write(b"</w:body></w:document>")
+    yield sink.drain()
+
+# ---------------------------------------------------------------- public
+
+def stream(pid: str, fmt: str) -> Iterator[bytes]:
+    """The exported book as byte chunks (raises ValueError for unknown formats)."""
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    manifest, chapters = _book(pid)
+    used: set[str] = set()
+    frags = ((n, t, _fragment(pid, fmt, n, t, p, used)) for n, t, p in chapters)
+    if fmt == "md":
+        yield f"% {manifest.get('title', '')}\n% {manifest.get('author', '')}\n\n".encode()
+        for _, _, frag in frags:
+            yield frag.encode()
+    else:
+        yield from (_epub if fmt == "epub" else _docx_pkg)(manifest, frags)
+    _prune(pid, fmt, used)
+
+
+def filename(pid: str, fmt: str) -> str:
+    return f"{pid}.{fmt}"
+
+
+def write(pid: str, fmt: str) -> Path:
+    """Save the export to exports/<pid>.<fmt> (temp file + rename)."""
+    out = pj.NOVELIST_ROOT / pid / EXPORT_DIR / filename(pid, fmt)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=out.parent, prefix=f".{out.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            for chunk in stream(pid, fmt):
+                fh.write(chunk)
+        os.replace(tmp, out)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+    return out
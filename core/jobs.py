@@ -0,0 +1,189 @@
+# v2025‑07‑14‑AI-generated
+"""
+core/jobs.py
+Persistent bulk‑draft job records: jobs/<job>.json in the project.
+
+    {"id", "status", "created", "updated",
+     "chapters": {"3": "pending" | "drafting" | "done" | "failed" | "cancelled"},
+     "kind"?: "speculative", "budget_usd"?: 0.25, "chapter_usd"?: 0.01,
+     "reason"?: "budget" | "superseded", "errors"?: {"3": "repr(exc)"}}
+
+Job status: running → done | failed, or paused / cancelled by the user
+(paused jobs go back to running on resume). Every chapter transition is
+a locked read‑modify‑write (projects.update_json), so a worker that
+dies mid‑run leaves an exact checkpoint: a redelivered or resumed job
+drafts only the chapters that are not done. The manifest's "draft_job"
+names the project's latest job (GET /projects/{pid}/draft);
+"speculative_job" names the latest speculative one, so an outline edit
+can still cancel it after other jobs were started.
+
+A job with "budget_usd" (speculative drafts after the outline) starts a
+chapter only if the ledger spend plus one "chapter_usd" per chapter in
+flight, this one included, stays within budget; otherwise claim()
+cancels the job. The check and the claim share one lock, so concurrent
+chapter tasks cannot overshoot together.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import json
+from typing import Any
+
+from core import ledger
+from core import projects as pj
+
+TERMINAL = ("done", "failed", "cancelled")
+
+
+class Stopped(Exception):
+    """The job was paused or cancelled before this chapter started."""
+
+
+def _rel(job: str) -> str:
+    return f"jobs/{job}.json"
+
+
+def _now() -> str:
+    return dt.datetime.utcnow().isoformat(timespec="seconds")
+
+
+def create(pid: str, job: str, nums: list[int], **extra: Any) -> dict[str, Any]:
+    """New running job for *nums*; an existing record (redelivery) is returned as is."""
+    def _apply(cur):
+        if cur is not None:
+            return cur
+        return {
+            "id": job, "status": "running", "created": _now(), "updated": _now(),
+            "chapters": {str(n): "pending" for n in nums}, **extra,
+        }
+    rec = pj.update_json(pid, _rel(job), _apply)
+    if extra.get("kind") == "speculative":
+        pj.update_manifest(pid, draft_job=job, speculative_job=job)
+    else:
+        pj.update_manifest(pid, draft_job=job)
+    return rec
+
+
+def load(pid: str, job: str | None = None) -> dict[str, Any] | None:
+    """Job *job*, or the project's latest one."""
+    job = job or pj.load_manifest(pid).get("draft_job")
+    path = pj.NOVELIST_ROOT / pid / _rel(job) if job else None
+    if path is None or not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def speculative(pid: str) -> dict[str, Any] | None:
+    """The project's latest speculative job if it is still running or paused."""
+    job = pj.load_manifest(pid).get("speculative_job")
+    rec = load(pid, job) if job else None
+    return rec if rec is not None and rec["status"] in ("running", "paused") else None
+
+
+def in_flight(rec: dict[str, Any]) -> set[int]:
+    return {int(n) for n, s in rec["chapters"].items() if s == "drafting"}
+
+
+def todo(rec: dict[str, Any]) -> list[int]:
+    """Chapters still to draft (interrupted "drafting" ones included)."""
+    return sorted(int(n) for n, s in rec["chapters"].items() if s in ("pending", "drafting"))
+
+
+def unfinished(rec: dict[str, Any]) -> set[int]:
+    return {int(n) for n, s in rec["chapters"].items() if s != "done"}
+
+
+def _settle(rec: dict[str, Any]) -> None:
+    if rec["status"] == "running" and all(s in TERMINAL for s in rec["chapters"].values()):
+        rec["status"] = "failed" if "failed" in rec["chapters"].values() else "done"
+
+
+def claim(pid: str, job: str, num: int, retake: bool = False) -> bool:
+    """
+    pending → drafting if the job is running; *retake* also reclaims an
+    interrupted chapter. Raises Stopped if this call cancelled a budgeted
+    job because the chapter would not fit.
+    """
+    rec = load(pid, job)
+    used = spent(pid, rec) if rec is not None and rec.get("budget_usd") else 0.0
+    ok = stopped = False
+    def _apply(rec):
+        nonlocal ok, stopped
+        state = rec["chapters"].get(str(num))
+        if rec["status"] != "running" or not (state == "pending" or retake and state == "drafting"):
+            return rec
+        if rec.get("budget_usd"):
+            reserved = (len(in_flight(rec) - {num}) + 1) * rec.get("chapter_usd", 0.0)
+            if used + reserved > rec["budget_usd"]:
+                stopped = _set(rec, "cancelled", "budget")
+                return rec
+        rec["chapters"][str(num)] = "drafting"
+        rec["updated"] = _now()
+        ok = True
+        return rec
+    pj.update_json(pid, _rel(job), _apply)
+    if stopped:
+        raise Stopped(num)
+    return ok
+
+
+def mark(pid: str, job: str, num: int, state: str, error: str | None = None) -> tuple[dict[str, Any], bool]:
+    """Set a chapter's state (*error*: why it failed); returns (record, True if this finished the job)."""
+    finished = False
+    def _apply(rec):
+        nonlocal finished
+        before = rec["status"]
+        rec["chapters"][str(num)] = state
+        if error is not None:
+            rec.setdefault("errors", {})[str(num)] = error
+        rec["updated"] = _now()
+        _settle(rec)
+        finished = before == "running" and rec["status"] in TERMINAL
+        return rec
+    return pj.update_json(pid, _rel(job), _apply), finished
+
+
+def _set(rec: dict[str, Any], status: str, reason: str | None) -> bool:
+    if rec["status"] in TERMINAL:
+        return False
+    rec["status"] = status
+    if reason:
+        rec["reason"] = reason
+    if status == "cancelled":
+        for n, s in rec["chapters"].items():
+            if s == "pending":
+                rec["chapters"][n] = "cancelled"
+    rec["updated"] = _now()
+    return True
+
+
+def set_status(pid: str, job: str, status: str, reason: str | None = None) -> dict[str, Any]:
+    """pause / resume / cancel; cancelling marks every chapter not started as cancelled."""
+    def _apply(rec):
+        _set(rec, status, reason)
+        return rec
+    return pj.update_json(pid, _rel(job), _apply)
+
+
+def spent(pid: str, rec: dict[str, Any]) -> float:
+    """USD the ledger has booked against the job's chapters."""
+    totals = ledger.chapter_totals(pid)
+    return round(sum(totals[int(n)]["usd"] for n in rec["chapters"] if int(n) in totals), 4)
+
+
+def progress(rec: dict[str, Any]) -> dict[str, Any]:
+    """API view: status, per‑state counts and per‑chapter states."""
+    counts: dict[str, int] = {}
+    for s in rec["chapters"].values():
+        counts[s] = counts.get(s, 0) + 1
+    return {
+        "job": rec["id"],
+        "status": rec["status"],
+        "total": len(rec["chapters"]),
+        "counts": counts,
+        "chapters": rec["chapters"],
+        **{k: rec[k] for k in ("kind", "budget_usd", "chapter_usd", "reason", "errors") if k in rec},
+        "created": rec["created"],
+        "updated": rec["updated"],
+    }
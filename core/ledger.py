@@ -0,0 +1,131 @@
+# v2025‑07‑05‑AI-generated
+"""
+core/ledger.py
+SQLite cost ledger (WAL mode) replacing the append‑only logs/cost.csv.
+
+Every LLM call is one row tagged with project id, chapter and call kind.
+A rollup table keyed by (project, kind) is updated in the same
+transaction, so per‑project totals are a primary‑key lookup no matter
+how many calls have accumulated. WAL lets API and Celery processes
+read and write the file concurrently.
+
+Tags are carried in a context variable so callers deep in the stack
+(openai_wrap) need no extra arguments:
+    with ledger.tagged(pid=pid, chapter=3, kind="draft"):
+        await achat_completion(...)
+
+Environment variables:
+    COST_DB   default logs/cost.db
+"""
+
+from __future__ import annotations
+
+import contextvars
+import datetime as dt
+import os
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+import core.env  # loads .env
+from core import db
+
+COST_DB = os.getenv("COST_DB", "logs/cost.db")
+
+_tags: contextvars.ContextVar[dict[str, Any]] = contextvars.ContextVar("cost_tags", default={})
+_ready: set[int] = set()
+
+
+@contextmanager
+def tagged(**tags: Any) -> Iterator[None]:
+    """Attach pid / chapter / kind to LLM calls made inside the block."""
+    token = _tags.set({**_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+def current_tags() -> dict[str, Any]:
+    return dict(_tags.get())
+
+
+def _db():
+    conn = db.connect(COST_DB)
+    if os.getpid() not in _ready:
+        with conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS calls(
+                    id INTEGER PRIMARY KEY,
+                    ts TEXT NOT NULL,
+                    pid TEXT NOT NULL DEFAULT '',
+                    chapter INTEGER,
+                    kind TEXT NOT NULL DEFAULT '',
+                    model TEXT NOT NULL,
+                    prompt_tokens INTEGER NOT NULL,
+                    completion_tokens INTEGER NOT NULL,
+                    total_tokens INTEGER NOT NULL,
+                    usd REAL NOT NULL);
+                CREATE INDEX IF NOT EXISTS calls_pid ON calls(pid, chapter);
+                CREATE INDEX IF NOT EXISTS calls_ts ON calls(ts);
+                CREATE TABLE IF NOT EXISTS rollups(
+                    pid TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    calls INTEGER NOT NULL,
+                    tokens INTEGER NOT NULL,
+                    usd REAL NOT NULL,
+                    PRIMARY KEY (pid, kind));
+                """
+            )
+        _ready.add(os.getpid())
+    return conn
+
+
+def record(model: str, usage: dict[str, Any], usd: float) -> None:
+    tags = _tags.get()
+    pid, kind = tags.get("pid") or "", tags.get("kind") or ""
+    with _db() as conn:
+        conn.execute(
+            "INSERT INTO calls(ts, pid, chapter, kind, model, prompt_tokens,"
+            " completion_tokens, total_tokens, usd) VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                dt.datetime.utcnow().isoformat(timespec="seconds"),
+                pid,
+                tags.get("chapter"),
+                kind,
+                model,
+                usage.get("prompt_tokens", 0),
+                usage.get("completion_tokens", 0),
+                usage["total_tokens"],
+                usd,
+            ),
+        )
+        conn.execute(
+            "INSERT INTO rollups VALUES(?, ?, 1, ?, ?) ON CONFLICT(pid, kind) DO UPDATE"
+            " SET calls = calls + 1, tokens = tokens + excluded.tokens, usd = usd + excluded.usd",
+            (pid, kind, usage["total_tokens"], usd),
+        )
+
+
+def project_totals(pid: str) -> dict[str, Any]:
+    rows = _db().execute(
+        "SELECT kind, calls, tokens, usd FROM rollups WHERE pid = ?", (pid,)
+    ).fetchall()
+    by_kind = {
+        k or "other": {"calls": c, "tokens": t, "usd": round(u, 4)} for k, c, t, u in rows
+    }
+    return {
+        "usd": round(sum(r[3] for r in rows), 4),
+        "tokens": sum(r[2] for r in rows),
+        "calls": sum(r[1] for r in rows),
+        "by_kind": by_kind,
+    }
+
+
+def chapter_totals(pid: str) -> dict[int, dict[str, Any]]:
+    rows = _db().execute(
+        "SELECT chapter, COUNT(*), SUM(total_tokens), SUM(usd) FROM calls"
+        " WHERE pid = ? AND chapter IS NOT NULL GROUP BY chapter",
+        (pid,),
+    ).fetchall()
+    return {ch: {"calls": c, "tokens": t, "usd": round(u, 4)} for ch, c, t, u in rows}
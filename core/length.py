@@ -0,0 +1,116 @@
+# v2025‑07‑15‑AI-generated
+"""
+core/length.py
+Word / token budget for chapter drafts.
+
+* max_tokens(target)  – hard ceiling for the completion, from
+  target_words × LENGTH_MAX_RATIO × LENGTH_TOKENS_PER_WORD.
+* Counter             – incremental word count over streamed deltas;
+  once past target × LENGTH_STOP_RATIO the stream is stopped at the
+  next sentence end, so the chapter ends cleanly before the ceiling.
+* short() / continuation() – a chapter below target × LENGTH_MIN_RATIO
+  gets a follow‑up request for the missing words (and missing beats)
+  instead of a full redraft, up to LENGTH_CONTINUATIONS times.
+* stats()             – per‑chapter over / undershoot, written to
+  reports/chNN.length.json by core.draft.
+
+Environment variables:
+    LENGTH_TOKENS_PER_WORD  default 1.4
+    LENGTH_MAX_RATIO        default 1.3   hard cap (max_tokens)
+    LENGTH_STOP_RATIO       default 1.1   stop streaming at the next sentence end
+    LENGTH_MIN_RATIO        default 0.9   below this → continuation request
+    LENGTH_CONTINUATIONS    default 1
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import re
+from typing import Any
+
+TOKENS_PER_WORD = float(os.getenv("LENGTH_TOKENS_PER_WORD", "1.4"))
+MAX_RATIO = float(os.getenv("LENGTH_MAX_RATIO", "1.3"))
+STOP_RATIO = float(os.getenv("LENGTH_STOP_RATIO", "1.1"))
+MIN_RATIO = float(os.getenv("LENGTH_MIN_RATIO", "0.9"))
+CONTINUATIONS = int(os.getenv("LENGTH_CONTINUATIONS", "1"))
+
+_SENTENCE_END = re.compile(r"[.!?…][\"'”’)*_]*(?=\s)|\n\n")
+_WORD = re.compile(r"\S+")
+
+
+def max_tokens(target: int) -> int:
+    return math.ceil(target * MAX_RATIO * TOKENS_PER_WORD)
+
+
+def words(text: str) -> int:
+    return len(_WORD.findall(text))
+
+
+class Counter:
+    """Words seen so far in a stream; split words across deltas count once."""
+
+    def __init__(self, target: int):
+        self.words = 0
+        self.stop_at = math.ceil(target * STOP_RATIO)
+        self._in_word = False
+
+    def feed(self, delta: str) -> str | None:
+        """Count *delta*; past stop_at, return it cut after a sentence end (None = keep going)."""
+        # cut only after the word that crossed stop_at (a cache hit arrives as one delta)
+        at = 0 if self.words >= self.stop_at else None
+        for i, ch in enumerate(delta):
+            if ch.isspace():
+                self._in_word = False
+            elif not self._in_word:
+                self._in_word = True
+                self.words += 1
+                if at is None and self.words >= self.stop_at:
+                    at = i
+        if at is None:
+            return None
+        m = _SENTENCE_END.search(delta + " ", at)
+        return delta[: m.end()] if m else None
+
+
+def short(text: str, target: int) -> bool:
+    return words(text) < target * MIN_RATIO
+
+
+def trim_partial(text: str) -> str:
+    """Drop a trailing unfinished sentence (after a max_tokens cut)."""
+    ends = list(_SENTENCE_END.finditer(text + " "))
+    if not ends or ends[-1].end() >= len(text.rstrip()):
+        return text
+    return text[: ends[-1].end()].rstrip()
+
+
+def continuation(
+    messages: list[dict], prose: str, target: int, missing_beats: list[str]
+) -> tuple[list[dict], int]:
+    """(messages, max_tokens) asking for the rest of a short chapter."""
+    remaining = max(150, target - words(prose))
+    ask = (
+        f"The chapter is about {remaining} words short of its {target}-word target. "
+        "Continue it seamlessly from the last sentence – do not repeat or summarise "
+        f"what is already written – adding roughly {remaining} words"
+    )
+    if missing_beats:
+        ask += " and covering these beats it has not reached yet:\n" + "\n".join(f"- {b}" for b in missing_beats)
+    return (
+        [*messages, {"role": "assistant", "content": prose}, {"role": "user", "content": ask + "."}],
+        max_tokens(remaining),
+    )
+
+
+def stats(prose: str, target: int, limit: int, continuations: int, stopped: bool) -> dict[str, Any]:
+    n = words(prose)
+    return {
+        "target_words": target,
+        "words": n,
+        "ratio": round(n / target, 3) if target else None,
+        "deviation": n - target,
+        "max_tokens": limit,
+        "continuations": continuations,
+        "stopped_early": stopped,
+    }
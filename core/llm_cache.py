@@ -0,0 +1,152 @@
+# v2025‑07‑05‑AI-generated
+"""
+core/llm_cache.py
+Opt‑in content‑addressed cache for chat completions.
+
+The key is a SHA‑256 of the request (model + messages + parameters), so
+a retried or crash‑recovered call with the same prompt is served without
+paying for it again. Entries expire after a TTL and the store is capped
+at a maximum number of entries, evicting least‑recently‑used first.
+
+Backends:
+* sqlite – local file, good for a single host
+* redis  – shared across hosts (reuses the broker by default)
+
+Environment variables:
+    LLM_CACHE              off | sqlite | redis   default off
+    LLM_CACHE_PATH         default logs/llm_cache.db
+    LLM_CACHE_URL          default = BROKER_URL
+    LLM_CACHE_TTL          seconds, default 604800 (7 days)
+    LLM_CACHE_MAX_ENTRIES  default 5000
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from typing import Any
+
+import core.env  # loads .env
+from core import db
+
+MODE = os.getenv("LLM_CACHE", "off").lower()
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", "logs/llm_cache.db")
+CACHE_URL = os.getenv("LLM_CACHE_URL", os.getenv("BROKER_URL", "redis://localhost:6379/0"))
+TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+
+def key(request: dict[str, Any]) -> str:
+    blob = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class SqliteCache:
+    def __init__(self, path: str, ttl: int, max_entries: int):
+        self.path, self.ttl, self.max_entries = path, ttl, max_entries
+        with self._db() as conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS entries(
+                    key TEXT PRIMARY KEY, value TEXT NOT NULL,
+                    created REAL NOT NULL, accessed REAL NOT NULL);
+                CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed);
+                CREATE TABLE IF NOT EXISTS stats(name TEXT PRIMARY KEY, n INTEGER NOT NULL);
+                """
+            )
+
+    def _db(self):
+        return db.connect(self.path)
+
+    def _count(self, conn, name: str) -> None:
+        conn.execute(
+            "INSERT INTO stats VALUES(?, 1) ON CONFLICT(name) DO UPDATE SET n = n + 1",
+            (name,),
+        )
+
+    def get(self, k: str) -> str | None:
+        now = time.time()
+        with self._db() as conn:
+            row = conn.execute(
+                "SELECT value FROM entries WHERE key = ? AND created > ?",
+                (k, now - self.ttl),
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, k))
+            self._count(conn, "hits" if row else "misses")
+        return row[0] if row else None
+
+    def put(self, k: str, value: str) -> None:
+        now = time.time()
+        with self._db() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES(?, ?, ?, ?)", (k, value, now, now)
+            )
+            conn.execute("DELETE FROM entries WHERE created <= ?", (now - self.ttl,))
+            (size,) = conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+            if size > self.max_entries:
+                conn.execute(
+                    "DELETE FROM entries WHERE key IN "
+                    "(SELECT key FROM entries ORDER BY accessed LIMIT ?)",
+                    (size - self.max_entries,),
+                )
+
+    def stats(self) -> dict[str, int]:
+        conn = self._db()
+        out = dict(conn.execute("SELECT name, n FROM stats").fetchall())
+        (size,) = conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        return {"hits": out.get("hits", 0), "misses": out.get("misses", 0), "size": size}
+
+
+class RedisCache:
+    PREFIX = "novelist:llmcache:"
+
+    def __init__(self, url: str, ttl: int, max_entries: int):
+        import redis
+        self.r = redis.Redis.from_url(url)
+        self.ttl, self.max_entries = ttl, max_entries
+        self.lru = self.PREFIX + "lru"
+
+    def get(self, k: str) -> str | None:
+        value = self.r.get(self.PREFIX + k)
+        pipe = self.r.pipeline()
+        if value is not None:
+            pipe.zadd(self.lru, {k: time.time()})
+        pipe.incr(self.PREFIX + ("hits" if value is not None else "misses"))
+        pipe.execute()
+        return value.decode("utf-8") if value is not None else None
+
+    def put(self, k: str, value: str) -> None:
+        pipe = self.r.pipeline()
+        pipe.set(self.PREFIX + k, value, ex=self.ttl)
+        pipe.zadd(self.lru, {k: time.time()})
+        pipe.zcard(self.lru)
+        size = pipe.execute()[-1]
+        if size > self.max_entries:
+            evicted = [m.decode() for m, _ in self.r.zpopmin(self.lru, size - self.max_entries)]
+            self.r.delete(*(self.PREFIX + m for m in evicted))
+
+    def stats(self) -> dict[str, int]:
+        hits, misses = self.r.mget(self.PREFIX + "hits", self.PREFIX + "misses")
+        return {"hits": int(hits or 0), "misses": int(misses or 0), "size": self.r.zcard(self.lru)}
+
+
+_backend: SqliteCache | RedisCache | None = None
+
+
+def backend() -> SqliteCache | RedisCache | None:
+    """The configured cache, or None when LLM_CACHE=off."""
+    global _backend
+    if _backend is None and MODE != "off":
+        if MODE == "redis":
+            _backend = RedisCache(CACHE_URL, TTL, MAX_ENTRIES)
+        else:
+            _backend = SqliteCache(CACHE_PATH, TTL, MAX_ENTRIES)
+    return _backend
+
+
+def stats() -> dict[str, Any]:
+    store = backend()
+    return {"mode": MODE, **(store.stats() if store else {})}
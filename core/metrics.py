@@ -0,0 +1,218 @@
+# v2025‑07‑10‑AI-generated
+"""
+core/metrics.py
+Stage timing spans, LLM stream metrics and Prometheus export.
+
+    with metrics.span("draft.prompt"):
+        ...
+Every span
+* observes novelist_stage_seconds{stage} (Prometheus, if installed),
+* is stored with the current ledger tags (pid / chapter) in a SQLite
+  timings table behind project_timings(pid) – the per‑project report,
+* is forwarded to an OpenTelemetry tracer when opentelemetry‑api is
+  importable, and to any callable registered with add_hook().
+
+LLM calls also report time to first token, tokens per second, token
+counts and retries; Celery tasks report queue wait (from an
+"enqueued_at" header stamped at publish time), run time and outcome.
+
+prometheus_client and opentelemetry are optional: without them spans
+still land in the timings table.
+
+Environment variables:
+    METRICS_DB             default logs/metrics.db
+    WORKER_METRICS_PORT    default 0 (off)  Prometheus port for workers
+    PROMETHEUS_MULTIPROC_DIR                 set for prefork workers
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import os
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Any, Callable, Iterator
+
+import core.env  # loads .env
+from core import db, ledger
+
+METRICS_DB = os.getenv("METRICS_DB", "logs/metrics.db")
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "0"))
+
+try:
+    import prometheus_client as prom
+except ImportError:  # metrics export disabled; timings table still works
+    prom = None
+
+try:
+    from opentelemetry import trace as _otel
+    _tracer = _otel.get_tracer("novelist")
+except ImportError:
+    _tracer = None
+
+_hooks: list[Callable[[str, float, dict[str, Any]], None]] = []
+_ready: set[int] = set()
+
+_SECS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+if prom is not None:
+    STAGE = prom.Histogram("novelist_stage_seconds", "Duration of a pipeline stage", ["stage"], buckets=_SECS)
+    TTFT = prom.Histogram("novelist_llm_ttft_seconds", "Time to first streamed token", ["model"], buckets=_SECS)
+    TPS = prom.Histogram(
+        "novelist_llm_tokens_per_second", "Completion tokens per second", ["model"],
+        buckets=(5, 10, 20, 40, 60, 80, 100, 150, 200, 400, 800),
+    )
+    TOKENS = prom.Counter("novelist_llm_tokens", "LLM tokens", ["model", "type"])
+    RETRIES = prom.Counter("novelist_llm_retries", "Retried LLM requests", ["model", "reason"])
+    QUEUE_WAIT = prom.Histogram("novelist_task_queue_wait_seconds", "Broker wait before a task starts", ["task"], buckets=_SECS)
+    TASKS = prom.Counter("novelist_tasks", "Finished Celery tasks", ["task", "state"])
+    LENGTH = prom.Histogram(
+        "novelist_chapter_length_ratio", "Drafted words / target words",
+        buckets=(0.5, 0.7, 0.8, 0.9, 0.95, 1.0, 1.05, 1.1, 1.2, 1.3, 1.5, 2.0),
+    )
+
+
+def add_hook(fn: Callable[[str, float, dict[str, Any]], None]) -> None:
+    """fn(stage, seconds, attributes) is called for every finished span."""
+    _hooks.append(fn)
+
+# ---------------------------------------------------------------- timings table
+
+def _db():
+    conn = db.connect(METRICS_DB)
+    if os.getpid() not in _ready:
+        with conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS timings(
+                    id INTEGER PRIMARY KEY,
+                    ts TEXT NOT NULL,
+                    pid TEXT NOT NULL,
+                    chapter INTEGER,
+                    stage TEXT NOT NULL,
+                    seconds REAL NOT NULL);
+                CREATE INDEX IF NOT EXISTS timings_pid ON timings(pid, stage);
+                """
+            )
+        _ready.add(os.getpid())
+    return conn
+
+
+def _store(stage: str, seconds: float, tags: dict[str, Any]) -> None:
+    if not tags.get("pid"):
+        return
+    with _db() as conn:
+        conn.execute(
+            "INSERT INTO timings(ts, pid, chapter, stage, seconds) VALUES(?, ?, ?, ?, ?)",
+            (dt.datetime.utcnow().isoformat(timespec="seconds"), tags["pid"], tags.get("chapter"), stage, seconds),
+        )
+
+# ---------------------------------------------------------------- spans
+
+@contextmanager
+def span(stage: str, **attrs: Any) -> Iterator[dict[str, Any]]:
+    """Time the block as *stage*; the yielded dict takes extra attributes."""
+    attrs = {**ledger.current_tags(), **attrs}
+    with ExitStack() as stack:
+        if _tracer is not None:
+            stack.enter_context(_tracer.start_as_current_span(stage, attributes=_otel_attrs(attrs)))
+        start = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            record(stage, time.perf_counter() - start, attrs)
+
+
+def record(stage: str, seconds: float, attrs: dict[str, Any]) -> None:
+    """Book a finished span (also used for timings measured elsewhere)."""
+    if prom is not None:
+        STAGE.labels(stage).observe(seconds)
+    _store(stage, seconds, attrs)
+    for hook in _hooks:
+        hook(stage, seconds, attrs)
+
+
+def _otel_attrs(attrs: dict[str, Any]) -> dict[str, Any]:
+    return {f"novelist.{k}": v for k, v in attrs.items() if isinstance(v, (str, int, float, bool))}
+
+
+def llm_call(model: str, usage: dict[str, Any] | None, seconds: float, ttft: float | None = None) -> None:
+    """Token counts, tokens/s (after the first token when streamed) and TTFT."""
+    if prom is None or not usage:
+        return
+    TOKENS.labels(model, "prompt").inc(usage.get("prompt_tokens", 0))
+    TOKENS.labels(model, "completion").inc(usage.get("completion_tokens", 0))
+    generating = seconds - (ttft or 0.0)
+    if usage.get("completion_tokens") and generating > 0:
+        TPS.labels(model).observe(usage["completion_tokens"] / generating)
+    if ttft is not None:
+        TTFT.labels(model).observe(ttft)
+
+
+def retry(model: str, reason: str) -> None:
+    if prom is not None:
+        RETRIES.labels(model, reason).inc()
+
+
+def chapter_length(ratio: float | None) -> None:
+    if prom is not None and ratio is not None:
+        LENGTH.observe(ratio)
+
+
+def task_started(task: str, enqueued_at: float | None) -> None:
+    if prom is not None and enqueued_at:
+        QUEUE_WAIT.labels(task).observe(max(0.0, time.time() - enqueued_at))
+
+
+def task_finished(task: str, state: str) -> None:
+    if prom is not None:
+        TASKS.labels(task, state).inc()
+
+# ---------------------------------------------------------------- export
+
+def _registry():
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):  # aggregate prefork children
+        from prometheus_client import multiprocess
+        registry = prom.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return prom.REGISTRY
+
+
+def exposition() -> tuple[bytes, str] | None:
+    """(body, content type) for a /metrics response; None without prometheus_client."""
+    if prom is None:
+        return None
+    return prom.generate_latest(_registry()), prom.CONTENT_TYPE_LATEST
+
+
+def serve_worker_metrics() -> None:
+    """Expose /metrics on WORKER_METRICS_PORT (called once per worker host process)."""
+    if prom is not None and WORKER_METRICS_PORT:
+        prom.start_http_server(WORKER_METRICS_PORT, registry=_registry())
+
+
+def project_timings(pid: str) -> dict[str, Any]:
+    """Per‑stage count / mean / p95 / total seconds, plus per‑chapter totals by stage."""
+    rows = _db().execute(
+        "SELECT stage, chapter, seconds FROM timings WHERE pid = ? ORDER BY stage, seconds", (pid,)
+    ).fetchall()
+    stages: dict[str, list[float]] = {}
+    chapters: dict[str, dict[str, float]] = {}
+    for stage, chapter, seconds in rows:
+        stages.setdefault(stage, []).append(seconds)
+        if chapter is not None:
+            ch = chapters.setdefault(str(chapter), {})
+            ch[stage] = round(ch.get(stage, 0.0) + seconds, 3)
+    return {
+        "stages": {
+            stage: {
+                "count": len(v),
+                "mean_s": round(sum(v) / len(v), 3),
+                "p95_s": round(v[min(len(v) - 1, int(0.95 * (len(v) - 1) + 0.5))], 3),
+                "total_s": round(sum(v), 3),
+            }
+            for stage, v in stages.items()
+        },
+        "chapters": dict(sorted(chapters.items(), key=lambda kv: int(kv[0]))),
+    }
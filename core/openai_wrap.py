@@ -1,43 +1,289 @@
 # v2025‑07‑01‑AI-generated
 """
 core/openai_wrap.py
-Thin wrapper around openai.chat.completions.create that
-• logs token usage & cost to logs/cost.csv
+Thin wrapper around chat.completions.create that
+• logs token usage & cost to the core.ledger cost ledger
 • centralises model/price mapping
+• shares one pooled AsyncOpenAI client per process
+• optionally serves repeated requests from core.llm_cache
+• times every call (core.metrics: TTFT, tokens/s, retries)
+• paces requests through core.ratelimit (shared RPM/TPM token buckets,
+  AIMD in‑flight limit) and retries 429/5xx/connection errors with
+  jittered exponential backoff that honours Retry‑After
+
+All requests run on a dedicated I/O event loop thread that owns the
+httpx connection pool, so any number of threads or coroutines in a
+worker process multiplex over the same keep‑alive connections. The
+blocking entry points (chat_completion and the sync wrappers elsewhere,
+via run_sync) submit their coroutine to that loop, so they also work
+from code that already runs inside an event loop.
+
 Usage:
-    from core.openai_wrap import chat_completion
+    from core.openai_wrap import chat_completion, achat_completion, astream_completion
     resp = chat_completion(model="gpt-4o-mini", messages=[...])
+    resp = await achat_completion(model="gpt-4o-mini", messages=[...])
+    async for delta in astream_completion(model=..., messages=[...]): ...
+    results = await abatch_completions({"id‑1": {...request...}, ...})
+Pass cache=False to bypass a cached answer (forced regeneration); the
+fresh response still replaces the cached one. achat_completion's
+accept=fn(content) -> bool keeps replies that fail it (e.g. invalid
+JSON) out of the cache and ignores cached ones that fail it.
+
+Environment variables:
+    OPENAI_MAX_CONNECTIONS   default 100  pool size
+    OPENAI_MAX_KEEPALIVE     default 20   idle connections kept open
+    OPENAI_KEEPALIVE_EXPIRY  default 30   seconds an idle connection lives
+    OPENAI_TIMEOUT           default 600  read timeout (seconds)
+    OPENAI_CONNECT_TIMEOUT   default 10   connect timeout (seconds)
+    OPENAI_MAX_RETRIES       default 5    retries of throttled/transient errors
+    OPENAI_BATCH_POLL        default 30   seconds between Batch API status polls
 """
 from __future__ import annotations
-import csv, datetime as dt, os, pathlib
+import asyncio, datetime as dt, json, os, threading, time
+import httpx
 import openai
+from openai.types.chat import ChatCompletion
 
 import core.env  # .env loader
+from core import ledger, llm_cache, metrics, ratelimit
+from core.context import count_tokens
 
 PRICE = {
     "gpt-4o-mini": 0.0005,  # USD per 1K tokens (example)
     "gpt-4o": 0.002,
 }
 
-LOG_FILE = pathlib.Path("logs/cost.csv")
-LOG_FILE.parent.mkdir(exist_ok=True)
+MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "600"))
+CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10"))
+MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+BATCH_POLL = float(os.getenv("OPENAI_BATCH_POLL", "30"))
+BATCH_PRICE_FACTOR = 0.5  # Batch API is billed at half price
+RETRYABLE = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
 
-def _log(model: str, usage: dict):
-    row = {
-        "ts": dt.datetime.utcnow().isoformat(timespec="seconds"),
-        "model": model,
-        **usage,
-        "usd": round(usage["total_tokens"] / 1000 * PRICE.get(model, 0.002), 4),
-    }
-    write_header = not LOG_FILE.exists()
-    with LOG_FILE.open("a", newline="") as fh:
-        w = csv.DictWriter(fh, fieldnames=row.keys())
-        if write_header:
-            w.writeheader()
-        w.writerow(row)
+def _log(model: str, usage: dict, factor: float = 1.0):
+    usd = round(usage["total_tokens"] / 1000 * PRICE.get(model, 0.002) * factor, 6)
+    ledger.record(model, usage, usd)
 
-def chat_completion(**kwargs):
+# ---------------------------------------------------------------- client
+
+_lock = threading.Lock()
+_owner_pid: int | None = None
+_loop: asyncio.AbstractEventLoop | None = None
+_client: openai.AsyncOpenAI | None = None
+_aimd: ratelimit.AIMD | None = None
+
+def _runtime() -> tuple[asyncio.AbstractEventLoop, openai.AsyncOpenAI]:
+    """Start (or re‑start after fork) the I/O loop thread and pooled client."""
+    global _owner_pid, _loop, _client, _aimd
+    with _lock:
+        if _owner_pid != os.getpid() or _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name="openai-io", daemon=True
+            ).start()
+            http = openai.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE,
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(TIMEOUT, connect=CONNECT_TIMEOUT),
+            )
+            # retries are ours (_limited), so the SDK must not add its own
+            _client = openai.AsyncOpenAI(http_client=http, max_retries=0)
+            _aimd = ratelimit.AIMD()
+            _owner_pid = os.getpid()
+        return _loop, _client
+
+def run_sync(coro):
+    """Block until *coro* has run on the I/O loop (safe inside another running loop)."""
+    loop, _ = _runtime()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("run_sync() called on the openai-io loop; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+async def _on_io_loop(coro):
+    loop, _ = _runtime()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+async def _limited(run, model: str, est: int, can_retry=lambda: True):
+    """Await run() on the I/O loop under the rate limiter and AIMD limit."""
+    for attempt in range(MAX_RETRIES + 1):
+        await ratelimit.acquire(model, est)
+        try:
+            async with _aimd:
+                return await run()
+        except RETRYABLE as e:
+            if attempt == MAX_RETRIES:
+                e.exhausted = True  # core.retry must not start another round
+                raise
+            if not can_retry():
+                raise
+            metrics.retry(model, type(e).__name__)
+            await asyncio.sleep(ratelimit.backoff_delay(attempt, hint=ratelimit.retry_after(e)))
+
+# ---------------------------------------------------------------- public
+
+async def achat_completion(*, cache: bool = True, accept=None, **kwargs):
     model = kwargs.get("model", "gpt-4o-mini")
-    resp = openai.chat.completions.create(**kwargs)
+    store = llm_cache.backend()
+    key = llm_cache.key(kwargs) if store else None
+    if store and cache:
+        hit = store.get(key)
+        if hit is not None:
+            resp = ChatCompletion.model_validate_json(hit)
+            if accept is None or accept(resp.choices[0].message.content):
+                return resp
+
+    _, client = _runtime()
+    est = ratelimit.estimate_tokens(kwargs)
+    with metrics.span("llm.chat", model=model):
+        start = time.perf_counter()
+        resp = await _on_io_loop(_limited(lambda: client.chat.completions.create(**kwargs), model, est))
+    metrics.llm_call(model, resp.usage.model_dump(), time.perf_counter() - start)
     _log(model, resp.usage.model_dump())
+    ratelimit.settle(model, est, resp.usage.total_tokens)
+    if store and (accept is None or accept(resp.choices[0].message.content)):
+        store.put(key, resp.model_dump_json())
     return resp
+
+def chat_completion(**kwargs):
+    """Blocking shim over achat_completion for synchronous callers."""
+    return run_sync(achat_completion(**kwargs))
+
+def _as_completion(model: str, text: str, usage) -> str:
+    """Serialise a finished stream like a non‑streamed response for the cache."""
+    return ChatCompletion.model_validate({
+        "id": "cached-stream",
+        "object": "chat.completion",
+        "created": int(dt.datetime.utcnow().timestamp()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": text},
+        }],
+        "usage": usage.model_dump() if usage else None,
+    }).model_dump_json()
+
+async def astream_completion(*, cache: bool = True, **kwargs):
+    """
+    Yield content deltas as they arrive; usage is logged once at the end
+    (estimated from the streamed text if the caller stops early).
+    """
+    model = kwargs.get("model", "gpt-4o-mini")
+    store = llm_cache.backend()
+    key = llm_cache.key(kwargs) if store else None
+    if store and cache:
+        hit = store.get(key)
+        if hit is not None:
+            yield ChatCompletion.model_validate_json(hit).choices[0].message.content
+            return
+
+    loop, client = _runtime()
+    caller = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    end = object()
+    est = ratelimit.estimate_tokens(kwargs)
+    sent = False
+
+    async def _run():
+        nonlocal sent
+        usage = None
+        stream = await client.chat.completions.create(
+            stream=True, stream_options={"include_usage": True}, **kwargs
+        )
+        async for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                sent = True
+                caller.call_soon_threadsafe(queue.put_nowait, chunk.choices[0].delta.content)
+        return usage
+
+    async def _pump():
+        try:
+            # once deltas went out a retry would duplicate them
+            return await _limited(_run, model, est, can_retry=lambda: not sent)
+        finally:
+            if not caller.is_closed():
+                caller.call_soon_threadsafe(queue.put_nowait, end)
+
+    fut = asyncio.run_coroutine_threadsafe(_pump(), loop)
+    parts: list[str] = []
+    with metrics.span("llm.stream", model=model):
+        start = time.perf_counter()
+        ttft = None
+        try:
+            while (item := await queue.get()) is not end:
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                parts.append(item)
+                yield item
+            usage = await asyncio.wrap_future(fut)
+        except GeneratorExit:
+            # the caller stopped reading (early stop): the request is cancelled
+            # without a usage chunk, so book what was streamed
+            if parts:
+                completion = count_tokens("".join(parts))
+                prompt = est - (kwargs.get("max_tokens") or ratelimit.EST_COMPLETION)
+                _book(model, {"prompt_tokens": prompt, "completion_tokens": completion,
+                              "total_tokens": prompt + completion}, est, start, ttft)
+            raise
+        finally:
+            fut.cancel()
+    if usage:
+        _book(model, usage.model_dump(), est, start, ttft)
+    if store:
+        store.put(key, _as_completion(model, "".join(parts), usage))
+
+def _book(model: str, usage: dict, est: int, start: float, ttft: float | None) -> None:
+    metrics.llm_call(model, usage, time.perf_counter() - start, ttft)
+    _log(model, usage)
+    ratelimit.settle(model, est, usage["total_tokens"])
+
+async def abatch_completions(
+    requests: dict[str, dict], tags: dict[str, dict] | None = None, poll: float | None = None
+) -> dict[str, ChatCompletion]:
+    """
+    Run chat requests as one Batch API job and wait for it.
+    requests – {custom_id: create() kwargs}; tags – optional ledger tags per id.
+    Returns the successful responses by custom_id; each is logged at batch price.
+    """
+    _, client = _runtime()
+    lines = "\n".join(
+        json.dumps({"custom_id": cid, "method": "POST", "url": "/v1/chat/completions", "body": body})
+        for cid, body in requests.items()
+    )
+    upload = await _on_io_loop(client.files.create(file=("batch.jsonl", lines.encode()), purpose="batch"))
+    batch = await _on_io_loop(client.batches.create(
+        input_file_id=upload.id, endpoint="/v1/chat/completions", completion_window="24h"
+    ))
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        await asyncio.sleep(BATCH_POLL if poll is None else poll)
+        batch = await _on_io_loop(client.batches.retrieve(batch.id))
+    if batch.status != "completed" or not batch.output_file_id:
+        raise openai.OpenAIError(f"batch {batch.id} ended {batch.status}")
+
+    output = await _on_io_loop(client.files.content(batch.output_file_id))
+    out: dict[str, ChatCompletion] = {}
+    for line in output.text.splitlines():
+        item = json.loads(line)
+        if item.get("error") or item["response"]["status_code"] != 200:
+            continue
+        cid = item["custom_id"]
+        resp = ChatCompletion.model_validate(item["response"]["body"])
+        with ledger.tagged(**(tags or {}).get(cid, {})):
+            _log(requests[cid].get("model", "gpt-4o-mini"), resp.usage.model_dump(), BATCH_PRICE_FACTOR)
+        out[cid] = resp
+    return out
@@ -1,25 +1,91 @@
 # v2025‑07‑03‑AI-generated
 """
 core/outline.py – outline with themes merge & beats enforcement
+agenerate_outline is the coroutine core; generate_outline blocks on it.
+
+A reply that fails to parse or validate is first repaired locally
+(core.outline_repair); chapters that are still invalid are regenerated
+on their own with a short follow‑up request.  Only a reply that cannot
+be salvaged costs a full new outline.
+
+Environment variables:
+    OUTLINE_FIX_ROUNDS    default 2   targeted chapter re‑requests per attempt
 """
 from __future__ import annotations
-import json, time
+import asyncio, functools, json, os
 from pathlib import Path
 from typing import Any
 import jsonschema, openai
 import core.env
-from core.prompt_builders import outline_prompt
-from core.openai_wrap import chat_completion
+from core.prompt_builders import outline_fix_prompt, outline_prompt
+from core.outline_repair import parse_lenient, repair
+from core.openai_wrap import achat_completion, run_sync
+from core import ledger, metrics, ratelimit
 from core import projects as pj
 
 SCHEMA_PATH = Path(__file__).parent.parent / "schemas" / "outline.v1.json"
-SCHEMA = json.loads(SCHEMA_PATH.read_text())
 OUTLINE_FILE = "outline.json"
+FIX_ROUNDS = int(os.getenv("OUTLINE_FIX_ROUNDS", "2"))
+
+@functools.lru_cache(maxsize=1)
+def _validator() -> jsonschema.Draft7Validator:
+    """Schema is read and checked on first use, not at import."""
+    schema = json.loads(SCHEMA_PATH.read_text())
+    jsonschema.Draft7Validator.check_schema(schema)
+    return jsonschema.Draft7Validator(schema)
 
-def _validate(obj: dict[str, Any]) -> None:
-    jsonschema.validate(obj, SCHEMA)
+def validate(obj: dict[str, Any]) -> None:
+    err = jsonschema.exceptions.best_match(_validator().iter_errors(obj))
+    if err is not None:
+        raise err
+
+def _bad_chapters(obj: Any) -> list[int] | None:
+    """Indices of chapters with schema errors; None if the outline itself is broken."""
+    bad: set[int] = set()
+    for err in _validator().iter_errors(obj):
+        path = list(err.absolute_path)
+        if len(path) < 2 or path[0] != "chapters":
+            return None
+        bad.add(path[1])
+    return sorted(bad)
+
+def _acceptable(words: int):
+    """Cache filter: only replies that validate after local repair are kept."""
+    def _ok(text: str) -> bool:
+        try:
+            return _bad_chapters(repair(parse_lenient(text), words)) == []
+        except (ValueError, TypeError, KeyError):
+            return False
+    return _ok
+
+async def _salvage(pid: str, text: str, premise: str, genre: str | None, words: int) -> dict:
+    """Repair locally, then re‑request only the invalid chapters."""
+    outline = repair(parse_lenient(text), words)
+    for _ in range(FIX_ROUNDS):
+        bad = _bad_chapters(outline)
+        if not bad:
+            break
+        nums = [outline["chapters"][i]["num"] for i in bad]
+        with ledger.tagged(pid=pid, kind="outline"):
+            # never replay a cached fix: a repeat round must get a fresh answer
+            resp = await achat_completion(cache=False, **outline_fix_prompt(premise, genre, outline, nums))
+        fixed = repair(parse_lenient(resp.choices[0].message.content), None)
+        by_num = {c["num"]: c for c in fixed.get("chapters", []) if isinstance(c, dict)}
+        for i, num in zip(bad, nums):
+            if num in by_num:
+                outline["chapters"][i] = by_num[num]
+        outline = repair(outline, words)
+    validate(outline)
+    return outline
 
 def generate_outline(pid: str, premise: str, genre: str | None, words: int) -> dict:
+    return run_sync(agenerate_outline(pid, premise, genre, words))
+
+async def agenerate_outline(pid: str, premise: str, genre: str | None, words: int) -> dict:
+    with metrics.span("outline", pid=pid):
+        return await _agenerate_outline(pid, premise, genre, words)
+
+async def _agenerate_outline(pid: str, premise: str, genre: str | None, words: int) -> dict:
     root = pj.NOVELIST_ROOT / pid
     wizard_path = root / "wizard.json"
     wizard_themes = json.loads(wizard_path.read_text())["themes"] if wizard_path.exists() else []
@@ -30,12 +96,13 @@ def generate_outline(pid: str, premise: str, genre: str | None, words: int) -> d
         attempt += 1
         try:
             payload = outline_prompt(premise, genre, words, wizard_themes)
-            resp = chat_completion(**payload)
-            outline = json.loads(resp.choices[0].message.content)
-            _validate(outline)
+            with ledger.tagged(pid=pid, kind="outline"):
+                # a retry must not replay the reply that just failed
+                resp = await achat_completion(cache=attempt == 1, accept=_acceptable(words), **payload)
+            outline = await _salvage(pid, resp.choices[0].message.content, premise, genre, words)
             break
-        except (jsonschema.ValidationError, openai.OpenAIError, json.JSONDecodeError):
-            time.sleep(1)
+        except (jsonschema.ValidationError, openai.OpenAIError, json.JSONDecodeError) as e:
+            await asyncio.sleep(ratelimit.backoff_delay(attempt - 1, hint=ratelimit.retry_after(e)))
             outline = None
     if outline is None:
         raise RuntimeError("Failed to obtain valid outline after 3 attempts.")
@@ -44,9 +111,7 @@ def generate_outline(pid: str, premise: str, genre: str | None, words: int) -> d
     if wizard_themes and not outline.get("themes"):
         outline["themes"] = wizard_themes
 
-    (root / OUTLINE_FILE).write_text(json.dumps(outline, indent=2), encoding="utf-8")
+    pj.atomic_write_json(root / OUTLINE_FILE, outline)
 
-    manifest = pj.load_manifest(pid)
-    manifest.update({"outline_status": "ready", "target_words": words})
-    (root / pj.MANIFEST).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    pj.update_manifest(pid, outline_status="ready", target_words=words)
     return outline
@@ -0,0 +1,138 @@
+# v2025‑07‑11‑AI-generated
+"""
+core/outline_repair.py
+Local fixes for near‑miss outline responses, so a small defect does not
+cost a second full outline generation.
+
+* parse_lenient – json.loads, falling back to closing a truncated
+  document (cut at the last complete value, close open brackets).
+* repair       – coerce the usual type slips ("3" → 3, "2,500 words"
+  → 2500, beats as one string → list), fill titles / word targets,
+  renumber, and rebuild missing beats from the chapter summary.
+
+Chapters that still fail validation are regenerated on their own by
+core.outline.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from typing import Any
+
+_SENT = re.compile(r"[^.!?;]+[.!?;]?")
+
+
+def parse_lenient(text: str) -> Any:
+    """Parse *text*; raises json.JSONDecodeError only if no prefix can be closed."""
+    text = text.strip()
+    if text.startswith("```"):  # fenced reply
+        text = re.sub(r"^```\w*\s*|\s*```$", "", text)
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as err:
+        first = err
+    for candidate in _closings(text):
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+    raise first
+
+
+def _closings(text: str):
+    """Closed variants of *text*, longest first: whole text, then each cut after a } or ]."""
+    stack: list[str] = []
+    in_str = esc = False
+    cuts: list[tuple[int, str]] = []  # (end index, closers needed there)
+    for i, ch in enumerate(text):
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+            continue
+        if ch == '"':
+            in_str = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+            cuts.append((i + 1, "".join(reversed(stack))))
+    tail = text + ('"' if in_str else "")
+    yield re.sub(r"[,:\s]+$", "", tail) + "".join(reversed(stack))
+    for end, closers in reversed(cuts):
+        yield text[:end] + closers
+
+
+def _int(value: Any) -> int | None:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        digits = re.sub(r"[^\d.]", "", value.split(".")[0] if value.count(".") == 1 else value)
+        return int(digits) if digits.isdigit() else None
+    return None
+
+
+def _beats(value: Any) -> list[str]:
+    if isinstance(value, str):
+        value = re.split(r"\n|;|\s•\s|(?<=\.)\s+(?=[A-Z])", value)
+    if not isinstance(value, list):
+        return []
+    out = []
+    for b in value:
+        if isinstance(b, dict):  # {"beat": "..."} / {"description": "..."}
+            b = next((v for v in b.values() if isinstance(v, str)), "")
+        b = re.sub(r"^\s*(?:[-*•]|\d+[.)])\s*", "", str(b)).strip()
+        if len(b) >= 3:
+            out.append(b)
+    return out
+
+
+def repair(outline: Any, words: int | None = None) -> Any:
+    """Best‑effort in‑place fix of an outline dict; returns it (or the input if hopeless)."""
+    if isinstance(outline, list):  # bare chapter list
+        outline = {"chapters": outline}
+    if not isinstance(outline, dict):
+        return outline
+    chapters = outline.get("chapters")
+    if isinstance(chapters, dict):  # {"1": {...}, "2": {...}}
+        chapters = [dict(v, num=v.get("num", k)) for k, v in chapters.items() if isinstance(v, dict)]
+    if not isinstance(chapters, list):
+        return outline
+    chapters = [c for c in chapters if isinstance(c, dict)]
+
+    if not isinstance(outline.get("title"), str) or not outline["title"].strip():
+        outline["title"] = "Untitled"
+    if isinstance(outline.get("themes"), str):
+        outline["themes"] = [t.strip() for t in re.split(r"[,;]", outline["themes"]) if len(t.strip()) >= 2]
+    if "novel_target_words" in outline:
+        n = _int(outline["novel_target_words"])
+        if n is None or n < 10000:
+            outline.pop("novel_target_words")
+        else:
+            outline["novel_target_words"] = n
+
+    nums = [_int(c.get("num")) for c in chapters]
+    renumber = any(n is None or n < 1 for n in nums) or len(set(nums)) != len(nums)
+    per_chapter = max(500, (words or 0) // max(1, len(chapters)))
+    for i, c in enumerate(chapters, start=1):
+        c["num"] = i if renumber else nums[i - 1]
+        if not isinstance(c.get("title"), str) or not c["title"].strip():
+            c["title"] = f"Chapter {c['num']}"
+        tw = _int(c.get("target_words"))
+        c["target_words"] = tw if tw and tw >= 500 else per_chapter
+        if "summary" in c and not isinstance(c["summary"], str):
+            c["summary"] = str(c["summary"])
+        beats = _beats(c.get("beats"))
+        if len(beats) < 3 and c.get("summary"):
+            extra = [s.strip(" .;") for s in _SENT.findall(c["summary"]) if len(s.strip(" .;")) >= 3]
+            beats += [s for s in extra if s not in beats][: 3 - len(beats)]
+        c["beats"] = beats
+    chapters.sort(key=lambda c: c["num"])
+    outline["chapters"] = chapters
+    return outline
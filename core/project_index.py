@@ -0,0 +1,147 @@
+# v2025‑07‑06‑AI-generated
+"""
+core/project_index.py
+Persistent SQLite index of project manifests under NOVELIST_ROOT.
+
+core.projects.save_manifest keeps rows current on every write. Edits
+made behind our back are caught by mtime: a changed NOVELIST_ROOT mtime
+(project added/removed) triggers a directory reconcile, and each row
+returned by a query is re‑read if its project.json mtime moved.
+
+Environment variables:
+    PROJECT_INDEX   default <NOVELIST_ROOT>/.index/projects.db
+                    (kept in a sub‑folder so index writes never bump
+                    the NOVELIST_ROOT mtime used for invalidation)
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from typing import Any
+
+from core import db
+
+SORT_KEYS = ("created_at", "title", "id")
+
+
+class ProjectIndex:
+    def __init__(self, root: Path, manifest: str, path: Path | None = None):
+        self.root = root
+        self.manifest = manifest
+        self.path = path or Path(os.getenv("PROJECT_INDEX", root / ".index" / "projects.db"))
+        self._ready: set[int] = set()
+
+    def _db(self):
+        conn = db.connect(self.path)
+        if os.getpid() not in self._ready:
+            with conn:
+                conn.executescript(
+                    """
+                    CREATE TABLE IF NOT EXISTS projects(
+                        id TEXT PRIMARY KEY,
+                        title TEXT, author TEXT, created_at TEXT,
+                        outline_status TEXT, draft_status TEXT,
+                        mtime_ns INTEGER NOT NULL,
+                        data TEXT NOT NULL);
+                    CREATE INDEX IF NOT EXISTS projects_created ON projects(created_at);
+                    CREATE INDEX IF NOT EXISTS projects_outline ON projects(outline_status);
+                    CREATE INDEX IF NOT EXISTS projects_draft ON projects(draft_status);
+                    CREATE TABLE IF NOT EXISTS meta(key TEXT PRIMARY KEY, value TEXT);
+                    """
+                )
+            self._ready.add(os.getpid())
+        return conn
+
+    # ------------------------------------------------------------ writes
+
+    def put(self, manifest: dict[str, Any], mtime_ns: int) -> None:
+        with self._db() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO projects VALUES(?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    manifest["id"],
+                    manifest.get("title"),
+                    manifest.get("author"),
+                    manifest.get("created_at"),
+                    manifest.get("outline_status"),
+                    manifest.get("draft_status"),
+                    mtime_ns,
+                    json.dumps(manifest),
+                ),
+            )
+
+    def drop(self, pid: str) -> None:
+        with self._db() as conn:
+            conn.execute("DELETE FROM projects WHERE id = ?", (pid,))
+
+    def _refresh(self, pid: str) -> dict[str, Any] | None:
+        """Re‑read one manifest from disk; drop the row if it is gone or corrupt."""
+        mf = self.root / pid / self.manifest
+        try:
+            mtime = mf.stat().st_mtime_ns
+            manifest = json.loads(mf.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.drop(pid)
+            return None
+        self.put(manifest, mtime)
+        return manifest
+
+    def reconcile(self, force: bool = False) -> None:
+        """Sync rows with the project folders when NOVELIST_ROOT changed."""
+        if not self.root.exists():
+            return
+        root_mtime = str(self.root.stat().st_mtime_ns)
+        conn = self._db()
+        row = conn.execute("SELECT value FROM meta WHERE key = 'root_mtime'").fetchone()
+        if not force and row and row[0] == root_mtime:
+            return
+        known = dict(conn.execute("SELECT id, mtime_ns FROM projects").fetchall())
+        seen = set()
+        for mf in self.root.glob(f"*/{self.manifest}"):
+            pid = mf.parent.name
+            seen.add(pid)
+            if known.get(pid) != mf.stat().st_mtime_ns:
+                self._refresh(pid)
+        for pid in known.keys() - seen:
+            self.drop(pid)
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta VALUES('root_mtime', ?)", (root_mtime,))
+
+    # ------------------------------------------------------------ reads
+
+    def query(
+        self,
+        outline_status: str | None = None,
+        draft_status: str | None = None,
+        sort: str = "created_at",
+        descending: bool = True,
+        limit: int | None = None,
+        offset: int = 0,
+    ) -> list[dict[str, Any]]:
+        if sort not in SORT_KEYS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_KEYS)}")
+        self.reconcile()
+        where, args = [], []
+        if outline_status:
+            where.append("outline_status = ?"); args.append(outline_status)
+        if draft_status:
+            where.append("draft_status = ?"); args.append(draft_status)
+        sql = "SELECT id, mtime_ns, data FROM projects"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {sort} {'DESC' if descending else 'ASC'}, id LIMIT ? OFFSET ?"
+        args += [-1 if limit is None else limit, offset]
+
+        out = []
+        for pid, mtime, data in self._db().execute(sql, args).fetchall():
+            try:
+                current = (self.root / pid / self.manifest).stat().st_mtime_ns
+            except FileNotFoundError:
+                self.drop(pid)
+                continue
+            manifest = json.loads(data) if current == mtime else self._refresh(pid)
+            if manifest is not None:
+                out.append(manifest)
+        return out
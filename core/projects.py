@@ -5,6 +5,16 @@ Create / load project manifests and ensure on‑disk folder layout.
 
 Project root defaults to  ~/NovelistProjects/<slug>
 but can be overridden with the env var  NOVELIST_ROOT.
+
+All manifest writes go through save_manifest / update_manifest so the
+project index (core.project_index) stays consistent.
+
+Storage helpers (bottom of file) make artifact writes safe under
+concurrent chapter drafting:
+* atomic_write_text / atomic_write_json – temp file + os.replace
+* project_lock        – per‑project advisory lock (flock + thread lock)
+* update_json / merge_json – locked read‑modify‑write of a JSON file
+* commit_chapter      – one locked batch for a chapter's outputs
 """
 
 from __future__ import annotations
@@ -13,13 +23,25 @@ import datetime as _dt
 import json
 import os
 import re
+import tempfile
+import threading
 import uuid
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable, Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: in‑process locking only
+    fcntl = None
+
+from core.project_index import ProjectIndex
 
 NOVELIST_ROOT = Path(os.getenv("NOVELIST_ROOT", Path.home() / "NovelistProjects"))
 MANIFEST = "project.json"
 
+_index = ProjectIndex(NOVELIST_ROOT, MANIFEST)
+
 
 def _slugify(text: str) -> str:
     text = text.lower()
@@ -62,8 +84,7 @@ def create_project(title: str, author: str = "Unknown") -> dict[str, Any]:
         "draft_status": "pending",
         "target_words": None,
     }
-    with open(root / MANIFEST, "w", encoding="utf-8") as fh:
-        json.dump(manifest, fh, indent=2)
+    save_manifest(pid, manifest)
     return manifest
 
 
@@ -76,14 +97,138 @@ def load_manifest(pid: str) -> dict[str, Any]:
         return json.load(fh)
 
 
-def list_projects() -> list[dict[str, Any]]:
+def save_manifest(pid: str, manifest: dict[str, Any]) -> None:
+    mf = NOVELIST_ROOT / pid / MANIFEST
+    with project_lock(pid):
+        atomic_write_json(mf, manifest)
+        _index.put(manifest, mf.stat().st_mtime_ns)
+
+
+def update_manifest(pid: str, **changes: Any) -> dict[str, Any]:
+    with project_lock(pid):
+        manifest = load_manifest(pid)
+        manifest.update(changes)
+        save_manifest(pid, manifest)
+    return manifest
+
+
+def list_projects(
+    outline_status: str | None = None,
+    draft_status: str | None = None,
+    sort: str = "created_at",
+    descending: bool = True,
+    limit: int | None = None,
+    offset: int = 0,
+) -> list[dict[str, Any]]:
+    """Newest first by default; served from the project index."""
     if not NOVELIST_ROOT.exists():
         return []
-    out: list[dict[str, Any]] = []
-    for mf in NOVELIST_ROOT.glob("*/project.json"):
+    return _index.query(outline_status, draft_status, sort, descending, limit, offset)
+
+
+# ---------------------------------------------------------------- storage
+
+def atomic_write_text(path: Path, text: str) -> None:
+    """Write via a sibling temp file + rename so readers never see a torn file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            fh.write(text)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def atomic_write_json(path: Path, obj: Any) -> None:
+    atomic_write_text(path, json.dumps(obj, indent=2))
+
+
+_thread_locks: dict[str, threading.RLock] = {}
+_thread_locks_guard = threading.Lock()
+_held = threading.local()
+
+
+@contextmanager
+def project_lock(pid: str) -> Iterator[None]:
+    """
+    Exclusive per‑project lock across threads and processes.
+    Re‑entrant within a thread; hold it only around file I/O, never
+    around LLM calls.
+    """
+    depth: dict[str, int] = getattr(_held, "depth", None) or {}
+    _held.depth = depth
+    if depth.get(pid):
+        depth[pid] += 1
         try:
-            with open(mf, encoding="utf-8") as fh:
-                out.append(json.load(fh))
-        except json.JSONDecodeError:
-            continue
-    return sorted(out, key=lambda x: x["created_at"], reverse=True)
+            yield
+        finally:
+            depth[pid] -= 1
+        return
+
+    with _thread_locks_guard:
+        tlock = _thread_locks.setdefault(pid, threading.RLock())
+    with tlock:
+        lock_path = NOVELIST_ROOT / pid / ".lock"
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(lock_path, "a") as fh:
+            if fcntl:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+            depth[pid] = 1
+            try:
+                yield
+            finally:
+                depth[pid] = 0
+                if fcntl:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+def _merge_patch(target: Any, patch: Any) -> Any:
+    """RFC 7386 JSON merge patch: dicts merge recursively, None deletes."""
+    if not isinstance(patch, dict):
+        return patch
+    out = dict(target) if isinstance(target, dict) else {}
+    for k, v in patch.items():
+        if v is None:
+            out.pop(k, None)
+        else:
+            out[k] = _merge_patch(out.get(k), v)
+    return out
+
+
+def update_json(pid: str, rel: str, fn: Callable[[Any], Any], default: Any = None) -> Any:
+    """Locked read‑modify‑write of <project>/<rel>; returns the new value."""
+    path = NOVELIST_ROOT / pid / rel
+    with project_lock(pid):
+        current = json.loads(path.read_text(encoding="utf-8")) if path.exists() else default
+        new = fn(current)
+        atomic_write_json(path, new)
+    return new
+
+
+def merge_json(pid: str, rel: str, patch: dict[str, Any]) -> dict[str, Any]:
+    return update_json(pid, rel, lambda cur: _merge_patch(cur or {}, patch), {})
+
+
+def commit_chapter(
+    pid: str,
+    num: int,
+    prose: str | None = None,
+    summary: str | None = None,
+    beats: dict[str, Any] | None = None,
+    themes: dict[str, int] | None = None,
+) -> None:
+    """Atomically write whichever chapter outputs are given, under one lock."""
+    root = NOVELIST_ROOT / pid
+    with project_lock(pid):
+        if prose is not None:
+            atomic_write_text(root / "chapters" / f"ch{num:02d}.md", prose)
+        if summary is not None:
+            atomic_write_json(root / "summaries" / f"ch{num:02d}.json", {"summary": summary})
+        if beats is not None:
+            atomic_write_json(root / "reports" / f"ch{num:02d}.beats.json", beats)
+        if themes is not None:
+            atomic_write_json(root / "reports" / f"ch{num:02d}.theme.json", themes)
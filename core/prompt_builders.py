@@ -2,16 +2,19 @@
 """
 core/prompt_builders.py
 • outline_prompt  – returns kwargs for openai.chat.completions.create
+• outline_fix_prompt – kwargs that regenerate only the listed chapters
 • draft_prompt    – returns   messages=[...]  for chapter drafting
 """
 from __future__ import annotations
-import json
+import functools
 from pathlib import Path
 from typing import List
 
 # ---------------------------------------------------------------- outline
 
-_SCHEMA = (Path(__file__).parent.parent / "schemas" / "outline.v1.json").read_text()
+@functools.lru_cache(maxsize=1)
+def _schema() -> str:
+    return (Path(__file__).parent.parent / "schemas" / "outline.v1.json").read_text()
 
 def outline_prompt(
     premise: str,
@@ -24,7 +27,7 @@ def outline_prompt(
         "Return ONLY valid JSON that follows the schema below.\n"
         "Each chapter MUST include a non‑empty 'beats' array (≥3 items).\n"
         "If a 'themes' array is provided, echo it unchanged.\n\n"
-        f"SCHEMA:\n{_SCHEMA}"
+        f"SCHEMA:\n{_schema()}"
     )
     usr = (
         f"Premise: {premise}\n"
@@ -42,13 +45,48 @@ def outline_prompt(
         "response_format": {"type": "json_object"},
     }
 
+def outline_fix_prompt(
+    premise: str,
+    genre: str | None,
+    outline: dict,
+    nums: List[int],
+) -> dict:
+    """Ask for chapters *nums* only; the rest of the outline is context."""
+    context = "\n".join(
+        f"{c.get('num')}. {c.get('title', '')} – {c.get('summary', '')}"
+        for c in outline.get("chapters", [])
+        if isinstance(c, dict)
+    )
+    sys = (
+        "You are a professional story architect repairing an outline.\n"
+        'Return ONLY JSON of the form {"chapters": [...]} containing exactly '
+        "the requested chapters, each with num, title, summary, target_words "
+        "(integer ≥500) and beats (≥3 strings)."
+    )
+    usr = (
+        f"Premise: {premise}\n"
+        f"Genre: {genre or 'unspecified'}\n"
+        f"Novel title: {outline.get('title', '')}\n"
+        f"Outline so far:\n{context}\n\n"
+        f"Regenerate chapters: {', '.join(map(str, nums))}"
+    )
+    return {
+        "model": "gpt-4o-mini",
+        "messages": [
+            {"role": "system", "content": sys},
+            {"role": "user", "content": usr},
+        ],
+        "response_format": {"type": "json_object"},
+    }
+
 # ---------------------------------------------------------------- draft
 
 def draft_prompt(chapter_spec: dict, prior_summaries: List[str]) -> List[dict]:
     """
     Build chat messages for drafting one chapter.
     chapter_spec: {"num":1,"title":...,"summary":...,"target_words":3000,"beats":[...]}
-    prior_summaries: list of ≤150‑char summaries for chapters 1..n‑1
+    prior_summaries: continuity lines for chapters 1..n‑1, already fitted
+                     to a token budget by core.context.build_context
     """
     num = chapter_spec["num"]
     beats = "\n".join(f"- {b}" for b in chapter_spec.get("beats", []))
@@ -57,8 +95,9 @@ def draft_prompt(chapter_spec: dict, prior_summaries: List[str]) -> List[dict]:
         "Write vivid, engaging fiction in Markdown.\n"
         "Honor target word count ±10% and include all beats."
     )
+    so_far = "\n".join(f"- {s}" for s in prior_summaries) or "- (this is the first chapter)"
     usr = (
-        f"Novel so far (summaries):\n{json.dumps(prior_summaries, indent=2)}\n\n"
+        f"Novel so far (summaries):\n{so_far}\n\n"
         f"Chapter {num} spec:\n"
         f"Title: {chapter_spec['title']}\n"
         f"Target words: {chapter_spec['target_words']}\n"
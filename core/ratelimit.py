@@ -0,0 +1,208 @@
+# v2025‑07‑08‑AI-generated
+"""
+core/ratelimit.py
+Client‑side flow control for LLM calls.
+
+* Token buckets for requests‑ and tokens‑per‑minute, per model. Shared
+  across processes through Redis (atomic Lua refill‑and‑take); falls
+  back to an in‑process bucket when Redis is unavailable. Redis calls
+  run off the event loop, so a slow Redis never stalls other streams.
+* estimate_tokens – prompt tokens + expected completion, charged before
+  sending and settled against real usage afterwards.
+* backoff_delay – exponential backoff with full jitter that honours a
+  server Retry‑After.
+* AIMD – adaptive in‑flight limit: +1/limit per success, halved on 429
+  (at most once per AIMD_COOLDOWN, so one burst of 429s is one cut).
+
+Environment variables:
+    RATE_LIMIT_RPM         default 500     0 disables the request bucket
+    RATE_LIMIT_TPM         default 200000  0 disables the token bucket
+    RATE_LIMIT_URL         default = BROKER_URL  ("local" → in‑process only)
+    LLM_MAX_CONCURRENCY    default 32      AIMD ceiling per process
+    LLM_MIN_CONCURRENCY    default 1       AIMD floor
+    AIMD_COOLDOWN          default 2       seconds between two decreases
+    LLM_EST_COMPLETION     default 1024    completion tokens assumed when
+                                           max_tokens is not set
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from typing import Any
+
+import redis
+
+import core.env  # loads .env
+from core.context import count_tokens
+
+RPM = int(os.getenv("RATE_LIMIT_RPM", "500"))
+TPM = int(os.getenv("RATE_LIMIT_TPM", "200000"))
+RATE_LIMIT_URL = os.getenv("RATE_LIMIT_URL", os.getenv("BROKER_URL", "redis://localhost:6379/0"))
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+COOLDOWN = float(os.getenv("AIMD_COOLDOWN", "2"))
+EST_COMPLETION = int(os.getenv("LLM_EST_COMPLETION", "1024"))
+PREFIX = "novelist:rl:"
+
+# refill, then take `want` if available (or unconditionally when forced);
+# returns the seconds to wait before `want` would fit, 0 when taken
+_LUA = """
+local cap, rate = tonumber(ARGV[1]), tonumber(ARGV[2])
+local want, now, force = tonumber(ARGV[3]), tonumber(ARGV[4]), ARGV[5] == '1'
+local b = redis.call('HMGET', KEYS[1], 'level', 'ts')
+local level = tonumber(b[1]) or cap
+local ts = tonumber(b[2]) or now
+level = math.min(cap, level + math.max(0, now - ts) * rate)
+want = math.min(want, cap)
+local wait = 0
+if force or level >= want then level = math.min(cap, level - want) else wait = (want - level) / rate end
+redis.call('HSET', KEYS[1], 'level', level, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(cap / rate) * 2 + 1)
+return tostring(wait)
+"""
+
+# ---------------------------------------------------------------- buckets
+
+class _LocalBuckets:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state: dict[str, tuple[float, float]] = {}
+
+    def take(self, key: str, cap: float, rate: float, want: float, force: bool) -> float:
+        now = time.time()
+        with self._lock:
+            level, ts = self._state.get(key, (cap, now))
+            level = min(cap, level + max(0.0, now - ts) * rate)
+            want = min(want, cap)
+            wait = 0.0
+            if force or level >= want:
+                level = min(cap, level - want)
+            else:
+                wait = (want - level) / rate
+            self._state[key] = (level, now)
+        return wait
+
+
+_local = _LocalBuckets()
+_script: Any = None
+_redis_down_until = 0.0
+
+
+def _take(key: str, cap: float, want: float, force: bool = False) -> float:
+    """Seconds to wait before *want* fits in bucket *key* (0 = taken)."""
+    global _script, _redis_down_until
+    rate = cap / 60.0
+    if RATE_LIMIT_URL != "local" and time.time() >= _redis_down_until:
+        try:
+            if _script is None:
+                _script = redis.Redis.from_url(RATE_LIMIT_URL, socket_timeout=1).register_script(_LUA)
+            return float(_script(keys=[PREFIX + key], args=[cap, rate, want, time.time(), int(force)]))
+        except (redis.RedisError, ValueError):
+            _redis_down_until = time.time() + 30  # retry Redis later, local meanwhile
+    return _local.take(key, cap, rate, want, force)
+
+
+def _remote() -> bool:
+    return RATE_LIMIT_URL != "local" and time.time() >= _redis_down_until
+
+
+async def _atake(key: str, cap: float, want: float) -> float:
+    # the Redis round trip (up to socket_timeout) must not stall the shared I/O loop
+    if _remote():
+        return await asyncio.to_thread(_take, key, cap, want)
+    return _take(key, cap, want)
+
+
+def estimate_tokens(kwargs: dict[str, Any]) -> int:
+    prompt = sum(count_tokens(str(m.get("content") or "")) + 4 for m in kwargs.get("messages", []))
+    completion = kwargs.get("max_tokens") or kwargs.get("max_completion_tokens") or EST_COMPLETION
+    return prompt + completion
+
+
+async def acquire(model: str, tokens: int) -> None:
+    """Wait until one request and *tokens* tokens fit under the model's limits."""
+    for key, cap, want in ((f"{model}:rpm", RPM, 1), (f"{model}:tpm", TPM, tokens)):
+        if cap <= 0:
+            continue
+        while (wait := await _atake(key, cap, want)) > 0:
+            await asyncio.sleep(wait + random.uniform(0, 0.05))
+
+
+def settle(model: str, estimated: int, actual: int) -> None:
+    """Correct the token bucket once real usage is known (refunds overestimates).
+
+    Called from event loops (and from a generator's GeneratorExit, where it
+    cannot await): with Redis the update runs on the default executor.
+    """
+    if TPM <= 0 or actual == estimated:
+        return
+    call = (f"{model}:tpm", TPM, actual - estimated, True)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is not None and _remote():
+        loop.run_in_executor(None, _take, *call)
+    else:
+        _take(*call)
+
+# ---------------------------------------------------------------- backoff
+
+def retry_after(exc: BaseException) -> float | None:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0, hint: float | None = None) -> float:
+    """Full‑jitter exponential backoff; never shorter than a Retry‑After hint."""
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    return max(delay, hint or 0.0)
+
+# ---------------------------------------------------------------- AIMD
+
+class AIMD:
+    """Additive‑increase / multiplicative‑decrease in‑flight limit (one event loop)."""
+
+    def __init__(self, ceiling: int = MAX_CONCURRENCY, floor: int = MIN_CONCURRENCY):
+        self.ceiling, self.floor = ceiling, floor
+        self.limit = float(ceiling)
+        self.inflight = 0
+        self._cut_at = 0.0
+        self._cond: asyncio.Condition | None = None
+
+    async def __aenter__(self) -> "AIMD":
+        self._cond = self._cond or asyncio.Condition()
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.inflight < int(self.limit))
+            self.inflight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        async with self._cond:
+            self.inflight -= 1
+            if exc_type is not None and _throttled(exc_type):
+                if time.monotonic() - self._cut_at >= COOLDOWN:
+                    self.limit = max(self.floor, self.limit / 2)
+                    self._cut_at = time.monotonic()
+            elif exc_type is None:
+                self.limit = min(self.ceiling, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+def _throttled(exc_type: type[BaseException]) -> bool:
+    # a RateLimitError means openai is loaded; don't import it just to check
+    openai = sys.modules.get("openai")
+    return openai is not None and issubclass(exc_type, openai.RateLimitError)
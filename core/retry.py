@@ -2,28 +2,54 @@
 """
 core.retry – decorator to retry a function up to N times when it raises
 openai.OpenAIError or jsonschema.ValidationError.
+
+Waits grow exponentially with full jitter (see core.ratelimit) and never
+undercut a server Retry‑After, so retrying workers spread out instead of
+hitting the API again in lock‑step.
+
+openai / jsonschema are not imported here: an exception can only be one
+of theirs if its module is already loaded, so the check looks them up
+in sys.modules and decorating a task stays cheap at import time.
+
+Throttled / transient API errors are already retried OPENAI_MAX_RETRIES
+times inside core.openai_wrap; one that comes out with `exhausted` set
+is raised at once instead of multiplying the attempts (and the load on
+an API that is already refusing us).
 """
 from functools import wraps
+import sys
 import time
-from typing import Callable, Type
-import openai, jsonschema
+from typing import Callable
 
-RETRY_EXC: tuple[Type[Exception], ...] = (
-    openai.OpenAIError,
-    jsonschema.ValidationError,
+from core.ratelimit import backoff_delay, retry_after
+
+RETRY_EXC: tuple[tuple[str, str], ...] = (
+    ("openai", "OpenAIError"),
+    ("jsonschema", "ValidationError"),
 )
 
-def retry(times: int = 3, delay: float = 1.0):
+def retryable(e: BaseException) -> bool:
+    if getattr(e, "exhausted", False):
+        return False
+    return any(
+        mod in sys.modules and isinstance(e, getattr(sys.modules[mod], name))
+        for mod, name in RETRY_EXC
+    )
+
+def retry(times: int = 3, delay: float = 1.0, max_delay: float = 60.0):
     def deco(fn: Callable):
         @wraps(fn)
         def _inner(*args, **kwargs):
             last = None
-            for _ in range(times):
+            for attempt in range(times):
                 try:
                     return fn(*args, **kwargs)
-                except RETRY_EXC as e:
+                except Exception as e:
+                    if not retryable(e):
+                        raise
                     last = e
-                    time.sleep(delay)
+                    if attempt < times - 1:
+                        time.sleep(backoff_delay(attempt, delay, max_delay, retry_after(e)))
             raise last
         return _inner
     return deco
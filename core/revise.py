@@ -0,0 +1,190 @@
+# v2025‑07‑12‑AI-generated
+"""
+core/revise.py
+Outline edits → the smallest set of chapter redrafts.
+
+Every draft leaves reports/chNN.provenance.json: a hash of the chapter
+spec it was written from and a hash of each prior summary in its
+continuity context (or, for an outline stand‑in, of that chapter's
+spec). A revision then works in waves:
+
+1. redraft chapters whose spec hash changed (or that are new);
+2. compare each redrafted chapter's new summary with its old one – if
+   they differ materially (word overlap below REVISE_SIMILARITY), the
+   next REVISE_HORIZON drafted chapters whose provenance quotes that
+   summary are redrafted in the next wave;
+3. stop when a wave changes no summary materially.
+
+Chapters whose spec and prior hashes all still match are provably
+untouched; chapters that only saw a small summary change, or a change
+further back than the horizon (where context.py has rolled it into an
+arc), are reported as "stale" but not redrafted.
+
+Environment variables:
+    REVISE_SIMILARITY   default 0.5   summary word overlap treated as unchanged
+    REVISE_HORIZON      default 2     downstream chapters a changed summary reaches
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from typing import Any, Callable
+
+from core import context as cx
+from core import projects as pj
+from core import textscan as ts
+
+SIMILARITY = float(os.getenv("REVISE_SIMILARITY", "0.5"))
+HORIZON = int(os.getenv("REVISE_HORIZON", "2"))
+
+
+def _hash(obj: Any) -> str:
+    data = obj if isinstance(obj, str) else json.dumps(obj, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode()).hexdigest()[:16]
+
+
+def spec_hash(spec: dict[str, Any]) -> str:
+    return _hash(spec)
+
+
+def _path(pid: str, num: int):
+    return pj.NOVELIST_ROOT / pid / "reports" / f"ch{num:02d}.provenance.json"
+
+
+def _outline_specs(pid: str) -> dict[int, dict[str, Any]]:
+    outline = json.loads((pj.NOVELIST_ROOT / pid / "outline.json").read_text(encoding="utf-8"))
+    return {c["num"]: c for c in outline["chapters"]}
+
+
+def record(pid: str, num: int, spec: dict[str, Any], priors: dict[int, str]) -> None:
+    """
+    Store what chapter *num* was drafted from (called after the prose is
+    committed). A prior that is not the chapter's real summary – a bulk
+    draft's outline stand‑in – is recorded as "spec:<hash>" of that
+    chapter's outline entry, so the real summary landing later does not
+    make this chapter stale; only an edit of that entry does.
+    """
+    real = cx.load_summaries(pid, num)
+    specs = _outline_specs(pid)
+    def _prior(k: int, text: str) -> str:
+        if real.get(k) != text and k in specs:
+            return "spec:" + spec_hash(specs[k])
+        return _hash(text)
+    pj.atomic_write_json(_path(pid, num), {
+        "spec": spec_hash(spec),
+        "priors": {str(k): _prior(k, v) for k, v in sorted(priors.items())},
+    })
+
+
+def _prior_changed(h: str, k: int, summaries: dict[int, str], specs: dict[int, dict[str, Any]]) -> bool:
+    if h.startswith("spec:"):
+        return k in specs and h != "spec:" + spec_hash(specs[k])
+    return k in summaries and _hash(summaries[k]) != h
+
+
+def provenance(pid: str, num: int) -> dict[str, Any] | None:
+    p = _path(pid, num)
+    return json.loads(p.read_text(encoding="utf-8")) if p.exists() else None
+
+
+def diff(old: dict[str, Any] | None, new: dict[str, Any]) -> dict[str, list[int]]:
+    """Chapter numbers whose spec changed, appeared or disappeared between two outlines."""
+    before = {c["num"]: spec_hash(c) for c in (old or {}).get("chapters", [])}
+    after = {c["num"]: spec_hash(c) for c in new["chapters"]}
+    return {
+        "changed": sorted(n for n in after if n in before and after[n] != before[n]),
+        "added": sorted(n for n in after if n not in before),
+        "removed": sorted(n for n in before if n not in after),
+    }
+
+
+def _drafted(pid: str) -> set[int]:
+    root = pj.NOVELIST_ROOT / pid / "chapters"
+    if not root.exists():
+        return set()
+    return {int(f[2:-3]) for f in os.listdir(root) if f.startswith("ch") and f.endswith(".md")}
+
+
+def plan(pid: str, changed: list[int] = ()) -> dict[str, list[int]]:
+    """
+    Classify drafted chapters against the current outline:
+    redraft (spec differs from provenance, or listed in *changed* when
+    no provenance exists), stale (a prior summary changed since), clean.
+    """
+    specs = _outline_specs(pid)
+    drafted = _drafted(pid)
+    summaries = cx.load_summaries(pid, max(specs) + 1) if specs else {}
+    out: dict[str, list[int]] = {"redraft": [], "missing": [], "stale": [], "clean": []}
+    for n, c in sorted(specs.items()):
+        prov = provenance(pid, n)
+        if n not in drafted:
+            out["missing"].append(n)
+        elif prov is None:
+            out["redraft" if n in changed else "clean"].append(n)
+        elif prov["spec"] != spec_hash(c):
+            out["redraft"].append(n)
+        elif any(_prior_changed(h, int(k), summaries, specs) for k, h in prov["priors"].items()):
+            out["stale"].append(n)
+        else:
+            out["clean"].append(n)
+    return out
+
+
+def similarity(a: str, b: str) -> float:
+    """Word overlap (Jaccard) of two summaries."""
+    ta, tb = set(ts.normalise(a).split()), set(ts.normalise(b).split())
+    if not ta and not tb:
+        return 1.0
+    return len(ta & tb) / len(ta | tb)
+
+
+def downstream(
+    pid: str, before: dict[int, str | None], drafted: set[int], done: set[int]
+) -> list[int]:
+    """Next wave: chapters within HORIZON of a materially changed summary."""
+    after = cx.load_summaries(pid, max(before) + 1) if before else {}
+    wave: set[int] = set()
+    for k, old in before.items():
+        new = after.get(k)
+        if old is not None and new is not None and similarity(old, new) >= SIMILARITY:
+            continue
+        for m in range(k + 1, k + 1 + HORIZON):
+            prov = provenance(pid, m)
+            if m in drafted and m not in done and (prov is None or str(k) in prov["priors"]):
+                wave.add(m)
+    return sorted(wave)
+
+
+def run_revision(
+    pid: str,
+    changed: list[int],
+    draft: Callable[[list[int]], None],
+    update_state: Callable[..., None] = lambda **k: None,
+) -> dict[str, Any]:
+    """
+    Redraft in waves; *draft(nums)* must leave fresh summaries on disk
+    (bulk_draft.run_bulk with postprocess inline). Returns the report.
+    """
+    p = plan(pid, changed)
+    drafted = _drafted(pid)
+    wave = sorted(set(p["redraft"]) | (set(changed) & set(p["missing"])))
+    done: set[int] = set()
+    waves: list[list[int]] = []
+    while wave:
+        waves.append(wave)
+        update_state(state="PROGRESS", meta={"phase": "revise", "wave": len(waves), "chapters": wave})
+        before = cx.load_summaries(pid, max(wave) + 1)
+        before = {n: before.get(n) for n in wave}
+        draft(wave)
+        done |= set(wave)
+        drafted |= set(wave)
+        wave = downstream(pid, before, drafted, done)
+    final = plan(pid)
+    return {
+        "waves": waves,
+        "redrafted": sorted(done),
+        "stale": final["stale"],
+        "skipped": len(drafted - done),
+    }
@@ -0,0 +1,245 @@
+# v2025‑07‑13‑AI-generated
+"""
+core/scheduler.py
+Fair dispatch of bulk chapter work across projects.
+
+A bulk draft is split into one item per chapter. Items wait in a
+per‑project list; projects with waiting work sit on a ring. next()
+rotates the ring and hands out the first item whose project is below its
+concurrency cap, so two 60‑chapter books and a 3‑chapter one advance
+one chapter each in turn instead of first‑come‑first‑served. Only
+SCHED_SLOTS items are in flight at once, so the broker's bulk queue
+stays short and a newly submitted project is served within one round.
+
+A handed‑out item holds a lease (keyed by project, job and chapter)
+until release() or SCHED_LEASE seconds pass. An expired lease – worker
+killed mid‑chapter, message lost – frees its slot and puts the chapter
+back at the front of its queue, marked "retake" so the next task may
+reclaim a chapter its job record still shows as drafting. Expiry is
+checked on every hand‑out; worker.tasks.pump_task runs one every
+SCHED_PUMP_EVERY seconds (Celery beat) so an idle system recovers too.
+
+State lives in Redis (one Lua call per hand‑out, shared by all
+workers); SCHED_URL=local keeps it in‑process for eager / single‑worker
+runs.
+
+Which chapters a job still needs, and whether it is paused or
+cancelled, is tracked in its core.jobs record; the scheduler only
+orders the hand‑outs.
+
+Environment variables:
+    SCHED_URL            default = BROKER_URL  ("local" → in‑process)
+    SCHED_PROJECT_CAP    default 4    chapters of one project in flight
+    SCHED_SLOTS          default 16   bulk chapters in flight overall (0 = no limit)
+    SCHED_LEASE          default 1800 seconds before an unreleased slot is reclaimed
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any
+
+import redis
+
+import core.env  # loads .env
+
+SCHED_URL = os.getenv("SCHED_URL", os.getenv("BROKER_URL", "redis://localhost:6379/0"))
+PROJECT_CAP = int(os.getenv("SCHED_PROJECT_CAP", "4"))
+SLOTS = int(os.getenv("SCHED_SLOTS", "16"))
+LEASE = float(os.getenv("SCHED_LEASE", "1800"))
+PREFIX = "novelist:sched:"
+
+# KEYS: ring, leases, retake   ARGV: project cap, slots, queue prefix, lease prefix, now, lease
+# leases are sorted sets (member = item, score = expiry): one overall, one per project;
+# returns {item, 1 if it is a retake} or false
+_NEXT = """
+local cap, slots = tonumber(ARGV[1]), tonumber(ARGV[2])
+local now, lease = tonumber(ARGV[5]), tonumber(ARGV[6])
+for _, item in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now)) do
+  local pid = cjson.decode(item)['pid']
+  redis.call('ZREM', ARGV[4] .. pid, item)
+  redis.call('LPUSH', ARGV[3] .. pid, item)
+  redis.call('SADD', KEYS[3], item)
+  redis.call('LREM', KEYS[1], 0, pid)
+  redis.call('RPUSH', KEYS[1], pid)
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+if slots > 0 and redis.call('ZCARD', KEYS[2]) >= slots then return false end
+for _ = 1, redis.call('LLEN', KEYS[1]) do
+  local pid = redis.call('RPOPLPUSH', KEYS[1], KEYS[1])
+  local q = ARGV[3] .. pid
+  if redis.call('LLEN', q) == 0 then
+    redis.call('LREM', KEYS[1], 0, pid)
+  elseif redis.call('ZCARD', ARGV[4] .. pid) < cap then
+    local item = redis.call('LPOP', q)
+    redis.call('ZADD', KEYS[2], now + lease, item)
+    redis.call('ZADD', ARGV[4] .. pid, now + lease, item)
+    return {item, redis.call('SREM', KEYS[3], item)}
+  end
+end
+return false
+"""
+
+# ---------------------------------------------------------------- stores
+
+class _RedisStore:
+    def __init__(self, url: str):
+        self.r = redis.Redis.from_url(url, decode_responses=True)
+        self._next = self.r.register_script(_NEXT)
+
+    def submit(self, pid: str, items: list[str]) -> None:
+        pipe = self.r.pipeline()
+        pipe.rpush(PREFIX + "q:" + pid, *items)
+        pipe.lrem(PREFIX + "ring", 0, pid)
+        pipe.rpush(PREFIX + "ring", pid)
+        pipe.execute()
+
+    def next(self) -> tuple[str, bool] | None:
+        out = self._next(
+            keys=[PREFIX + "ring", PREFIX + "leases", PREFIX + "retake"],
+            args=[PROJECT_CAP, SLOTS, PREFIX + "q:", PREFIX + "leases:", time.time(), LEASE],
+        )
+        return (out[0], bool(out[1])) if out else None
+
+    def release(self, pid: str, item: str) -> None:
+        pipe = self.r.pipeline()
+        pipe.zrem(PREFIX + "leases", item)
+        pipe.zrem(PREFIX + "leases:" + pid, item)
+        pipe.execute()
+
+    def requeue(self, pid: str, item: str, retake: bool) -> None:
+        pipe = self.r.pipeline()
+        pipe.zrem(PREFIX + "leases", item)
+        pipe.zrem(PREFIX + "leases:" + pid, item)
+        pipe.lpush(PREFIX + "q:" + pid, item)
+        if retake:
+            pipe.sadd(PREFIX + "retake", item)
+        pipe.lrem(PREFIX + "ring", 0, pid)
+        pipe.rpush(PREFIX + "ring", pid)
+        pipe.execute()
+
+    def drop(self, pid: str, job: str) -> int:
+        key = PREFIX + "q:" + pid
+        items = [i for i in self.r.lrange(key, 0, -1) if json.loads(i)["job"] == job]
+        pipe = self.r.pipeline()
+        for i in items:
+            pipe.lrem(key, 1, i)
+            pipe.srem(PREFIX + "retake", i)
+        pipe.execute()
+        return len(items)
+
+
+class _LocalStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ring: deque[str] = deque()
+        self.queues: dict[str, deque[str]] = {}
+        self.leases: dict[str, tuple[str, float]] = {}  # item → (pid, expiry)
+        self.retake: set[str] = set()
+
+    def submit(self, pid: str, items: list[str]) -> None:
+        with self._lock:
+            self.queues.setdefault(pid, deque()).extend(items)
+            if pid in self.ring:
+                self.ring.remove(pid)
+            self.ring.append(pid)
+
+    def _push_front(self, pid: str, item: str) -> None:
+        self.queues.setdefault(pid, deque()).appendleft(item)
+        if pid in self.ring:
+            self.ring.remove(pid)
+        self.ring.append(pid)
+
+    def next(self) -> tuple[str, bool] | None:
+        now = time.time()
+        with self._lock:
+            for item, (pid, expiry) in list(self.leases.items()):
+                if expiry <= now:
+                    del self.leases[item]
+                    self._push_front(pid, item)
+                    self.retake.add(item)
+            if SLOTS > 0 and len(self.leases) >= SLOTS:
+                return None
+            running: dict[str, int] = {}
+            for p, _ in self.leases.values():
+                running[p] = running.get(p, 0) + 1
+            for _ in range(len(self.ring)):
+                self.ring.rotate(1)
+                pid = self.ring[0]
+                if not self.queues.get(pid):
+                    self.ring.remove(pid)
+                elif running.get(pid, 0) < PROJECT_CAP:
+                    item = self.queues[pid].popleft()
+                    self.leases[item] = (pid, now + LEASE)
+                    retake = item in self.retake
+                    self.retake.discard(item)
+                    return item, retake
+            return None
+
+    def release(self, pid: str, item: str) -> None:
+        with self._lock:
+            self.leases.pop(item, None)
+
+    def requeue(self, pid: str, item: str, retake: bool) -> None:
+        with self._lock:
+            self.leases.pop(item, None)
+            self._push_front(pid, item)
+            if retake:
+                self.retake.add(item)
+
+    def drop(self, pid: str, job: str) -> int:
+        with self._lock:
+            q = self.queues.get(pid, deque())
+            keep = deque(i for i in q if json.loads(i)["job"] != job)
+            self.queues[pid] = keep
+            self.retake.difference_update(set(q) - set(keep))
+            return len(q) - len(keep)
+
+
+_store: _RedisStore | _LocalStore | None = None
+
+
+def _get():
+    global _store
+    if _store is None:
+        _store = _LocalStore() if SCHED_URL == "local" else _RedisStore(SCHED_URL)
+    return _store
+
+# ---------------------------------------------------------------- api
+
+def _item(pid: str, job: str, num: int) -> str:
+    return json.dumps({"pid": pid, "num": num, "job": job})
+
+
+def submit(pid: str, job: str, nums: list[int]) -> None:
+    """Queue chapters *nums* of project *pid* as job *job*."""
+    if nums:
+        _get().submit(pid, [_item(pid, job, n) for n in nums])
+
+
+def next_item() -> dict[str, Any] | None:
+    """
+    Claim the next chapter in round‑robin order, or None if all projects
+    are capped / idle: {"pid", "num", "job", "retake"}.
+    """
+    out = _get().next()
+    return {**json.loads(out[0]), "retake": out[1]} if out else None
+
+
+def release(pid: str, job: str, num: int) -> None:
+    """Give back the slot next_item() leased for this chapter (no‑op once expired)."""
+    _get().release(pid, _item(pid, job, num))
+
+
+def requeue(item: dict[str, Any]) -> None:
+    """Put a leased chapter back at the front of its queue (e.g. the send failed)."""
+    _get().requeue(item["pid"], _item(item["pid"], item["job"], item["num"]), item.get("retake", False))
+
+
+def drop(pid: str, job: str) -> int:
+    """Remove *job*'s waiting chapters; returns how many were dropped."""
+    return _get().drop(pid, job)
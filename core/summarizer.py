@@ -3,34 +3,71 @@
 core/summarizer.py
 Produces a ≤150‑character summary for continuity prompts.
 
-Two modes:
+Three modes:
 * FAST   – simple heuristic (first 150 chars, stripped) for offline tests.
 * OPENAI – short `chat.completions` call for production.
+* BATCH  – for many chapters at once (bulk drafts, re‑imports):
+    SUMMARY_BATCH=pack → several chapters per structured‑output request
+    SUMMARY_BATCH=api  → one OpenAI Batch API job (half price, slow)
+  A single chapter in BATCH mode is summarised like OPENAI.
 
-Switch via env var  SUMMARY_MODE = fast | openai
+Switch via env var  SUMMARY_MODE = fast | openai | batch
+asummarize is the coroutine form for concurrent callers;
+asummarize_many takes {chapter_num: text}. Every call goes through
+core.openai_wrap, so it is rate‑limited and lands in the cost ledger.
+
+Environment variables:
+    SUMMARY_MODEL          default gpt-4o-mini
+    SUMMARY_BATCH          default pack
+    SUMMARY_BATCH_SIZE     default 8      chapters per packed request
+    SUMMARY_BATCH_TOKENS   default 60000  prompt tokens per packed request
 """
 
 from __future__ import annotations
 
+import asyncio
+import json
 import os
 import re
 
 import core.env  # loads .env
-import openai
+from core import ledger
+from core.context import count_tokens
+from core.openai_wrap import abatch_completions, achat_completion, run_sync
 
 MODE = os.getenv("SUMMARY_MODE", "openai").lower()
+MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+BATCH_VIA = os.getenv("SUMMARY_BATCH", "pack").lower()
+BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", "8"))
+BATCH_TOKENS = int(os.getenv("SUMMARY_BATCH_TOKENS", "60000"))
 MAX_CHAR = 150
 
+_PACK_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "chapter_summaries",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "additionalProperties": False,
+            "required": ["summaries"],
+            "properties": {"summaries": {"type": "array", "items": {
+                "type": "object",
+                "additionalProperties": False,
+                "required": ["num", "summary"],
+                "properties": {"num": {"type": "integer"}, "summary": {"type": "string"}},
+            }}},
+        },
+    },
+}
+
 
 def _heuristic(text: str) -> str:
     snippet = re.sub(r"\s+", " ", text).strip()
     return snippet[:MAX_CHAR]
 
 
-def summarize(text: str) -> str:
-    if MODE == "fast":
-        return _heuristic(text)
-
+def _request(text: str) -> dict:
     prompt = [
         {
             "role": "system",
@@ -41,5 +78,92 @@ def summarize(text: str) -> str:
         },
         {"role": "user", "content": text},
     ]
-    resp = openai.chat.completions.create(model="gpt-4o-mini", messages=prompt)
+    return {"model": MODEL, "messages": prompt}
+
+
+def summarize(text: str) -> str:
+    return run_sync(asummarize(text))
+
+
+async def asummarize(text: str) -> str:
+    if MODE == "fast":
+        return _heuristic(text)
+
+    with ledger.tagged(kind="summary"):
+        resp = await achat_completion(**_request(text))
     return resp.choices[0].message.content.strip()[:MAX_CHAR]
+
+# ---------------------------------------------------------------- many
+
+def summarize_many(texts: dict[int, str]) -> dict[int, str]:
+    return run_sync(asummarize_many(texts))
+
+
+async def asummarize_many(texts: dict[int, str]) -> dict[int, str]:
+    """Summaries for {chapter_num: text}, batched when SUMMARY_MODE=batch."""
+    if MODE == "fast":
+        return {n: _heuristic(t) for n, t in texts.items()}
+    if MODE != "batch" or len(texts) == 1:
+        return await _one_each(texts)
+    with ledger.tagged(kind="summary"):
+        if BATCH_VIA == "api":
+            out = await _batch_api(texts)
+        else:
+            packs = await asyncio.gather(*(_pack(g) for g in _packs(texts)))
+            out = {n: s for p in packs for n, s in p.items()}
+    # anything the batch dropped is summarised on its own
+    out.update(await _one_each({n: t for n, t in texts.items() if n not in out}))
+    return out
+
+
+async def _one_each(texts: dict[int, str]) -> dict[int, str]:
+    async def _one(n: int, t: str) -> tuple[int, str]:
+        with ledger.tagged(chapter=n):
+            return n, await asummarize(t)
+    return dict(await asyncio.gather(*(_one(n, t) for n, t in texts.items())))
+
+
+def _packs(texts: dict[int, str]) -> list[dict[int, str]]:
+    """Greedy groups in chapter order, bounded by BATCH_SIZE and BATCH_TOKENS."""
+    groups: list[dict[int, str]] = [{}]
+    used = 0
+    for n in sorted(texts):
+        cost = count_tokens(texts[n])
+        if groups[-1] and (len(groups[-1]) >= BATCH_SIZE or used + cost > BATCH_TOKENS):
+            groups.append({})
+            used = 0
+        groups[-1][n] = texts[n]
+        used += cost
+    return groups
+
+
+async def _pack(group: dict[int, str]) -> dict[int, str]:
+    sys = (
+        f"Summarise each chapter below in no more than {MAX_CHAR} characters, "
+        "plain text. Return one entry per chapter, using its number."
+    )
+    usr = "\n\n".join(f"=== CHAPTER {n} ===\n{t}" for n, t in group.items())
+    resp = await achat_completion(
+        model=MODEL,
+        messages=[{"role": "system", "content": sys}, {"role": "user", "content": usr}],
+        response_format=_PACK_FORMAT,
+    )
+    try:
+        items = json.loads(resp.choices[0].message.content)["summaries"]
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return {}
+    return {
+        int(s["num"]): s["summary"].strip()[:MAX_CHAR]
+        for s in items
+        if isinstance(s, dict) and s.get("num") in group and s.get("summary")
+    }
+
+
+async def _batch_api(texts: dict[int, str]) -> dict[int, str]:
+    requests = {f"ch-{n}": _request(t) for n, t in texts.items()}
+    tags = {f"ch-{n}": {"chapter": n} for n in texts}
+    results = await abatch_completions(requests, tags)
+    return {
+        int(cid[3:]): resp.choices[0].message.content.strip()[:MAX_CHAR]
+        for cid, resp in results.items()
+    }
@@ -0,0 +1,207 @@
+# v2025‑07‑07‑AI-generated
+"""
+core/textscan.py
+Shared text‑analysis engine for beat and theme checks.
+
+A chapter is normalised once (lower‑case, non‑word characters dropped,
+with a map back to original character offsets) and all patterns are
+matched in one linear pass of an Aho–Corasick automaton. Counts follow
+str.count semantics (non‑overlapping per pattern); offsets point into
+the original text.
+
+Results are cached per chapter hash: a later scan of the same text only
+runs the automaton for patterns not seen yet, so check_chapter can scan
+beats + themes together and verify_beats / theme scoring reuse it.
+
+fuzzy_match() is an optional token‑overlap mode that catches
+paraphrased beats the exact matcher misses.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Iterable
+
+_WORD = re.compile(r"\w+")
+_SENTENCE = re.compile(r"[^.!?\n]+[.!?]*")
+_CACHE_SIZE = 256
+
+
+def normalise(text: str) -> str:
+    return re.sub(r"\W+", "", text.lower())
+
+
+def _normalise_mapped(text: str) -> tuple[str, list[int]]:
+    """Normalised text plus, for each of its chars, the source index."""
+    parts: list[str] = []
+    offsets: list[int] = []
+    for m in _WORD.finditer(text):
+        seg = m.group().lower()
+        parts.append(seg)
+        if len(seg) == m.end() - m.start():
+            offsets.extend(range(m.start(), m.end()))
+        else:  # lower() changed the length (e.g. "İ"); map per source char
+            for i, ch in enumerate(m.group(), start=m.start()):
+                offsets.extend([i] * len(ch.lower()))
+    return "".join(parts), offsets
+
+# ---------------------------------------------------------------- automaton
+
+class Automaton:
+    """Aho–Corasick over already‑normalised, non‑empty patterns."""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns = list(dict.fromkeys(p for p in patterns if p))
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail: list[int] = [0]
+        self.out: list[list[int]] = [[]]
+        for idx, pat in enumerate(self.patterns):
+            node = 0
+            for ch in pat:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = nxt
+            self.out[node].append(idx)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self.goto[node].items():
+                queue.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                cand = self.goto[f].get(ch, 0)
+                self.fail[nxt] = cand if cand != nxt else 0
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def search(self, text: str) -> dict[str, list[tuple[int, int]]]:
+        """Non‑overlapping (per pattern) [start, end) spans in *text*."""
+        hits: dict[str, list[tuple[int, int]]] = {p: [] for p in self.patterns}
+        last_end = [0] * len(self.patterns)
+        goto, fail, out, pats = self.goto, self.fail, self.out, self.patterns
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for idx in out[node]:
+                start = i + 1 - len(pats[idx])
+                if start >= last_end[idx]:
+                    hits[pats[idx]].append((start, i + 1))
+                    last_end[idx] = i + 1
+        return hits
+
+
+@lru_cache(maxsize=64)
+def _automaton(patterns: tuple[str, ...]) -> Automaton:
+    return Automaton(patterns)
+
+# ---------------------------------------------------------------- scanning
+
+@dataclass
+class _Entry:
+    norm: str
+    offsets: list[int]
+    spans: dict[str, list[tuple[int, int]]] = field(default_factory=dict)
+
+
+_cache: OrderedDict[str, _Entry] = OrderedDict()
+_lock = threading.Lock()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _entry(text: str) -> _Entry:
+    key = text_hash(text)
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            _cache.move_to_end(key)
+            return entry
+    entry = _Entry(*_normalise_mapped(text))
+    with _lock:
+        entry = _cache.setdefault(key, entry)
+        if len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return entry
+
+
+def scan(text: str, patterns: Iterable[str]) -> dict[str, dict]:
+    """
+    {pattern: {"count": n, "offsets": [[start, end], ...]}} for each raw
+    pattern, offsets in *text*. Patterns with no word characters never match.
+    """
+    patterns = list(patterns)
+    entry = _entry(text)
+    wanted = {p: normalise(p) for p in patterns}
+    missing = tuple(sorted({n for n in wanted.values() if n and n not in entry.spans}))
+    if missing:
+        entry.spans.update(_automaton(missing).search(entry.norm))
+
+    out: dict[str, dict] = {}
+    for raw, norm in wanted.items():
+        spans = entry.spans.get(norm, []) if norm else []
+        out[raw] = {
+            "count": len(spans),
+            "offsets": [[entry.offsets[s], entry.offsets[e - 1] + 1] for s, e in spans],
+        }
+    return out
+
+# ---------------------------------------------------------------- fuzzy
+
+_STOP = frozenset(
+    "a an and are as at be but by for from has have he her his in into is it its "
+    "of on or she that the their them they this to was were with".split()
+)
+
+
+def _stem(word: str) -> str:
+    for suf in ("ing", "edly", "ed", "es", "ly", "s"):
+        if len(word) > len(suf) + 2 and word.endswith(suf):
+            return word[: -len(suf)]
+    return word
+
+
+def _tokens(text: str) -> set[str]:
+    return {_stem(w) for w in _WORD.findall(text.lower()) if w not in _STOP and len(w) > 2}
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def _sentences(text: str) -> tuple[tuple[int, int, frozenset[str]], ...]:
+    return tuple(
+        (m.start(), m.end(), frozenset(_tokens(m.group())))
+        for m in _SENTENCE.finditer(text)
+        if m.group().strip()
+    )
+
+
+def fuzzy_match(text: str, phrase: str, window: int = 2) -> tuple[float, list[int] | None]:
+    """
+    Best share of *phrase*'s content words found inside any run of
+    *window* consecutive sentences, with that run's [start, end] offsets.
+    """
+    want = _tokens(phrase)
+    if not want:
+        return 0.0, None
+    sents = _sentences(text)
+    best, span = 0.0, None
+    for i in range(len(sents)):
+        run = sents[i : i + window]
+        got = set().union(*(s[2] for s in run))
+        score = len(want & got) / len(want)
+        if score > best:
+            best, span = score, [run[0][0], run[-1][1]]
+    return best, span
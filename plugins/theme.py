@@ -3,51 +3,117 @@
 plugins/theme.py
 Post‑chapter motif coverage checker.
 
-Usage: imported by core.draft.generate_chapter().
+Usage: imported by core.draft.check_chapter().
 Requires outline.json to contain a top‑level key:
     "themes": ["Hope", "Memory"]
 Outputs:
     reports/chNN.theme.json     { "Hope": 3, "Memory": 0 }
-    reports/theme_totals.json   accumulated counts
+    reports/theme_index.json    { "chapters": {"3": {...}}, "totals": {...} }
+    reports/theme_totals.json   totals only (kept for older readers)
+
+The index stores each chapter's contribution, so re‑checking a
+regenerated chapter applies the delta instead of adding its counts a
+second time. recompute_totals() rebuilds everything from the chapter
+files in parallel for repairs.
 """
 
 from __future__ import annotations
-import json, re
+import json
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List
+from typing import Any, Dict, List
 
 from core import projects as pj
+from core import textscan as ts
 
-def _norm(text: str) -> str:
-    return re.sub(r"\W+", "", text.lower())
+INDEX_FILE = "reports/theme_index.json"
+TOTALS_FILE = "reports/theme_totals.json"
 
 def _score(text: str, themes: List[str]) -> Dict[str, int]:
-    norm = _norm(text)
-    return {t: norm.count(_norm(t)) for t in themes}
+    hits = ts.scan(text, themes)
+    return {t: hits[t]["count"] for t in themes}
 
-def check_themes(pid: str, chapter_num: int, prose: str) -> None:
+def _themes(pid: str) -> List[str]:
+    outline = json.loads((pj.NOVELIST_ROOT / pid / "outline.json").read_text(encoding="utf-8"))
+    return outline.get("themes", [])
+
+def _bootstrap(root: Path) -> dict[str, Any]:
+    """Seed the index from per‑chapter reports (projects older than the index)."""
+    chapters = {}
+    for p in sorted((root / "reports").glob("ch*.theme.json")):
+        chapters[str(int(p.name[2:].split(".")[0]))] = json.loads(p.read_text(encoding="utf-8"))
+    return {"chapters": chapters, "totals": _sum(chapters.values(), [])}
+
+def _sum(contributions, themes: List[str]) -> Dict[str, int]:
+    totals = {t: 0 for t in themes}
+    for scores in contributions:
+        for t, n in scores.items():
+            totals[t] = totals.get(t, 0) + n
+    return totals
+
+def _write(pid: str, index: dict[str, Any]) -> None:
     root = pj.NOVELIST_ROOT / pid
-    outline = json.loads((root / "outline.json").read_text(encoding="utf-8"))
-    themes = outline.get("themes", [])
+    pj.atomic_write_json(root / INDEX_FILE, index)
+    pj.atomic_write_json(root / TOTALS_FILE, index["totals"])
+
+def check_themes(pid: str, chapter_num: int, prose: str) -> None:
+    themes = _themes(pid)
     if not themes:
         return
 
     scores = _score(prose, themes)
+    root = pj.NOVELIST_ROOT / pid
+    with pj.project_lock(pid):
+        pj.commit_chapter(pid, chapter_num, themes=scores)
+        p = root / INDEX_FILE
+        index = json.loads(p.read_text(encoding="utf-8")) if p.exists() else _bootstrap(root)
+        old = index["chapters"].get(str(chapter_num), {})
+        totals = {t: 0 for t in themes}
+        totals.update(index["totals"])
+        for t in set(old) | set(scores):
+            totals[t] = totals.get(t, 0) + scores.get(t, 0) - old.get(t, 0)
+        index["chapters"][str(chapter_num)] = scores
+        index["totals"] = totals
+        _write(pid, index)
+
+def theme_totals(pid: str) -> Dict[str, int] | None:
+    """Project totals served from the index (None if nothing scored yet)."""
+    root = pj.NOVELIST_ROOT / pid
+    for rel in (INDEX_FILE, TOTALS_FILE):
+        p = root / rel
+        if p.exists():
+            data = json.loads(p.read_text(encoding="utf-8"))
+            return data["totals"] if rel == INDEX_FILE else data
+    return None
 
-    # per‑chapter report
-    (root / "reports").mkdir(exist_ok=True)
-    (root / "reports" / f"ch{chapter_num:02d}.theme.json").write_text(
-        json.dumps(scores, indent=2), encoding="utf-8"
-    )
+# ---------------------------------------------------------------- repair
 
-    # project aggregate
-    agg_path = root / "reports" / "theme_totals.json"
-    totals = {t: 0 for t in themes}
-    if agg_path.exists():
-        totals.update(json.loads(agg_path.read_text()))
-    for t, n in scores.items():
-        totals[t] = totals.get(t, 0) + n
-    agg_path.write_text(json.dumps(totals, indent=2), encoding="utf-8")
+def _score_file(path: str, themes: List[str]) -> Dict[str, int]:
+    return _score(Path(path).read_text(encoding="utf-8"), themes)
+
+def _pool(workers: int | None) -> Executor:
+    # Celery prefork children are daemonic and may not fork again
+    if multiprocessing.current_process().daemon:
+        return ThreadPoolExecutor(max_workers=workers)
+    return ProcessPoolExecutor(max_workers=workers)
+
+def recompute_totals(pid: str, workers: int | None = None) -> Dict[str, int]:
+    """Rescore every drafted chapter in parallel and rebuild the index."""
+    root = pj.NOVELIST_ROOT / pid
+    themes = _themes(pid)
+    files = sorted((root / "chapters").glob("ch*.md"))
+    nums = [str(int(p.stem[2:])) for p in files]
+    with _pool(workers) as pool:
+        scores = list(pool.map(_score_file, map(str, files), [themes] * len(files)))
+
+    chapters = dict(zip(nums, scores))
+    index = {"chapters": chapters, "totals": _sum(chapters.values(), themes)}
+    with pj.project_lock(pid):
+        for num, s in chapters.items():
+            pj.commit_chapter(pid, int(num), themes=s)
+        _write(pid, index)
+    return index["totals"]
 
 def register(core):
     # reserved for future plug‑in registry
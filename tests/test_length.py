@@ -0,0 +1,37 @@
+from core import length as ln
+
+
+def _prose(sentences: int, words: int = 10) -> str:
+    return " ".join(" ".join(["word"] * (words - 1) + ["end."]) for _ in range(sentences))
+
+
+def test_counter_keeps_going_below_stop():
+    c = ln.Counter(100)
+    assert c.feed(_prose(5)) is None
+    assert c.words == 50
+
+
+def test_counter_cuts_single_large_delta_after_stop():
+    c = ln.Counter(500)  # stop_at = 550
+    text = _prose(60)  # 600 words, one delta (cache replay)
+    cut = c.feed(text)
+    assert cut is not None and cut.endswith("end.")
+    assert ln.words(cut) == 550
+
+
+def test_counter_cuts_at_first_sentence_end_after_crossing():
+    c = ln.Counter(20)  # stop_at = 22
+    assert c.feed(_prose(2)) is None
+    cut = c.feed("one two. three four five six. seven.")
+    assert cut == "one two. three four five six."
+
+
+def test_counter_cuts_at_sentence_end_once_over():
+    c = ln.Counter(10)
+    assert c.feed("a " * 11) is None  # over, but no sentence end yet
+    assert c.feed("b c. d e.") == "b c."
+
+
+def test_trim_partial_drops_unfinished_sentence():
+    assert ln.trim_partial("One. Two three") == "One."
+    assert ln.trim_partial("One. Two.") == "One. Two."
@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from core import outline_repair as r
+
+
+def test_parse_lenient_passes_valid_json_through():
+    assert r.parse_lenient('{"a": [1, 2]}') == {"a": [1, 2]}
+
+
+def test_parse_lenient_strips_code_fence():
+    assert r.parse_lenient('```json\n{"a": [1, 2]}\n```') == {"a": [1, 2]}
+
+
+def test_parse_lenient_closes_truncated_document_at_last_complete_value():
+    text = '{"title": "T", "chapters": [{"num": 1, "title": "A"}, {"num": 2, "tit'
+    assert r.parse_lenient(text) == {"title": "T", "chapters": [{"num": 1, "title": "A"}]}
+
+
+def test_parse_lenient_closes_open_string_and_brackets():
+    assert r.parse_lenient('{"title": "Half a tit') == {"title": "Half a tit"}
+
+
+def test_parse_lenient_raises_when_nothing_can_be_closed():
+    with pytest.raises(json.JSONDecodeError):
+        r.parse_lenient("not json at all")
+
+
+def test_repair_coerces_types_and_rebuilds_beats():
+    outline = {"title": "", "chapters": [
+        {"num": "1", "title": "", "summary": "One thing. Then another. Finally home.",
+         "target_words": "2,500 words", "beats": "x"},
+    ]}
+    ch = r.repair(outline, 10000)["chapters"][0]
+    assert outline["title"] == "Untitled"
+    assert ch["num"] == 1 and ch["title"] == "Chapter 1" and ch["target_words"] == 2500
+    assert ch["beats"] == ["One thing", "Then another", "Finally home"]
+
+
+def test_repair_renumbers_duplicates_and_accepts_chapter_dict():
+    outline = {"title": "T", "chapters": {"a": {"num": 2, "title": "A"}, "b": {"num": 2, "title": "B"}}}
+    chapters = r.repair(outline, 2000)["chapters"]
+    assert [c["num"] for c in chapters] == [1, 2]
+    assert all(c["target_words"] == 1000 for c in chapters)
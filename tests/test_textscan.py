@@ -0,0 +1,37 @@
+from core import textscan as ts
+
+
+def test_automaton_reports_overlapping_patterns():
+    found = ts.Automaton(["he", "she", "hers"]).search("ushers")
+    assert found == {"he": [(2, 4)], "she": [(1, 4)], "hers": [(2, 6)]}
+
+
+def test_scan_counts_like_str_count_per_pattern():
+    out = ts.scan("aaaa", ["aa", "a"])
+    assert out["aa"]["count"] == 2 and out["aa"]["offsets"] == [[0, 2], [2, 4]]
+    assert out["a"]["count"] == 4
+
+
+def test_scan_is_case_and_punctuation_insensitive():
+    text = "The Sea, the sea! SEA-change"
+    out = ts.scan(text, ["the sea", "sea change", "HOPE"])
+    assert out["the sea"]["count"] == 2
+    assert [text[a:b] for a, b in out["the sea"]["offsets"]] == ["The Sea", "the sea"]
+    assert [text[a:b] for a, b in out["sea change"]["offsets"]] == ["SEA-change"]
+    assert out["HOPE"]["count"] == 0
+
+
+def test_scan_ignores_patterns_without_word_characters():
+    assert ts.scan("!!! ...", ["!!"])["!!"]["count"] == 0
+
+
+def test_scan_results_do_not_depend_on_cache():
+    text = "Hope, hope and more HOPE."
+    first = ts.scan(text, ["hope"])
+    again = ts.scan(text, ["hope", "more"])
+    assert again["hope"] == first["hope"] and again["more"]["count"] == 1
+
+
+def test_fuzzy_match_catches_paraphrase():
+    score, span = ts.fuzzy_match("The captain finally opens the sealed letter.", "captain opens letter")
+    assert score == 1.0 and span is not None
@@ -0,0 +1,299 @@
+# v2025‑07‑09‑AI-generated
+"""
+tools/mock_openai.py
+Local stand‑in for the OpenAI endpoints Novelist uses, for offline runs.
+
+    python -m tools.mock_openai --port 8089 [--latency 0.2] [--tps 200] [--rate-429 0.1]
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=x celery -A ... worker
+
+Serves
+    POST /v1/chat/completions   plain, streamed (SSE) and json responses
+    POST /v1/files              batch input upload (multipart)
+    GET  /v1/files/{id}/content
+    POST /v1/batches            runs every line; "completed" on the next poll
+    GET  /v1/batches/{id}
+    GET  /_stats                request counters (for bench/)
+
+Replies are shaped by the prompt: outline requests get a schema‑valid
+outline, outline repair requests get just the listed chapters, chapter
+drafts get roughly "Target words" of filler that
+quotes every beat, packed summary requests get one summary per
+"=== CHAPTER n ===" section. Usage is counted at ~4 chars per token.
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+FILLER = (
+    "The lamp flickered while the rain kept time against the glass and "
+    "somewhere below a door closed softly as if the house were listening."
+).split()
+
+
+class Config:
+    latency = 0.05     # seconds before the first byte
+    tps = 0.0          # streamed tokens per second (0 = as fast as possible)
+    rate_429 = 0.0     # share of chat requests refused with 429
+    retry_after = 1.0  # Retry‑After sent with a 429
+
+
+_ids = itertools.count(1)
+_lock = threading.Lock()
+_files: dict[str, bytes] = {}
+_batches: dict[str, dict[str, Any]] = {}
+stats = {"requests": 0, "throttled": 0, "completion_tokens": 0, "prompt_tokens": 0}
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _count(**deltas: int) -> None:
+    with _lock:
+        for k, v in deltas.items():
+            stats[k] += v
+
+# ---------------------------------------------------------------- replies
+
+def _outline(prompt: str) -> str:
+    words = int(re.search(r"Target novel words: (\d+)", prompt).group(1))
+    themes = re.search(r"Themes: (.*)", prompt).group(1)
+    themes = [] if themes == "None" else [t.strip() for t in themes.split(",")]
+    n = max(3, min(40, words // 2500))
+    return json.dumps({
+        "title": "Mock Novel",
+        "novel_target_words": max(10000, words),
+        "themes": themes or ["Hope"],
+        "chapters": [
+            {
+                "num": i,
+                "title": f"Chapter {i}",
+                "summary": f"Things happen in chapter {i}.",
+                "target_words": max(500, words // n),
+                "beats": [f"beat {i}.{b}" for b in range(1, 4)],
+            }
+            for i in range(1, n + 1)
+        ],
+    })
+
+
+def _outline_fix(prompt: str) -> str:
+    nums = [int(n) for n in re.search(r"Regenerate chapters: (.*)", prompt).group(1).split(",")]
+    return json.dumps({"chapters": [
+        {"num": i, "title": f"Chapter {i}", "summary": f"Things happen in chapter {i}.",
+         "target_words": 2500, "beats": [f"beat {i}.{b}" for b in range(1, 4)]}
+        for i in nums
+    ]})
+
+
+def _chapter(prompt: str, max_tokens: int | None) -> str:
+    m = re.search(r"Target words: (\d+)", prompt)
+    words = int(m.group(1)) if m else 300
+    if max_tokens:
+        words = min(words, int(max_tokens * 0.75))
+    beats = re.findall(r"^- (.+)$", prompt.split("Beats:")[-1], re.M) if "Beats:" in prompt else []
+    body = [FILLER[i % len(FILLER)] for i in range(max(0, words - 4 * len(beats)))]
+    step = max(1, len(body) // (len(beats) + 1))
+    for k, beat in enumerate(beats, 1):
+        body.insert(min(len(body), k * step), f"{beat}.")
+    return " ".join(body)
+
+
+def _summaries(prompt: str) -> str:
+    parts = re.split(r"=== CHAPTER (\d+) ===\n", prompt)[1:]
+    return json.dumps({"summaries": [
+        {"num": int(num), "summary": re.sub(r"\s+", " ", text).strip()[:150]}
+        for num, text in zip(parts[::2], parts[1::2])
+    ]})
+
+
+def _reply(body: dict[str, Any]) -> str:
+    msgs = body.get("messages", [])
+    system = next((m["content"] for m in msgs if m["role"] == "system"), "")
+    user = "\n".join(m["content"] for m in msgs if m["role"] == "user")
+    fmt = body.get("response_format") or {}
+    if fmt.get("type") == "json_schema" and fmt["json_schema"]["name"] == "chapter_summaries":
+        return _summaries(user)
+    if fmt.get("type") == "json_object" and "Regenerate chapters:" in user:
+        return _outline_fix(user)
+    if fmt.get("type") == "json_object" and "Target novel words" in user:
+        return _outline(user)
+    if "Summarise" in system:
+        return re.sub(r"\s+", " ", user).strip()[:150]
+    return _chapter(user, body.get("max_tokens") or body.get("max_completion_tokens"))
+
+
+def _completion(body: dict[str, Any], text: str) -> dict[str, Any]:
+    prompt = sum(_tokens(m["content"]) for m in body.get("messages", []))
+    completion = _tokens(text)
+    _count(prompt_tokens=prompt, completion_tokens=completion)
+    return {
+        "id": f"chatcmpl-{next(_ids)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body["model"],
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": text}}],
+        "usage": {"prompt_tokens": prompt, "completion_tokens": completion,
+                  "total_tokens": prompt + completion},
+    }
+
+# ---------------------------------------------------------------- batches
+
+def _run_batch(batch: dict[str, Any]) -> None:
+    out = []
+    for line in _files[batch["input_file_id"]].decode().splitlines():
+        req = json.loads(line)
+        resp = _completion(req["body"], _reply(req["body"]))
+        out.append(json.dumps({
+            "id": f"batch_req_{next(_ids)}",
+            "custom_id": req["custom_id"],
+            "response": {"status_code": 200, "request_id": resp["id"], "body": resp},
+            "error": None,
+        }))
+    fid = f"file-{next(_ids)}"
+    _files[fid] = "\n".join(out).encode()
+    batch.update(status="completed", output_file_id=fid, completed_at=int(time.time()))
+
+# ---------------------------------------------------------------- http
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, obj: Any, status: int = 200, headers: dict[str, str] | None = None) -> None:
+        data = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_GET(self):
+        if self.path == "/_stats":
+            return self._json(stats)
+        m = re.fullmatch(r"/v1/files/([\w-]+)/content", self.path)
+        if m and m.group(1) in _files:
+            data = _files[m.group(1)]
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            return self.wfile.write(data)
+        m = re.fullmatch(r"/v1/batches/([\w-]+)", self.path)
+        if m and m.group(1) in _batches:
+            batch = _batches[m.group(1)]
+            reply = dict(batch)  # report in_progress once so callers exercise polling
+            if batch["status"] == "in_progress":
+                _run_batch(batch)
+            return self._json(reply)
+        self._json({"error": {"message": "not found"}}, 404)
+
+    def do_POST(self):
+        if self.path == "/v1/chat/completions":
+            return self._chat(json.loads(self._body()))
+        if self.path == "/v1/files":
+            boundary = self.headers["Content-Type"].split("boundary=")[-1].encode()
+            for part in self._body().split(b"--" + boundary):
+                head, _, data = part.partition(b"\r\n\r\n")
+                if b'name="file"' in head:
+                    fid = f"file-{next(_ids)}"
+                    _files[fid] = data.rsplit(b"\r\n", 1)[0]
+                    return self._json({
+                        "id": fid, "object": "file", "bytes": len(_files[fid]),
+                        "created_at": int(time.time()), "filename": "batch.jsonl",
+                        "purpose": "batch", "status": "processed",
+                    })
+            return self._json({"error": {"message": "no file part"}}, 400)
+        if self.path == "/v1/batches":
+            body = json.loads(self._body())
+            bid = f"batch_{next(_ids)}"
+            _batches[bid] = {
+                "id": bid, "object": "batch", "endpoint": body["endpoint"],
+                "input_file_id": body["input_file_id"],
+                "completion_window": body["completion_window"],
+                "created_at": int(time.time()), "status": "in_progress",
+            }
+            return self._json(_batches[bid])
+        self._json({"error": {"message": "not found"}}, 404)
+
+    def _chat(self, body: dict[str, Any]) -> None:
+        _count(requests=1)
+        if random.random() < Config.rate_429:
+            _count(throttled=1)
+            return self._json(
+                {"error": {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}},
+                429, {"Retry-After": str(Config.retry_after)},
+            )
+        time.sleep(Config.latency)
+        text = _reply(body)
+        if not body.get("stream"):
+            return self._json(_completion(body, text))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(obj: Any) -> None:
+            data = f"data: {obj if isinstance(obj, str) else json.dumps(obj)}\n\n".encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        resp = _completion(body, text)
+        chunk = {"id": resp["id"], "object": "chat.completion.chunk",
+                 "created": resp["created"], "model": body["model"]}
+        words = text.split(" ")
+        for i, w in enumerate(words):
+            delta = w if i == len(words) - 1 else w + " "
+            send({**chunk, "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]})
+            if Config.tps:
+                time.sleep(1 / Config.tps)
+        send({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if (body.get("stream_options") or {}).get("include_usage"):
+            send({**chunk, "choices": [], "usage": resp["usage"]})
+        send("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def serve(port: int = 8089, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Start the mock in a daemon thread; returns the server (base URL …/v1)."""
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[2])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--latency", type=float, default=Config.latency)
+    ap.add_argument("--tps", type=float, default=Config.tps)
+    ap.add_argument("--rate-429", type=float, default=Config.rate_429)
+    ap.add_argument("--retry-after", type=float, default=Config.retry_after)
+    args = ap.parse_args()
+    Config.latency, Config.tps = args.latency, args.tps
+    Config.rate_429, Config.retry_after = args.rate_429, args.retry_after
+    print(f"mock OpenAI on http://{args.host}:{args.port}/v1")
+    ThreadingHTTPServer((args.host, args.port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# v2025‑07‑16‑AI-generated
+"""
+tools/startup_profile.py
+Where a cold worker / API process spends its import time.
+
+    python -m tools.startup_profile                  # worker and api, top 15
+    python -m tools.startup_profile worker --top 30
+    python -m tools.startup_profile api --json > startup.json
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter
+(worker → worker.tasks, api → api.main) and reports the total, the
+direct imports of the target by cumulative time, and the slowest
+modules by self time. Third‑party packages that show up under one of
+our modules are what to defer into the function that needs them
+(see worker.tasks / core.retry); bench.run --suite startup tracks the
+wall‑clock cost over time.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any
+
+TARGETS = {"worker": "worker.tasks", "api": "api.main"}
+_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def importtime(module: str) -> list[tuple[str, int, int, int]]:
+    """(module, self µs, cumulative µs, depth) per import, in completion order."""
+    root = Path(__file__).resolve().parent.parent
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=root, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            rows.append((m[4], int(m[1]), int(m[2]), len(m[3]) // 2))
+    return rows
+
+
+def profile(name: str, top: int = 15) -> dict[str, Any]:
+    module = TARGETS.get(name, name)
+    rows = importtime(module)
+    end = next(i for i, (mod, _, _, depth) in enumerate(rows) if mod == module and depth == 0)
+    start = max((i for i in range(end) if rows[i][3] == 0), default=-1) + 1
+    rows = rows[start:end + 1]  # drop site / sitecustomize imported before the target
+    total = rows[-1][2]
+    # children are listed before their parent, one level deeper
+    direct = [(mod, cum) for mod, _, cum, depth in rows if depth == 1]
+    return {
+        "module": module,
+        "total_ms": round(total / 1000, 1),
+        "modules": len(rows),
+        "direct": [{"module": m, "cum_ms": round(c / 1000, 1)} for m, c in sorted(direct, key=lambda r: -r[1])[:top]],
+        "self": [
+            {"module": m, "self_ms": round(s / 1000, 1)}
+            for m, s, _, _ in sorted(rows, key=lambda r: -r[1])[:top]
+        ],
+        "heavy": sorted({m.split(".")[0] for m, *_ in rows} & {"openai", "jsonschema", "tiktoken", "prometheus_client"}),
+    }
+
+
+def _print(rep: dict[str, Any]) -> None:
+    print(f"{rep['module']}: {rep['total_ms']} ms, {rep['modules']} modules")
+    if rep["heavy"]:
+        print(f"  heavy packages loaded: {', '.join(rep['heavy'])}")
+    print("  direct imports (cumulative)")
+    for r in rep["direct"]:
+        print(f"    {r['cum_ms']:8.1f} ms  {r['module']}")
+    print("  slowest modules (self)")
+    for r in rep["self"]:
+        print(f"    {r['self_ms']:8.1f} ms  {r['module']}")
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Import‑time profile of the worker / API start‑up")
+    ap.add_argument("targets", nargs="*", default=list(TARGETS), help="worker | api | any module name")
+    ap.add_argument("--top", type=int, default=15, help="rows per table")
+    ap.add_argument("--json", action="store_true", help="print JSON instead of tables")
+    args = ap.parse_args(argv)
+
+    reports = [profile(t, args.top) for t in args.targets]
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        for rep in reports:
+            _print(rep)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,46 @@
 # v2025‑07‑02‑AI-generated
 """
 worker/tasks.py – Celery tasks with retry wrapper.
+
+Chapter work is a chain: generate_chapter_task drafts and commits the
+prose, then summarize_chapter_task (queue POST_QUEUE) and
+check_chapter_task (queue CHECKS_QUEUE) finish the chapter.
+
+Bulk drafts are split into bulk_chapter_task runs handed out by
+core.scheduler (round‑robin across projects, per‑project caps); the
+bulk_draft_task id stays the job's id for progress and the final
+result, and names its core.jobs checkpoint: redelivery or
+resume_draft_task only drafts chapters the record has not finished.
+BULK_SCHEDULER=single drafts the whole run inside one task.
+
+With SPECULATIVE_CHAPTERS (or "speculate" in wizard.json) the outline
+task queues the first chapters as a speculative job as soon as the
+outline validates; the job stops before SPECULATIVE_MAX_USD (see
+core.jobs.claim), and an outline edit or a user's bulk draft cancels it
+– the bulk draft leaves out the chapters it is still drafting.
+
+Pipeline modules (and with them openai / jsonschema) are imported
+inside the tasks, so a worker registers and starts consuming without
+loading them; prewarm() loads them on a background thread once the
+worker is up (WORKER_PREWARM=0 to skip).
+
+Environment variables:
+    WORKER_PREWARM        default 1      import pipeline modules after start‑up
+    BULK_SCHEDULER        default fair   fair | single
+    SPECULATIVE_CHAPTERS  default 0      chapters drafted right after the outline
+    SPECULATIVE_MAX_USD   default 0.25   spend cap of that speculative job
 """
+import json
+import os
+import uuid
+from functools import partial
+from celery import chain
 from core.celery_app import celery_app
 from core.retry import retry
+from core import events as ev
+from core import jobs
+from core import projects as pj
+from core import scheduler as sc
 import time
 
 # ---------------------------------------------------------------- demo
@@ -15,28 +52,245 @@ def demo_long_task(self, steps: int) -> str:
     return f"Completed {steps} steps"
 
 # ---------------------------------------------------------------- outline
-from core import outline as ol  # noqa: E402
-
 @celery_app.task(bind=True, acks_late=True)
 @retry()
 def generate_outline_task(self, pid: str, premise: str, genre: str | None, words: int):
+    from core import outline as ol
     self.update_state(state="PROGRESS", meta={"phase": "calling_openai"})
     ol.generate_outline(pid, premise, genre, words)
+    job = _speculate(pid)
+    if job is not None:
+        self.update_state(state="PROGRESS", meta={"phase": "speculative", "job": job})
     return "outline.json"
 
 # ---------------------------------------------------------------- chapter
-from core import draft as dr  # noqa: E402
+
+def _postprocess(pid: str, chapter_num: int) -> None:
+    chain(
+        summarize_chapter_task.si(pid, chapter_num),
+        check_chapter_task.si(pid, chapter_num),
+    ).apply_async()
 
 @celery_app.task(bind=True, acks_late=True)
 @retry()
-def generate_chapter_task(self, pid: str, chapter_num: int):
+def generate_chapter_task(self, pid: str, chapter_num: int, force: bool = False):
+    from core import draft as dr
     self.update_state(state="PROGRESS", meta={"phase": "drafting", "chapter": chapter_num})
-    return dr.generate_chapter(pid, chapter_num)
+    path = dr.generate_chapter(
+        pid, chapter_num, task_id=self.request.id, force=force, postprocess=False
+    )
+    _postprocess(pid, chapter_num)
+    return path
+
+@celery_app.task(bind=True, acks_late=True)
+@retry()
+def summarize_chapter_task(self, pid: str, chapter_num: int):
+    from core import draft as dr
+    return dr.summarize_chapter(pid, chapter_num)
+
+@celery_app.task(bind=True, acks_late=True)
+@retry()
+def summarize_chapters_task(self, pid: str, chapters: list[int] | None = None):
+    """Re‑summarise drafted chapters (all if None) – batched in SUMMARY_MODE=batch."""
+    from core import draft as dr
+    if chapters is None:
+        chapters = sorted(int(p.stem[2:]) for p in (pj.NOVELIST_ROOT / pid / "chapters").glob("ch*.md"))
+    self.update_state(state="PROGRESS", meta={"phase": "summary", "total": len(chapters)})
+    return {str(n): s for n, s in dr.summarize_chapters(pid, chapters).items()}
+
+@celery_app.task(bind=True, acks_late=True)
+def check_chapter_task(self, pid: str, chapter_num: int):
+    from core import draft as dr
+    return dr.check_chapter(pid, chapter_num)
 
 # ---------------------------------------------------------------- bulk
-from core import bulk_draft as bd  # noqa: E402
+from celery.exceptions import Ignore  # noqa: E402
+
+BULK_SCHEDULER = os.getenv("BULK_SCHEDULER", "fair")
+SPECULATIVE_CHAPTERS = int(os.getenv("SPECULATIVE_CHAPTERS", "0"))
+SPECULATIVE_MAX_USD = float(os.getenv("SPECULATIVE_MAX_USD", "0.25"))
+
+def _fair(pid: str) -> bool:
+    # continuity passes and batch summaries need the whole run in one place
+    from core import bulk_draft as bd, summarizer as sz
+    return BULK_SCHEDULER == "fair" and not bd.CONTINUITY_PASS and sz.MODE != "batch"
+
+def _pump() -> None:
+    """Send chapter tasks until every project is capped or idle."""
+    while (item := sc.next_item()) is not None:
+        try:
+            bulk_chapter_task.apply_async((item["pid"], item["num"], item["job"], item["retake"]))
+        except Exception:
+            sc.requeue(item)  # already popped: put it back, or the chapter never runs
+            raise
+
+@celery_app.task(acks_late=True)
+def pump_task():
+    """Periodic (Celery beat): re‑queue chapters whose lease expired and send what fits."""
+    _pump()
+
+def _single(task, pid: str, chapters: list[int] | None, job: str) -> dict:
+    """Whole run inside *task*; progress goes to the job's channel."""
+    from core import bulk_draft as bd
+    # request context is thread‑local; bind the id for run_bulk's pool threads
+    update_state = partial(task.update_state, task_id=job)
+    bd.run_bulk(pid, chapters, update_state, task_id=job, postprocess=lambda n: _postprocess(pid, n), job=job)
+    return jobs.load(pid, job)
 
 @celery_app.task(bind=True, acks_late=True)
 def bulk_draft_task(self, pid: str, chapters: list[int] | None = None):
-    bd.run_bulk(pid, chapters, self.update_state)
-    return "bulk‑draft completed"
+    from core import bulk_draft as bd
+    job = self.request.id  # a redelivered task resumes its own job record
+    # before _supersede: chapters the speculative job is drafting stay out
+    chapters = bd.wanted(pid, chapters)
+    _supersede(pid)
+    if not _fair(pid):
+        return _outcome(_single(self, pid, chapters, job))
+    rec = jobs.create(pid, job, chapters)
+    nums = jobs.todo(rec)
+    if not nums:
+        return "bulk‑draft completed"
+    if rec["status"] == "running":
+        sc.submit(pid, job, nums)
+    self.update_state(state="PROGRESS", meta={"current": 0, "total": len(nums), "phase": "queued"})
+    _pump()
+    raise Ignore()  # the last chapter stores the job's result
+
+@celery_app.task(bind=True, acks_late=True)
+def bulk_chapter_task(self, pid: str, chapter_num: int, job: str, retake: bool = False):
+    """
+    One chapter of a scheduled bulk draft; skipped if done, paused or
+    cancelled. *retake*: the scheduler re‑queued it after its lease expired.
+    """
+    from core import bulk_draft as bd
+    retake = retake or bool((self.request.delivery_info or {}).get("redelivered"))
+    try:
+        claimed = jobs.claim(pid, job, chapter_num, retake)
+    except jobs.Stopped:  # budget reached: this call cancelled the job
+        _finish_job(pid, job, jobs.load(pid, job))
+        claimed = False
+    if not claimed:
+        sc.release(pid, job, chapter_num)
+        _pump()
+        return "skipped"
+    error = None
+    try:
+        bd.draft_one(pid, chapter_num, jobs.unfinished(jobs.load(pid, job)), task_id=job, postprocess=False)
+        _postprocess(pid, chapter_num)
+    except Exception as e:
+        error = repr(e)
+        raise
+    finally:
+        sc.release(pid, job, chapter_num)
+        rec, finished = jobs.mark(pid, job, chapter_num, "failed" if error else "done", error)
+        self.update_state(task_id=job, state="PROGRESS", meta={
+            **jobs.progress(rec), "chapter": chapter_num, "phase": "draft",
+        })
+        if finished:
+            _finish_job(pid, job, rec)
+        _pump()
+
+@celery_app.task(bind=True, acks_late=True)
+def resume_draft_task(self, pid: str, job: str):
+    """Continue a paused (or interrupted) job from its record."""
+    rec = jobs.load(pid, job)
+    if rec is None or rec["status"] != "running":
+        return "not resumable"
+    if _fair(pid):
+        sc.submit(pid, job, jobs.todo(rec))
+        _pump()
+        return "resumed"
+    rec = _single(self, pid, None, job)
+    if rec["status"] in ("done", "failed"):
+        _finish_job(pid, job, rec)
+    return _outcome(rec)
+
+def _outcome(rec: dict) -> str:
+    return "bulk‑draft completed" if rec["status"] == "done" else f"bulk‑draft {rec['status']}"
+
+def _speculate(pid: str) -> str | None:
+    """Queue the first chapters right after the outline (opt‑in, cost‑capped)."""
+    from core import bulk_draft as bd
+    wizard = pj.NOVELIST_ROOT / pid / "wizard.json"
+    n = SPECULATIVE_CHAPTERS
+    if wizard.exists():
+        n = int(json.loads(wizard.read_text(encoding="utf-8")).get("speculate", n))
+    nums = bd.wanted(pid, None)[:n] if n > 0 else []
+    if not nums:
+        return None
+    job = str(uuid.uuid4())
+    jobs.create(
+        pid, job, nums, kind="speculative",
+        budget_usd=SPECULATIVE_MAX_USD, chapter_usd=bd.chapter_usd(pid, nums),
+    )
+    sc.submit(pid, job, nums)
+    _pump()
+    return job
+
+def _supersede(pid: str) -> None:
+    """A user's bulk draft takes over: the speculative job stops starting chapters."""
+    spec = jobs.speculative(pid)
+    if spec is not None:
+        rec = jobs.set_status(pid, spec["id"], "cancelled", "superseded")
+        sc.drop(pid, spec["id"])
+        _finish_job(pid, spec["id"], rec)
+
+def _finish_job(pid: str, job: str, rec: dict) -> None:
+    if rec["status"] == "cancelled":
+        celery_app.backend.store_result(job, None, "REVOKED")
+        ev.publish(job, {"type": "state", "state": "REVOKED", "result": rec.get("reason"), "final": True})
+        return
+    if rec["status"] == "failed":
+        failed = [n for n, s in rec["chapters"].items() if s == "failed"]
+        result = RuntimeError(f"Chapters failed to draft: {failed}")
+        celery_app.backend.store_result(job, result, "FAILURE")
+        ev.publish(job, {"type": "state", "state": "FAILURE", "result": repr(result), "final": True})
+        return
+    from core import draft as dr
+    dr.mark_drafted(pid)  # "ready" once the last summary / check lands
+    celery_app.backend.store_result(job, "bulk‑draft completed", "SUCCESS")
+    ev.publish(job, {"type": "state", "state": "SUCCESS", "result": "bulk‑draft completed", "final": True})
+
+# ---------------------------------------------------------------- revise
+@celery_app.task(bind=True, acks_late=True)
+def revise_outline_task(self, pid: str, changed: list[int] | None = None):
+    """Redraft what an outline edit touched, in waves (see core.revise)."""
+    from core import bulk_draft as bd, revise as rv
+    update_state = partial(self.update_state, task_id=self.request.id)
+    return rv.run_revision(
+        pid, changed or [],
+        lambda nums: bd.run_bulk(pid, nums, update_state, task_id=self.request.id),
+        update_state,
+    )
+
+# ---------------------------------------------------------------- themes
+@celery_app.task(bind=True, acks_late=True)
+def recompute_themes_task(self, pid: str):
+    from plugins import theme as th
+    return th.recompute_totals(pid)
+
+# ---------------------------------------------------------------- export
+@celery_app.task(bind=True, acks_late=True)
+def export_book_task(self, pid: str, fmt: str = "md"):
+    from core import export as ex
+    return str(ex.write(pid, fmt))
+
+# ---------------------------------------------------------------- startup
+import importlib  # noqa: E402
+import threading  # noqa: E402
+from celery.signals import worker_process_init, worker_ready  # noqa: E402
+
+PREWARM = os.getenv("WORKER_PREWARM", "1") == "1"
+HEAVY = ("core.outline", "core.draft", "core.bulk_draft", "core.revise", "core.export", "plugins.theme")
+
+def prewarm() -> None:
+    """Import the pipeline modules so the first task does not pay for them."""
+    for name in HEAVY:
+        importlib.import_module(name)
+
+@worker_ready.connect
+@worker_process_init.connect
+def _on_worker_start(**_):
+    # ready: solo / threads pools (main process); process_init: prefork children
+    if PREWARM:
+        threading.Thread(target=prewarm, name="prewarm", daemon=True).start()